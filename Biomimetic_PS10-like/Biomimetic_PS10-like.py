@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
+import os
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.spatial import ConvexHull
-from shapely.geometry import Polygon, Point
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools import write_layout, NULL_INSTRUMENT
+from LayoutTools.Biomimetic import HeliostatGrid, heliostatCollisionConstrain, spiralCandidates
 
 
 def getConvexHull(points):
@@ -12,6 +14,8 @@ def getConvexHull(points):
     points: point set
 
     '''
+    from scipy.spatial import ConvexHull
+    from shapely.geometry import Polygon
     # Calculate the convex hull
     hull = ConvexHull(points)
     hull_points = points[hull.vertices]
@@ -24,37 +28,104 @@ def isPointInPolygon(point, polygon):
     '''
     Determine whether the point is within the legal heliostat field range.
     
-    point: test heliostat position point
+    point: test heliostat position point, or a block of points (x array, y array)
     polygon: the legal limits of the target heliostat field (the convex hull of base field)
     '''
-    return polygon.contains(point)
+    from shapely.geometry import Point
+    from shapely import contains_xy
+    if isinstance(point, Point):
+        return polygon.contains(point)
+    return contains_xy(polygon, point[0], point[1])
 
 
-def heliostatCollisionConstrain(test_helio, exist_helio_x, exist_helio_y, min_dis):
+def read_base(filename):
     '''
-    Collision constrain of adjacent heliostats.
-    Check whether the distance between the newly added heliostat (test_helio) and the existing heliostats ([exist_helio_x,exist_helio_y]) is too small.
+    Read the base field (e.g. the PS-10 layout) whose convex hull is the legal range of the biomimetic heliostats.
 
-    test_helio: coordinate of tested heliostat, (x,y)
-    exist_helio_x, exist_helio_y: coordinate of existed heliostats, [(x,y), (x,y)..]
-    min_dis: minimum safe distance of two adjacent heliostats' centre
+    filename: layout file of the base field, 'id,x,y..'
+
+    return: n x 2 array of the base heliostat positions x, y, m
     '''
+    x_base = []
+    y_base = []
+    with open(filename, "r") as input_file:
+        is_head = True
+        for _ in input_file.readlines():
+            if (is_head):
+                is_head = False
+                continue
+            t = _.strip()
+            t = t.split(',')
+
+            x_base.append(float(t[1]))
+            y_base.append(float(t[2]))
+    return np.array([x_base, y_base]).T.reshape(-1, 2)
 
-    test_helio_x = test_helio[0]
-    test_helio_y = test_helio[1]
 
-    for i in range(len(exist_helio_x)-1, -1, -1):
-        temp_helio_x = exist_helio_x[i]
-        temp_helio_y = exist_helio_y[i]
+def biomimetic_field(base, min_dis, phi, a, b, block_size=1, instrument=None):
+    '''
+    Place the heliostats of a biomimetic-PS-like field along the phyllotaxis spiral inside the convex hull of a base field,
+    without any file or plot.
 
-        delta_x = test_helio_x - temp_helio_x
-        delta_y = test_helio_y - temp_helio_y
-        delta_dis_2 = delta_x * delta_x + delta_y*delta_y
-        if (np.abs(delta_dis_2) <= min_dis * min_dis):
-            return True
-    return False
+    base: n x 2 (or n x 3) array of the base heliostat positions, m, e.g. read_base('layout_PS10_base.csv')
+    min_dis: minimum safe distance of two adjacent heliostats' centre
+    phi, a, b: coefficients of eq.(14) and eq.(15) in the first reference paper, see spiralCandidates
+    block_size: number of spiral candidates generated together as numpy arrays, see biomimetic_fun
+    instrument: Instrument recording the stages biomimetic.base and biomimetic.place and the counters biomimetic.blocks,
+                biomimetic.candidates (generated), biomimetic.inside (inside the base field), biomimetic.collision_checks
+                (candidates tried) and biomimetic.accepted, None for no instrumentation
 
-def biomimetic_fun(lm, wm, min_dis, phi, a, b):
+    return: x, y, lists of the heliostat positions, and the convex hull of the base field (shapely Polygon)
+    '''
+    instrument = NULL_INSTRUMENT if instrument is None else instrument
+    # 1. The convex hull of the base field is the legal range of the heliostats.
+    with instrument.stage('biomimetic.base'):
+        points = np.asarray(base, dtype=float)[:, :2]
+        base_r = np.max(np.sqrt(points[:, 0]*points[:, 0]+points[:, 1]*points[:, 1]), initial=0.0)
+        base_heliostat_convex = getConvexHull(points)
+
+    # 2. Generate biomimetic heliostat layout in the base field range.
+    x = []
+    y = []
+    grid = HeliostatGrid(min_dis)  # spatial index of the accepted heliostats
+    cnt = 0
+    i = 0
+    temp_r = 0.0
+    generated = 0  # candidates generated before the base field radius, counted locally and reported once
+    inside_num = 0
+    checks = 0
+    with instrument.stage('biomimetic.place'):
+        while temp_r <= base_r:
+            # the boundary constrain is checked for the whole block at once,
+            # then the candidates inside the base field are tested for collision in order
+            r_block, x_block, y_block = spiralCandidates(i+1, block_size, phi, a, b)
+            i += block_size
+            # the generation stops after the first candidate outside the base field radius
+            n = np.searchsorted(r_block, base_r, side='right') + 1
+            r_block, x_block, y_block = r_block[:n], x_block[:n], y_block[:n]
+
+            inside = isPointInPolygon((x_block, y_block), base_heliostat_convex)
+            generated += len(r_block)
+            inside_num += int(np.count_nonzero(inside))
+            for xi, yi in zip(x_block[inside].tolist(), y_block[inside].tolist()):
+                checks += 1
+                if (heliostatCollisionConstrain([xi, yi], grid, min_dis) == False):
+                    x.append(xi)
+                    y.append(yi)
+                    grid.insert(xi, yi)
+                    cnt += 1
+            temp_r = np.max([temp_r, r_block[-1]])
+
+    instrument.count('biomimetic.blocks', i//block_size)
+    instrument.count('biomimetic.candidates', generated)
+    instrument.count('biomimetic.inside', inside_num)
+    instrument.count('biomimetic.collision_checks', checks)
+    instrument.count('biomimetic.accepted', cnt)
+
+    return x, y, base_heliostat_convex
+
+
+def biomimetic_fun(lm, wm, min_dis, phi, a, b, block_size=1, instrument=None, casefolder='.'):
     '''
     Generate a biomimetic-PS-like heliostat field, ref. <Noone, 2012, Heliostat Field Optimization: A New Computationally Efficient Model and Biomimetic Layout> and <Fernández, 2004, PS10: a 11.0-MWe Solar Tower Power Plant with Saturated Steam Receiver>
     lm: heliostat height, m
@@ -63,65 +134,23 @@ def biomimetic_fun(lm, wm, min_dis, phi, a, b):
     phi: golden ratio phi of eq.(14) in the first reference paper
     a: the coefficient a of eq.(15) in the first reference paper
     b: the coefficient b of eq.(15) in the first reference paper
+    block_size: number of spiral candidates generated together as numpy arrays, 1 to generate them one by one, a large block (e.g. 4096) is much faster for large fields
+    instrument: Instrument recording the stages and counters of the generation, see biomimetic_field
+    casefolder: folder of the base field layout_PS10_base.csv and of the layout.csv file
     '''
+    import matplotlib.pyplot as plt
     # 1. Load PS-10 layout as the base field range.
-    input_file = open("./layout_PS10_base.csv", "r")
-    is_head = True
-    x_base = []
-    y_base = []
-    for _ in input_file.readlines():
-        if (is_head):
-            is_head = False
-            continue
-        t = _.strip()
-        t = t.split(',')
-
-        x_base.append(float(t[1]))
-        y_base.append(float(t[2]))
-    input_file.close()
-
-    points = []
-    base_r = 0.0
-    for i in range(len(x_base)):
-        points.append((x_base[i], y_base[i]))
-        base_r = np.max([base_r, np.sqrt(x_base[i]*x_base[i]+y_base[i]*y_base[i])])
-
-    points = np.array(points)
-    base_heliostat_convex = getConvexHull(points)
+    base = read_base(os.path.join(casefolder, "layout_PS10_base.csv"))
 
     # 2. Generate biomimetic heliostat layout in the PS-10 base field range.
-    x = []
-    y = []
-    cnt = 0
-    i = 0
-    temp_r = 0.0
-    while temp_r <= base_r:
-
-        i += 1
-        theta = 2.0 * np.pi * np.power(phi, -2) * i
-        r = a * np.power(i, b)
-        xi = r * np.cos(theta)
-        yi = r * np.sin(theta)
+    x, y, base_heliostat_convex = biomimetic_field(base, min_dis, phi, a, b, block_size, instrument)
 
-        point = Point((xi, yi))
-
-        if (isPointInPolygon(point, base_heliostat_convex) and heliostatCollisionConstrain([xi, yi], x, y, min_dis) == False):
-            x.append(xi)
-            y.append(yi)
-            cnt += 1
-        temp_r = np.max([temp_r, r])
     x_polygon, y_polygon = base_heliostat_convex.exterior.xy
     plt.plot(x_polygon, y_polygon)
     plt.scatter(x, y, color='blue', marker='.', label='Heliostat')
     plt.show()
 
-    output_file = open("layout.csv", "w")
-    output_file.write("id,x,y,z\n")
-    for i in range(len(x)):
-        id = i + 1
-        output_file.write(str(id)+","+str(x[i])+","+str(y[i])+","+"0.0\n")
-
-    output_file.close()
+    write_layout(os.path.join(casefolder, "layout.csv"), x, y, 0.0)
 
 
 if __name__ == "__main__":
@@ -1,34 +1,54 @@
 #!/usr/bin/env python3
+import os
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools import write_layout, NULL_INSTRUMENT
+from LayoutTools.Biomimetic import HeliostatGrid, heliostatCollisionConstrain, spiralCandidates
 
 
-def heliostatCollisionConstrain(test_helio, exist_helio_x, exist_helio_y, min_dis):
+def biomimetic_field(target_num, min_dis, phi, a, b, block_size=1, instrument=None):
     '''
-    Collision constrain of adjacent heliostats.
-    Check whether the distance between the newly added heliostat (test_helio) and the existing heliostats ([exist_helio_x,exist_helio_y]) is too small.
+    Place the heliostats of a biomimetic-surround field along the phyllotaxis spiral, without any file or plot.
 
-    test_helio: coordinate of tested heliostat, (x,y)
-    exist_helio_x, exist_helio_y: coordinate of existed heliostats, [(x,y), (x,y)..]
+    target_num: target number of heliostats in the generated heliostat layout
     min_dis: minimum safe distance of two adjacent heliostats' centre
-    '''
-
-    test_helio_x = test_helio[0]
-    test_helio_y = test_helio[1]
-
-    for i in range(len(exist_helio_x)-1, -1, -1):
-        temp_helio_x = exist_helio_x[i]
-        temp_helio_y = exist_helio_y[i]
-
-        delta_x = test_helio_x - temp_helio_x
-        delta_y = test_helio_y - temp_helio_y
-        delta_dis_2 = delta_x * delta_x + delta_y*delta_y
-        if (np.abs(delta_dis_2) <= min_dis * min_dis):
-            return True
-    return False
+    phi, a, b: coefficients of eq.(14) and eq.(15) in reference paper, see spiralCandidates
+    block_size: number of spiral candidates generated together as numpy arrays, see biomimetic_fun
+    instrument: Instrument recording the stage biomimetic.place and the counters biomimetic.blocks, biomimetic.candidates
+                (generated), biomimetic.collision_checks (candidates tried) and biomimetic.accepted, None for no instrumentation
 
-
-def biomimetic_fun(target_num, lm, wm, min_dis, phi, a, b):
+    return: x, y, lists of the heliostat positions
+    '''
+    instrument = NULL_INSTRUMENT if instrument is None else instrument
+    x = []
+    y = []
+    grid = HeliostatGrid(min_dis)  # spatial index of the accepted heliostats
+    cnt = 0
+    i = 0
+    checks = 0  # collision checks, counted locally and reported once
+    with instrument.stage('biomimetic.place'):
+        while cnt < target_num:
+            # the candidates of a block are generated together, then tested in order
+            _, x_block, y_block = spiralCandidates(i+1, block_size, phi, a, b)
+            i += block_size
+            for xi, yi in zip(x_block.tolist(), y_block.tolist()):
+                if (cnt >= target_num):
+                    break
+                checks += 1
+                if (heliostatCollisionConstrain([xi, yi], grid, min_dis) == False):
+                    x.append(xi)
+                    y.append(yi)
+                    grid.insert(xi, yi)
+                    cnt += 1
+    instrument.count('biomimetic.blocks', i//block_size)
+    instrument.count('biomimetic.candidates', i)
+    instrument.count('biomimetic.collision_checks', checks)
+    instrument.count('biomimetic.accepted', cnt)
+    return x, y
+
+
+def biomimetic_fun(target_num, lm, wm, min_dis, phi, a, b, block_size=1, instrument=None, casefolder='.'):
     '''
     Generate a biomimetic-surround heliostat field, ref. <Noone2012, Heliostat Field Optimization: A New Computationally Efficient Model and Biomimetic Layout>
 
@@ -39,33 +59,17 @@ def biomimetic_fun(target_num, lm, wm, min_dis, phi, a, b):
     phi: golden ratio phi of eq.(14) in reference paper
     a: the coefficient a of eq.(15) in reference paper
     b: the coefficient b of eq.(15) in reference paper
+    block_size: number of spiral candidates generated together as numpy arrays, 1 to generate them one by one, a large block (e.g. 4096) is much faster for large fields
+    instrument: Instrument recording the stages and counters of the generation, see biomimetic_field
+    casefolder: folder of the layout.csv file
     '''
-    x = []
-    y = []
-    cnt = 0
-    i = 0
-    while cnt < target_num:
-        i += 1
-        theta = 2.0 * np.pi * np.power(phi, -2) * i
-        r = a * np.power(i, b)
-        xi = r * np.cos(theta)
-        yi = r * np.sin(theta)
-
-        if (heliostatCollisionConstrain([xi, yi], x, y, min_dis) == False):
-            x.append(xi)
-            y.append(yi)
-            cnt += 1
+    import matplotlib.pyplot as plt
+    x, y = biomimetic_field(target_num, min_dis, phi, a, b, block_size, instrument)
 
     plt.scatter(x, y, color='blue', marker='.', label='Data Points')
     plt.show()
 
-    output_file = open("layout.csv", "w")
-    output_file.write("id,x,y,z\n")
-    for i in range(len(x)):
-        id = i + 1
-        output_file.write(str(id)+","+str(x[i])+","+str(y[i])+","+"0.0\n")
-
-    output_file.close()
+    write_layout(os.path.join(casefolder, "layout.csv"), x, y, 0.0)
 
 
 if __name__ == "__main__":
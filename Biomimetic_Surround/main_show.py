@@ -1,22 +1,8 @@
 #!/usr/bin/env python3
-import matplotlib.pyplot as plt
-import numpy as np
-input_file = open("./layout.csv", "r")
-x = []
-y = []
-is_head = True
-for _ in input_file.readlines():
-    if (is_head):
-        is_head = False
-        continue
-    t = _.strip()
-    t = t.split(',')
-    x.append(float(t[1]))
-    y.append(float(t[2]))
-input_file.close()
+import os
+import sys
+sys.dont_write_bytecode = True
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools import show_layout
 
-plt.scatter(x, y, s=5.0)
-ax = plt.gca()
-ax.set_aspect(1)
-plt.savefig("layout.png")
-plt.show()
\ No newline at end of file
+show_layout("./layout.csv", savefig="layout.png")
@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
+import os
 import sys
 sys.dont_write_bytecode = True
-import matplotlib.pyplot as plt
-from SunPosition import *
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools import write_layout, NULL_INSTRUMENT
+from LayoutTools.SunPosition import *
 import numpy as np
 
 
-def radial_stagger_campo(latitude, num_hst, width, height, hst_z, towerheight, R1, fb, dsep):
+def campo_field(latitude, num_hst, width, height, hst_z, towerheight, R1, fb, dsep, sun_vec=None, weights=None, verbose=True,
+                instrument=None):
     """
-    Generate a radial-stagger heliostat field, ref. Collado and Guallar, 2012, Campo: Generation of regular heliostat field.
+    Calculate a radial-stagger heliostat field without writing any file, ref. Collado and Guallar, 2012, Campo: Generation of regular heliostat field.
     latitude: latitude of the field location, deg
     num_hst: number of heliostats
     width: heliostat width, m
@@ -18,6 +21,13 @@ def radial_stagger_campo(latitude, num_hst, width, height, hst_z, towerheight, R
     R1: distance from the first row to the bottom of the tower, m
     fb: the field layout growing factor, f_{b,ref} in reference paper, higer fb lower heliostat density, in [0, 1]
     dsep: separation distance, m
+    sun_vec: 3 x s unit sun vectors used to grow the field, None for the equinox day from 8:00 to 16:00
+    weights: s weights of the sun vectors, None for uniform weights
+    verbose: print the zones or not
+    instrument: Instrument recording the stages (campo.zones, campo.place, campo.cosine) and the counters (campo.zones,
+                campo.rows, campo.heliostats), None for no instrumentation
+
+    return: XX, YY (heliostat positions), ZONE (zone index), ROW (row index in the zone), TTROW (row index among the total rows), NHEL (heliostat index in the row), AZIMUTH (deg)
     """
 
     # heliostat diagonal distantce
@@ -32,46 +42,31 @@ def radial_stagger_campo(latitude, num_hst, width, height, hst_z, towerheight, R
     # number of heliostats in the first row
     Nhel1 = int(2.*np.pi*R1/DM)
 
-    # the total number of zones (estimated)
-    # Nzones=int(np.log(5.44*3*(num_hst/az_rim*np.pi)/Nhel1**2+1)/np.log(4))+1
+    num_hst = int(num_hst)
+    instrument = NULL_INSTRUMENT if instrument is None else instrument
 
-    X = {}
-    Y = {}
-    Nrows_zone = np.array([])
-    Nhel_zone = np.array([])
-    delta_az_zone = np.array([])
+    # the zones needed to place num_hst heliostats, the number of rows and heliostats per row of each zone
+    Nrows_zone = []
+    Nhel_zone = []
 
     num = 0
     i = 0
-    sys.stderr.write('DM '+repr(DM)+'\n')
-    sys.stderr.write('dRm '+repr(delta_Rmin)+'\n')
-
-    while num < num_hst*3:
-        Nrows = int((2.**(i))*Nhel1/5.44)
-        Nhel = (2**(i))*Nhel1
-        R = Nhel/2./np.pi*DM
-        delta_az = 2.*np.pi/Nhel
-
-        Nrows_zone = np.append(Nrows_zone, Nrows)
-        Nhel_zone = np.append(Nhel_zone, Nhel)
-        delta_az_zone = np.append(delta_az_zone, delta_az)
-
-        nh = np.arange(Nhel)
-        azimuth = np.zeros((int(Nrows), int(Nhel)))
-        azimuth[0::2, :] = delta_az/2.+nh*delta_az  # the odd rows
-        azimuth[1::2, :] = nh*delta_az
-
-        row = np.arange(Nrows)
-        r = R+row*delta_Rmin
-
-        xx = r[:, None]*np.sin(azimuth)
-        yy = r[:, None]*np.cos(azimuth)
-
-        X[i] = xx
-        Y[i] = yy
-        num += len(xx.flatten())
-        print('Zone', i, 'Nrow', Nrows, 'Nhel', Nhel)
-        i += 1
+    if verbose:
+        sys.stderr.write('DM '+repr(DM)+'\n')
+        sys.stderr.write('dRm '+repr(delta_Rmin)+'\n')
+
+    with instrument.stage('campo.zones'):
+        while num < num_hst:
+            Nrows = int((2.**(i))*Nhel1/5.44)
+            Nhel = (2**(i))*Nhel1
+
+            Nrows_zone.append(Nrows)
+            Nhel_zone.append(Nhel)
+
+            num += Nrows*Nhel
+            if verbose:
+                print('Zone', i, 'Nrow', Nrows, 'Nhel', Nhel)
+            i += 1
     Nzones = i
 
     # expanding the field
@@ -79,105 +74,175 @@ def radial_stagger_campo(latitude, num_hst, width, height, hst_z, towerheight, R
     # last part of eq.(2) Francisco J. Collado, Jesus Guallar, Campo: Generation of regular heliostat fields, 2012
     const = (1.-(1.-fb)*wr/(2.*wr-(np.sqrt(1.+wr**2)+dsep/height))) * height
 
-    XX = np.array([])  # heliostat position, x
-    YY = np.array([])  # heliostat position, y
-    ZONE = np.array([])  # zone index
-    ROW = np.array([])   # row index among the rows in a zone
-    TTROW = np.array([])  # row index among the total rows
-    NHEL = np.array([])  # No. index among the heliostats in a row
-    AZIMUTH = np.array([])
-
-    for i in range(Nzones):
-        Nrows = int(Nrows_zone[i])
-        Nhel = int(Nhel_zone[i])
-        delta_az = delta_az_zone[i]
-
-        R = np.zeros((Nrows, Nhel))
-
-        if i == 0:
-            # first zone
-            R[0] = R1  # first row
-        else:
-            # second zones
-            R[0, ::2] = Rn+1.5*DRn
-            R[0,  1::2] = Rn+1.5*DRn
-            # R[0,-1]=0.5*(R[0,0]+Rn[-1])
-
-        xx = X[i]
-        yy = Y[i]
-        zz = np.ones(np.shape(xx))*hst_z
-        cosw, coseT = cal_cosw_coset(latitude, towerheight, xx, yy, zz)
-        row = np.arange(Nrows)
-        cosw = cosw.reshape(Nrows, Nhel)
-        coseT = coseT.reshape(Nrows, Nhel)
-
-        Delta_R = cosw/coseT*const
-        Delta_R[Delta_R < delta_Rmin] = delta_Rmin
-
-        for j in range(1, Nrows):
-            R[j] = R[j-1]+Delta_R[j-1]
-
-        Rn = R[-1]
-        DRn = Delta_R[-1]
-
-        nh = np.arange(Nhel)
-        azimuth = np.zeros((Nrows, Nhel))
-        azimuth[0::2, :] = delta_az/2.+nh*delta_az  # the odd rows
-        azimuth[1::2, :] = nh*delta_az
-
-        azimuth = azimuth.flatten()
-        R = R.flatten()
-        nhels, rows = np.meshgrid(nh, row)
-        nhels = nhels.flatten()
-        rows = rows.flatten()
-
-        xx = R*np.sin(azimuth)
-        yy = R*np.cos(azimuth)
-        AZIMUTH = np.append(AZIMUTH, azimuth)
-        ROW = np.append(ROW, rows)
-        NHEL = np.append(NHEL, nhels)
-        zone = np.ones(np.shape(rows))*i
-
-        XX = np.append(XX, xx)
-        YY = np.append(YY, yy)
-        ZONE = np.append(ZONE, zone)
-
-        if len(TTROW) == 0:
-            TTROW = np.append(TTROW, rows)
-        else:
-            TTROW = np.append(TTROW, rows+np.max(TTROW)+1)
-
-    num_hst = int(num_hst)
-
-    XX = XX[:num_hst]
-    YY = YY[:num_hst]
-    ZONE = ZONE[:num_hst]
-    ROW = ROW[:num_hst]
-    NHEL = NHEL[:num_hst]
-    TTROW = TTROW[:num_hst]
-    AZIMUTH = AZIMUTH[:num_hst]*180./np.pi
+    XX = np.zeros(num_hst)  # heliostat position, x
+    YY = np.zeros(num_hst)  # heliostat position, y
+    ZONE = np.zeros(num_hst)  # zone index
+    ROW = np.zeros(num_hst)   # row index among the rows in a zone
+    TTROW = np.zeros(num_hst)  # row index among the total rows
+    NHEL = np.zeros(num_hst)  # No. index among the heliostats in a row
+    AZIMUTH = np.zeros(num_hst)
+
+    start = 0  # index of the first heliostat of the zone
+    ttrow = 0  # number of rows in the previous zones
+    with instrument.stage('campo.place'):
+        for i in range(Nzones):
+            Nhel = Nhel_zone[i]
+            delta_az = 2.*np.pi/Nhel
+
+            # only the first rows of the last zone are needed
+            n = min(Nrows_zone[i]*Nhel, num_hst-start)
+            Nrows = -(-n//Nhel)
+
+            nh = np.arange(Nhel)
+            azimuth = np.zeros((Nrows, Nhel))
+            azimuth[0::2, :] = delta_az/2.+nh*delta_az  # the odd rows
+            azimuth[1::2, :] = nh*delta_az
+
+            # the cosine factors are evaluated at the rows spaced by the minimum radial increment
+            row = np.arange(Nrows)
+            r = Nhel/2./np.pi*DM+row*delta_Rmin
+            xx = r[:, None]*np.sin(azimuth)
+            yy = r[:, None]*np.cos(azimuth)
+            zz = np.ones(np.shape(xx))*hst_z
+            with instrument.stage('campo.cosine'):
+                cosw, coseT = cal_cosw_coset(latitude, towerheight, xx, yy, zz, sun_vec, weights)
+            cosw = cosw.reshape(Nrows, Nhel)
+            coseT = coseT.reshape(Nrows, Nhel)
+
+            Delta_R = cosw/coseT*const
+            Delta_R[Delta_R < delta_Rmin] = delta_Rmin
+
+            R0 = np.zeros((1, Nhel))
+            if i == 0:
+                # first zone
+                R0[0] = R1  # first row
+            else:
+                # second zones
+                R0[0, ::2] = Rn+1.5*DRn
+                R0[0, 1::2] = Rn+1.5*DRn
+
+            # R[j] = R[j-1]+Delta_R[j-1]
+            R = np.cumsum(np.vstack((R0, Delta_R[:-1])), axis=0)
+
+            Rn = R[-1]
+            DRn = Delta_R[-1]
+
+            nhels, rows = np.meshgrid(nh, row)
+
+            end = start+n
+            XX[start:end] = (R*np.sin(azimuth)).flatten()[:n]
+            YY[start:end] = (R*np.cos(azimuth)).flatten()[:n]
+            ZONE[start:end] = i
+            ROW[start:end] = rows.flatten()[:n]
+            TTROW[start:end] = rows.flatten()[:n]+ttrow
+            NHEL[start:end] = nhels.flatten()[:n]
+            AZIMUTH[start:end] = azimuth.flatten()[:n]
+
+            start = end
+            ttrow += Nrows
+    instrument.count('campo.zones', Nzones)
+    instrument.count('campo.rows', ttrow)
+    instrument.count('campo.heliostats', num_hst)
+
+    AZIMUTH = AZIMUTH*180./np.pi
+
+    return XX, YY, ZONE, ROW, TTROW, NHEL, AZIMUTH
+
+
+def radial_stagger_campo(latitude, num_hst, width, height, hst_z, towerheight, R1, fb, dsep, sun_vec=None, weights=None,
+                         instrument=None, casefolder='.'):
+    """
+    Generate a radial-stagger heliostat field, ref. Collado and Guallar, 2012, Campo: Generation of regular heliostat field.
+    latitude: latitude of the field location, deg
+    num_hst: number of heliostats
+    width: heliostat width, m
+    height: heliostat height, m
+    hst_z: the vertical location of each heliostat, m
+    towerheight: tower height, m
+    R1: distance from the first row to the bottom of the tower, m
+    fb: the field layout growing factor, f_{b,ref} in reference paper, higer fb lower heliostat density, in [0, 1]
+    dsep: separation distance, m
+    sun_vec: 3 x s unit sun vectors used to grow the field, None for the equinox day from 8:00 to 16:00
+    weights: s weights of the sun vectors, None for uniform weights
+    instrument: Instrument recording the stages and counters of the generation, see campo_field
+    casefolder: folder of the layout.csv and layout.png files
+    """
+    import matplotlib.pyplot as plt
+    XX, YY, ZONE, ROW, TTROW, NHEL, AZIMUTH = campo_field(
+        latitude, num_hst, width, height, hst_z, towerheight, R1, fb, dsep, sun_vec, weights, instrument=instrument)
 
+    num_hst = len(XX)
     hstpos = np.zeros(num_hst*3).reshape(num_hst, 3)
     hstpos[:, 0] = XX
     hstpos[:, 1] = YY
     hstpos[:, 2] = hst_z
-    output_file = open("layout.csv", "w")
-    output_file.write("id,x,y,z\n")
-    for i in range(len(hstpos)):
-        output_file.write(
-            str(i)+","+str(hstpos[i][0])+","+str(hstpos[i][1])+","+str(hstpos[i][2])+"\n")
-    output_file.close()
+    write_layout(os.path.join(casefolder, "layout.csv"), hstpos[:, 0], hstpos[:, 1], hstpos[:, 2], start=0)
 
     plt.scatter(XX, YY, s=5.0)
     ax = plt.gca()
     ax.set_aspect(1)
-    plt.savefig("layout.png")
+    plt.savefig(os.path.join(casefolder, "layout.png"))
     plt.close()
 
     return hstpos
 
 
-def cal_cosw_coset(latitude, towerheight, xx, yy, zz):
+def equinox_sun_vec(latitude):
+    '''
+    Sun vectors of the equinox day from 8:00 to 16:00 (solar time), used by default to grow the heliostat field
+
+    ``Arguments``
+      * latitude (float): latitude of the field location (deg)
+
+    ``Returns``
+      * sun_vec (array): 3 x s unit sun vectors, x towards East, y towards North and z towards zenith
+    '''
+    sun = SunPosition()
+    dd = sun.days(21, 'Mar')  # Equinox Day
+    delta = sun.declination(dd)
+    h = np.arange(8, 17)  # hour
+
+    omega = -180.+15.*h
+    return sun.sun_vector(latitude, delta, omega).T  # 3xs
+
+
+def cal_cosw(tower_vec, sun_vec, weights=None, chunk=1 << 16):
+    '''
+    Time-averaged cosine factor cos(omega) of each heliostat over a set of sun vectors.
+    The heliostat normal is the normalized sum of the sun vector and the tower vector, cos(omega) is its dot product with
+    the sun vector. The heliostats are processed by chunks (the peak memory is bounded by 3 x chunk) and the sun vectors
+    are accumulated one by one, in the arithmetic order of the original loop, so the field is reproduced bit for bit.
+
+    ``Arguments``
+      * tower_vec (array): 3 x n unit vectors from the heliostats to the aim point
+      * sun_vec (array)  : 3 x s unit sun vectors
+      * weights (array)  : s weights of the sun vectors (e.g. DNI or time step), None for uniform weights
+      * chunk (int)      : number of heliostats processed together
+
+    ``Returns``
+      * cosw (array) : weighted average of cos(omega), n
+    '''
+    n = len(tower_vec[0])
+    s = len(sun_vec[0])
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+
+    cosw = np.zeros(n)
+    for start in range(0, n, chunk):
+        tx, ty, tz = tower_vec[:, start:start+chunk]
+        total = np.zeros(len(tx))
+        for i in range(s):
+            sx, sy, sz = sun_vec[:, i]
+            nx, ny, nz = sx+tx, sy+ty, sz+tz
+            norm = np.sqrt(nx*nx+ny*ny+nz*nz)
+            cos_i = sx*(nx/norm)+sy*(ny/norm)+sz*(nz/norm)
+            total += cos_i if weights is None else weights[i]*cos_i
+        cosw[start:start+chunk] = total
+    cosw /= float(s) if weights is None else np.sum(weights)
+    return cosw
+
+
+def cal_cosw_coset(latitude, towerheight, xx, yy, zz, sun_vec=None, weights=None):
     '''
     The factors to growing the heliostat field, see eq.(2) Francisco J. Collado, Jesus Guallar, Campo: Generation of regular heliostat fields, 2012
 
@@ -185,6 +250,8 @@ def cal_cosw_coset(latitude, towerheight, xx, yy, zz):
       * latitude (float)   : latitude of the field location (deg)
       *	towerheight (float): tower height (m)
   * xx, yy, zz (float) : coordinates of heliostats
+      * sun_vec (array)    : 3 x s unit sun vectors, None for the equinox day from 8:00 to 16:00
+      * weights (array)    : s weights of the sun vectors, None for uniform weights
 
     ``Returns``
       * cosw (array) : cos(omega)
@@ -197,40 +264,12 @@ def cal_cosw_coset(latitude, towerheight, xx, yy, zz):
     tower_vec = -hst_pos
     tower_vec[-1] += towerheight
     tower_vec /= np.sqrt(np.sum(tower_vec**2, axis=0))  # 3 x n
-    unit = np.array([[0.], [0.], [1.]])
-    unit = np.repeat(unit, len(tower_vec[0]), axis=1)
-    coseT = np.sum(tower_vec*unit, axis=0)
+    coseT = tower_vec[-1].copy()  # dot product with the unit vector (0, 0, 1)
 
-    sun = SunPosition()
-    dd = sun.days(21, 'Mar')  # Equinox Day
-    delta = sun.declination(dd)
-    h = np.arange(8, 17)  # hour
+    if sun_vec is None:
+        sun_vec = equinox_sun_vec(latitude)
 
-    omega = -180.+15.*h
-    theta = sun.zenith(latitude, delta, omega)  # solar zenith angle
-
-    phi = np.array([])  # solar azimuth angle
-    for i in range(len(h)):
-        p = sun.azimuth(latitude, theta[i], delta, omega[i])
-        phi = np.append(phi, p)
-
-    theta *= np.pi/180.
-    phi *= np.pi/180.
-
-    cosw = np.zeros(len(tower_vec[0]))
-    sun_z = np.cos(theta)
-    sun_y = -np.sin(theta)*np.cos(phi)
-    sun_x = -np.sin(theta)*np.sin(phi)
-    sun_vec = np.append(sun_x, (sun_y, sun_z))
-    sun_vec = sun_vec.reshape(3, len(sun_x))  # 3xs
-
-    for i in range(len(sun_vec[0])):
-        sv = np.repeat(sun_vec[:, i], len(tower_vec[0])
-                       ).reshape(3, len(tower_vec[0]))
-        hst_norms = sv+tower_vec
-        hst_norms /= np.linalg.norm(hst_norms, axis=0)
-        cosw += np.sum(sv*hst_norms, axis=0)
-    cosw /= float(len(sun_vec[0]))
+    cosw = cal_cosw(tower_vec, sun_vec, weights)
     return cosw, coseT
 
 
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import sys
+sys.dont_write_bytecode = True
+import argparse
+import itertools
+import time
+from multiprocessing import Pool
+from Campo import campo_field, equinox_sun_vec
+from LayoutTools import Instrument, export_record
+import numpy as np
+
+# parameters of radial_stagger_campo that can be swept
+SWEEP_PARAMETERS = ['fb', 'dsep', 'R1', 'towerheight']
+
+# the state shared by all the evaluations of a worker process, set once by init_worker
+_shared = {}
+
+
+def init_worker(base, sun_vec, weights, instrument=False):
+    '''
+    Initialize a worker process of the sweep, the fixed parameters and the precomputed sun vectors are sent once per worker.
+
+    base: the fixed parameters of campo_field, dict
+    sun_vec: 3 x s unit sun vectors
+    weights: s weights of the sun vectors, None for uniform weights
+    instrument: record the stages and counters of each evaluation or not
+    '''
+    _shared['base'] = base
+    _shared['sun_vec'] = sun_vec
+    _shared['weights'] = weights
+    _shared['instrument'] = instrument
+
+
+def evaluate(params):
+    '''
+    Generate one Campo layout of the sweep in memory.
+
+    params: the swept parameters of this evaluation, dict
+
+    return: heliostat count, field radius, number of zones, number of rows, heliostat positions (n x 2), zone index and row index among the total rows of each heliostat,
+            and the instrumentation record of the evaluation (None if the sweep is not instrumented)
+    '''
+    kwargs = dict(_shared['base'])
+    kwargs.update(params)
+    instrument = Instrument('campo_sweep') if _shared['instrument'] else None
+    XX, YY, ZONE, ROW, TTROW, NHEL, AZIMUTH = campo_field(
+        sun_vec=_shared['sun_vec'], weights=_shared['weights'], verbose=False, instrument=instrument, **kwargs)
+    record = instrument.record(params=params) if instrument is not None else None
+
+    num = len(XX)
+    radius = np.max(np.sqrt(XX*XX+YY*YY)) if num > 0 else 0.
+    nzones = int(ZONE[-1])+1 if num > 0 else 0
+    nrows = int(TTROW[-1])+1 if num > 0 else 0
+    return num, radius, nzones, nrows, np.stack((XX, YY), axis=-1), ZONE.astype(np.int32), TTROW.astype(np.int32), record
+
+
+def campo_sweep(grid, latitude, num_hst, width, height, hst_z=0., towerheight=250., R1=80., fb=1.0, dsep=0.,
+                sun_vec=None, weights=None, processes=None, instrument=None):
+    '''
+    Evaluate radial_stagger_campo over a grid of parameters with a process pool, no file or plot is produced.
+
+    grid: values of the swept parameters (fb, dsep, R1, towerheight), e.g. {'fb': [0.5, 1.0], 'dsep': [0., 1.]}, the cartesian product is evaluated
+    latitude, num_hst, width, height, hst_z, towerheight, R1, fb, dsep: parameters of radial_stagger_campo, the swept ones are overridden by grid
+    sun_vec: 3 x s unit sun vectors shared by all the evaluations, None for the equinox day from 8:00 to 16:00
+    weights: s weights of the sun vectors, None for uniform weights
+    processes: number of worker processes, None for the number of CPUs
+    instrument: sink of the instrumentation records of the evaluations (one record per evaluation with its parameters,
+                see Instrument.export), None for no instrumentation
+
+    return: the result store, dict of numpy arrays
+      * names (k): names of the swept parameters
+      * params (m x k): parameter values of each evaluation
+      * num, radius, nzones, nrows (m): heliostat count, field radius (m), number of zones and rows of each evaluation
+      * offset (m+1): the heliostats of evaluation i are pos[offset[i]:offset[i+1]]
+      * pos (total x 2), zone (total), ttrow (total): positions, zone index and row index among the total rows of the heliostats
+    '''
+    for name in grid:
+        if name not in SWEEP_PARAMETERS:
+            raise ValueError('unknown sweep parameter: '+name)
+    names = [name for name in SWEEP_PARAMETERS if name in grid]
+    combinations = list(itertools.product(*[grid[name] for name in names]))
+
+    base = dict(latitude=latitude, num_hst=num_hst, width=width, height=height, hst_z=hst_z,
+                towerheight=towerheight, R1=R1, fb=fb, dsep=dsep)
+    if sun_vec is None:
+        sun_vec = equinox_sun_vec(latitude)
+
+    tasks = [dict(zip(names, values)) for values in combinations]
+    with Pool(processes, initializer=init_worker, initargs=(base, sun_vec, weights, instrument is not None)) as pool:
+        results = pool.map(evaluate, tasks)
+    if instrument is not None:
+        for result in results:
+            export_record(result[7], instrument)
+
+    num = np.array([r[0] for r in results], dtype=np.int64)
+    offset = np.zeros(len(results)+1, dtype=np.int64)
+    offset[1:] = np.cumsum(num)
+    store = {
+        'names': np.array(names),
+        'params': np.array(combinations, dtype=float).reshape(len(combinations), len(names)),
+        'num': num,
+        'radius': np.array([r[1] for r in results]),
+        'nzones': np.array([r[2] for r in results], dtype=np.int32),
+        'nrows': np.array([r[3] for r in results], dtype=np.int32),
+        'offset': offset,
+        'pos': np.concatenate([r[4] for r in results]) if results else np.zeros((0, 2)),
+        'zone': np.concatenate([r[5] for r in results]) if results else np.zeros(0, dtype=np.int32),
+        'ttrow': np.concatenate([r[6] for r in results]) if results else np.zeros(0, dtype=np.int32),
+    }
+    return store
+
+
+if __name__ == '__main__':
+    """
+    Sweep the Campo parameters, e.g.
+        python CampoSweep.py --fb 0.5 0.75 1.0 --dsep 0 1 --R1 80 --towerheight 200 250 --output sweep.npz
+    the results are saved to one compressed .npz file, see campo_sweep.
+    """
+    parser = argparse.ArgumentParser(description='Parallel parameter sweep of the Campo layout.')
+    parser.add_argument('--latitude', type=float, default=34., help='latitude of the field location, deg')
+    parser.add_argument('--num_hst', type=int, default=6230, help='number of heliostats')
+    parser.add_argument('--width', type=float, default=10., help='heliostat width, m')
+    parser.add_argument('--height', type=float, default=10., help='heliostat height, m')
+    parser.add_argument('--hst_z', type=float, default=0., help='the vertical location of each heliostat, m')
+    parser.add_argument('--fb', type=float, nargs='+', default=[1.0], help='field layout growing factors')
+    parser.add_argument('--dsep', type=float, nargs='+', default=[0.], help='separation distances, m')
+    parser.add_argument('--R1', type=float, nargs='+', default=[80.], help='distances from the first row to the tower, m')
+    parser.add_argument('--towerheight', type=float, nargs='+', default=[250.], help='tower heights, m')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--output', default='campo_sweep.npz', help='result store, .npz')
+    parser.add_argument('--profile', default=None, help='append the stages and counters of each evaluation to this JSON lines file')
+    args = parser.parse_args()
+
+    grid = {name: getattr(args, name) for name in SWEEP_PARAMETERS}
+    t0 = time.time()
+    store = campo_sweep(grid, args.latitude, args.num_hst, args.width, args.height, args.hst_z, processes=args.processes,
+                        instrument=args.profile)
+    np.savez_compressed(args.output, **store)
+
+    print(' '.join(store['names']), 'num radius nzones nrows')
+    for i in range(len(store['num'])):
+        print(' '.join(['%g' % v for v in store['params'][i]]), store['num'][i], '%.3f' % store['radius'][i], store['nzones'][i], store['nrows'][i])
+    print('%d evaluations in %.2f s, saved to %s' % (len(store['num']), time.time()-t0, args.output))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Annual optical efficiency lookup table of a heliostat field, on the declination x solar hour grid of SunPosition.annual_grid.
+
+Only the cases of the grid are evaluated: the cells below the horizon are 0, and if the layout and the receiver are
+symmetric about the North-South axis, the afternoon cells reuse their symmetric morning cells. The tables are cached
+next to the layout file, keyed by the hash of the layout and of the parameters (latitude, nd, nh, model, plant).
+The annual energy is interpolated from the table.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+from scipy.spatial import cKDTree
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools.LayoutLoader import load_layout, layout_positions, save_cache
+from LayoutTools.SunPosition import SunPosition
+from LayoutTools.CosineEfficiency import cosine_factors
+from LayoutTools.HFLCAL import hflcal_factors, slant_range, attenuation as attenuation_efficiency
+
+# the field efficiency models of the lookup table
+MODELS = ('cosine', 'hflcal', 'optical', 'geometric')
+# the plant parameters needed by the efficiency models, besides the heliostat size and the aim point
+MODEL_PLANT_KEYS = {'hflcal': ('reflectivity', 'slope_error', 'receiver'), 'optical': ('reflectivity', 'slope_error', 'receiver')}
+
+
+def check_model(plant, model):
+    '''
+    Check that a plant has the parameters needed by an efficiency model, raise a ValueError otherwise.
+
+    plant: parameters of the plant, e.g. Plants.PLANTS['Gemasolar']
+    model: efficiency model, see field_efficiency
+    '''
+    if model not in MODELS:
+        raise ValueError('unknown efficiency model: '+str(model))
+    missing = [key for key in MODEL_PLANT_KEYS.get(model, ()) if plant.get(key) is None]
+    if len(missing) > 0:
+        raise ValueError("the efficiency model '%s' needs the %s of the plant, which are not given, use the model "
+                         "'geometric' or 'cosine', or another plant" % (model, ', '.join(missing)))
+
+
+def field_efficiency(position, sun_vecs, plant, model='optical'):
+    '''
+    Field efficiency (average over the heliostats) for each sun vector.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vecs: s x 3 unit sun vectors above the horizon
+    plant: parameters of the plant, e.g. Plants.PLANTS['Gemasolar']
+    model: 'cosine' cosine efficiency,
+           'hflcal' reflectivity x cosine x intercept x attenuation (see HFLCAL.py),
+           'optical' hflcal x (1-shading) x (1-blocking) (see ShadingBlocking.py),
+           'geometric' cosine x attenuation x (1-shading) x (1-blocking), without the receiver and the optical errors
+
+    return: s field efficiencies
+    '''
+    check_model(plant, model)
+    efficiency = cosine_factors(position, sun_vecs, plant['aim'])
+    if model == 'hflcal' or model == 'optical':
+        intercept, attenuation = hflcal_factors(position, sun_vecs, plant)
+        efficiency *= plant['reflectivity']*intercept*attenuation
+    if model == 'geometric':
+        efficiency *= attenuation_efficiency(slant_range(position, plant['aim']))
+    if model == 'optical' or model == 'geometric':
+        from LayoutTools.ShadingBlocking import annual_shading_blocking
+        shading, blocking = annual_shading_blocking(position, sun_vecs, plant['width'], plant['height'], plant['aim'])
+        efficiency *= (1.-shading)*(1.-blocking)
+    return np.mean(efficiency, axis=1)
+
+
+def is_symmetric(position, plant, tolerance=1e-3):
+    '''
+    Whether the layout and the receiver are symmetric about the North-South axis (x -> -x),
+    so the field efficiency is the same at the hour angles omega and -omega.
+
+    position: n x 3 heliostat positions, m
+    plant: parameters of the plant
+    tolerance: tolerance of the heliostat positions, m
+    '''
+    aim = np.asarray(plant['aim'], dtype=float)
+    if abs(aim[0]) > tolerance or abs(plant.get('receiver_facing', (0., 1., 0.))[0]) > 1e-12:
+        return False
+    mirror = position*np.array([-1., 1., 1.])
+    distance, index = cKDTree(position).query(mirror, distance_upper_bound=tolerance)
+    return bool(np.all(np.isfinite(distance)))
+
+
+def efficiency_table(position, latitude, plant, nd=5, nh=5, model='optical'):
+    '''
+    Annual field efficiency lookup table, the efficiency is evaluated only for the unique cases of the grid.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    latitude: latitude of the field location, deg
+    plant: parameters of the plant, e.g. Plants.PLANTS['Gemasolar']
+    nd, nh: number of declinations and solar hours of the grid, see SunPosition.annual_grid
+    model: efficiency model, see field_efficiency
+
+    return: DELTA (nd), solartime (nh), table (nd x nh field efficiencies, 0 below the horizon)
+    '''
+    sun = SunPosition()
+    DELTA, solartime, AZI, ZENITH, case = sun.annual_grid(latitude, nd, nh)
+    sun_vecs = sun.sun_vector(latitude, DELTA[:, None], solartime)
+
+    # the cells below the horizon are 0 whatever the case map of the grid says
+    above = sun_vecs[..., 2] > 0.
+    if is_symmetric(position, plant):
+        evaluated = (case > 0) & above
+    else:
+        evaluated = (case != 0) & above
+    table = np.zeros((nd, nh))
+    if np.any(evaluated):
+        table[evaluated] = field_efficiency(position, sun_vecs[evaluated], plant, model)
+
+    mirrored = (case < 0) & above & ~evaluated
+    if np.any(mirrored):
+        value = np.zeros(np.max(case)+1)
+        value[case[case > 0]] = table[case > 0]
+        table[mirrored] = value[-case[mirrored]]
+    return DELTA, solartime, table
+
+
+def lut_cache_file(filename, key):
+    '''
+    Path of the cached lookup table of a layout file, next to the layout file.
+    '''
+    folder, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(folder, '.'+name+'.lut-'+key+'.cache.npz')
+
+
+def annual_lut(filename, latitude, plant, nd=5, nh=5, model='optical', cache=True):
+    '''
+    Annual field efficiency lookup table of a layout file, the table is cached next to the layout file.
+    The cache is keyed by the hash of the layout and of latitude, nd, nh, model and the plant parameters,
+    so re-running an unchanged case only reads the cache.
+
+    filename: path of the layout file
+    latitude, plant, nd, nh, model: see efficiency_table
+    cache: use and update the cache or not
+
+    return: DELTA (nd), solartime (nh), table (nd x nh)
+    '''
+    layout = load_layout(filename, cache=cache)
+    position = layout_positions(layout)
+    sha1 = hashlib.sha1(np.ascontiguousarray(position).tobytes())
+    sha1.update(json.dumps([latitude, nd, nh, model, plant], sort_keys=True, default=str).encode('utf-8'))
+    cache_file = lut_cache_file(filename, sha1.hexdigest()[:16])
+
+    if cache:
+        try:
+            with np.load(cache_file) as data:
+                return data['DELTA'], data['solartime'], data['table']
+        except Exception:
+            # a missing, truncated or corrupted cache is a cache miss
+            pass
+
+    DELTA, solartime, table = efficiency_table(position, latitude, plant, nd, nh, model)
+    if cache:
+        save_cache(cache_file, DELTA=DELTA, solartime=solartime, table=table)
+    return DELTA, solartime, table
+
+
+def annual_energy(DELTA, solartime, table, latitude, dni, area, days=None, omega=None):
+    '''
+    Annual energy reflected onto the receiver, the field efficiency of each hour is interpolated from the lookup table.
+
+    DELTA, solartime, table: lookup table, see efficiency_table
+    latitude: latitude of the field location, deg
+    dni: direct normal irradiance, W/m2, scalar or days x hours array (e.g. hourly TMY data)
+    area: total reflective area of the field, m2
+    days: day numbers of the year (1-365), None for every day
+    omega: solar hour angles of each day, deg, None for every hour (one hour time step)
+
+    return: annual energy, kWh
+    '''
+    sun = SunPosition()
+    days = np.arange(1, 366) if days is None else np.asarray(days)
+    omega = np.linspace(-180., 165., 24) if omega is None else np.asarray(omega, dtype=float)
+    delta = np.broadcast_to(sun.declination(days)[:, None], (len(days), len(omega)))
+    hours = np.broadcast_to(omega, (len(days), len(omega)))
+
+    lut = RegularGridInterpolator((DELTA, solartime), table, bounds_error=False, fill_value=None)
+    efficiency = np.maximum(lut(np.stack((np.clip(delta, DELTA[0], DELTA[-1]), hours), axis=-1)), 0.)
+    above = sun.zenith(latitude, delta, hours) < 90.
+    step = 24./len(omega)  # h
+    return np.sum(np.where(above, efficiency*dni, 0.))*area*step/1000.
+
+
+if __name__ == "__main__":
+    """
+    Annual lookup table and annual energy of a layout of this repository, e.g.
+        python AnnualLUT.py Gemasolar 9 13 hflcal
+    a second run with the same parameters reads the cached table.
+    """
+    import time
+    from LayoutTools.Plants import PLANTS
+
+    name = sys.argv[1] if len(sys.argv) > 1 else 'Gemasolar'
+    nd = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    nh = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    model = sys.argv[4] if len(sys.argv) > 4 else 'hflcal'
+    plant = PLANTS[name]
+    latitude = plant['latitude'] if plant['latitude'] is not None else 34.
+    filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', plant['folder'], 'layout.csv')
+
+    t0 = time.time()
+    DELTA, solartime, table = annual_lut(filename, latitude, plant, nd, nh, model)
+    print("lookup table (%.2f s), rows: declination, columns: solar hour" % (time.time()-t0))
+    print("       "+" ".join(["%7.1f" % h for h in solartime]))
+    for d, row in zip(DELTA, table):
+        print("%7.2f" % d+" ".join(["%7.4f" % v for v in row]))
+    area = len(load_layout(filename))*plant['width']*plant['height']
+    print("annual energy with a DNI of 800 W/m2: %.4g MWh" % (annual_energy(DELTA, solartime, table, latitude, 800., area)/1000.))
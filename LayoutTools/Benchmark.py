@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark of the layout generators (Campo, MUEEN, Biomimetic_Surround, RadialStaggered) and of
+SunPosition.annual_angles, from 1k to 1M heliostats (or lookup table cells).
+
+Each case runs headless (the in-memory generators of Generators.py, no plot and no file) in a fresh process, so the wall
+time and the peak resident memory (RSS) of a case are not polluted by the other cases. The shipped layout.csv of
+each generator is the correctness baseline: the generator is run with the parameters of its __main__ block and
+compared with its layout.csv. The results are saved as JSON, and a run can be compared with a previous one to catch
+performance regressions.
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools.Generators import GENERATORS, generator_module
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# the benchmarks: generator (see Generators.py, None for SunPosition)
+BENCHMARKS = {
+    'campo': 'campo',
+    'mueen': 'mueen',
+    'biomimetic': 'biomimetic_surround',
+    'radial_staggered': 'radial_staggered',
+    'annual_angles': None,
+}
+SIZES = (1000, 10000, 100000, 1000000)
+
+
+def import_generator(name):
+    '''
+    Import the generator module of a benchmark from its folder, the generators do not import matplotlib.
+    '''
+    if BENCHMARKS[name] is None:
+        return importlib.import_module('LayoutTools.SunPosition')
+    return generator_module(BENCHMARKS[name])
+
+
+def mueen_rmax(module, size, Rmin=60.):
+    '''
+    Maximum ring radius of a MUEEN field of about size heliostats (the __main__ parameters otherwise), by bisection.
+    '''
+    def count(Rmax):
+        DM, R, G, NRG, NG = module.mueen_rings(np.sqrt(8.), np.sqrt(8.), 7.3, 1., 1., 12., 75., 0., np.pi, Rmax, Rmin)
+        return len(module.mueen_layout(DM, R, G, NRG, int(NG), 7.3, 0., np.pi))
+
+    lower, upper = Rmin, 2.*Rmin
+    while count(upper) < size:
+        lower, upper = upper, 2.*upper
+    for _ in range(40):
+        middle = np.sqrt(lower*upper)
+        if count(middle) < size:
+            lower = middle
+        else:
+            upper = middle
+        if upper/lower < 1.+1e-4:
+            break
+    return upper
+
+
+def prepare_case(name, size):
+    '''
+    Prepare one case of a benchmark, the preparation (e.g. finding the field radius of a size) is not timed.
+
+    name: name of the benchmark, see BENCHMARKS
+    size: number of heliostats, or of cells of the lookup table of annual_angles
+
+    return: function without argument running the case and returning the number of heliostats (or cells)
+    '''
+    module = import_generator(name)
+    if name == 'campo':
+        return lambda: len(module.campo_field(34., size, 10., 10., 0., 250., 80., 1., 0., verbose=False)[0])
+    if name == 'mueen':
+        Rmax = mueen_rmax(module, size)
+
+        def run():
+            DM, R, G, NRG, NG = module.mueen_rings(np.sqrt(8.), np.sqrt(8.), 7.3, 1., 1., 12., 75., 0., np.pi, Rmax, 60.)
+            return len(module.mueen_layout(DM, R, G, NRG, int(NG), 7.3, 0., np.pi))
+        return run
+    if name == 'biomimetic':
+        min_dis = np.sqrt(4.*4.+3.2*3.2)*1.5
+        return lambda: len(module.biomimetic_field(size, min_dis, (1.+np.sqrt(5.))/2., 4.5, 0.65, block_size=4096)[0])
+    if name == 'radial_staggered':
+        # 50 heliostats per ring with the __main__ parameters
+        rmax = 80.+5.*np.ceil(size/50.)
+        return lambda: len(module.radial_staggered_field(0., 2.*np.pi, 2.*np.pi/50., 80., rmax, 5.)[0])
+    nd = max(2, int(round(np.sqrt(size))))
+    sun = module.SunPosition()
+
+    def run():
+        sun.annual_angles(34., None, nd, nd, view=False)
+        return nd*nd
+    return run
+
+
+def peak_rss(field='VmHWM'):
+    '''
+    Peak (VmHWM) or current (VmRSS) resident memory of this process, MB, from /proc on Linux,
+    the peak of getrusage otherwise.
+    '''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field+':'):
+                    return int(line.split()[1])/1024.
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024./1024. if sys.platform == 'darwin' else peak/1024.
+
+
+def reset_peak_rss():
+    '''
+    Reset the peak resident memory of this process to its current value (Linux only), so the peak is the one of the case.
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def run_case(name, size, repeat=1):
+    '''
+    Run one case of a benchmark, the best wall time of repeat runs is kept.
+
+    return: dict of the benchmark name, size, count (heliostats or cells), seconds, peak_rss_mb (peak RSS of the process
+            during the case), rss_increase_mb (peak RSS minus the RSS before the case)
+    '''
+    run = prepare_case(name, size)
+    reset_peak_rss()
+    before = peak_rss('VmRSS')
+    seconds = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        count = run()
+        seconds = min(seconds, time.perf_counter()-t0)
+    after = peak_rss()
+    return dict(benchmark=name, size=size, count=int(count), seconds=seconds, peak_rss_mb=after,
+                rss_increase_mb=after-before)
+
+
+def check_baselines():
+    '''
+    Compare the generators run with the parameters of their __main__ block with the shipped layout.csv.
+    The heliostats are matched by their id, so a layout.csv with removed heliostats (e.g. the first heliostat of
+    Biomimetic_Surround, next to the tower) is compared with the same heliostats of the generator.
+
+    return: list of dict of the generator, heliostats (count of the baseline), count (count of the generator),
+            max_abs_diff (m), ok
+    '''
+    from LayoutTools.LayoutLoader import load_layout, layout_positions
+    results = []
+    for name in ('campo', 'mueen', 'biomimetic', 'radial_staggered'):
+        module = import_generator(name)
+        if name == 'campo':
+            XX, YY = module.campo_field(34., 6230, 10., 10., 0., 250, 80, 1.0, 0., verbose=False)[:2]
+            position = np.stack((XX, YY, np.zeros(len(XX))), axis=-1)
+        elif name == 'mueen':
+            DM, R, G, NRG, NG = module.mueen_rings(np.sqrt(8.), np.sqrt(8.), 7.3, 1., 1., 12., 75., 0., np.pi, 3.2*75., 0.8*75.)
+            position = module.mueen_layout(DM, R, G, NRG, int(NG), 7.3, 0., np.pi)[:, :3]
+        elif name == 'biomimetic':
+            x, y = module.biomimetic_field(1800, np.sqrt(4.*4.+3.2*3.2)*1.5, (1.+np.sqrt(5.))/2., 4.5, 0.65)
+            position = np.stack((x, y, np.zeros(len(x))), axis=-1)
+        else:
+            xs, ys = module.radial_staggered_field(0., 2.*np.pi, 2.*np.pi/50., 80., 200., 5.)
+            position = np.stack((xs, ys, np.zeros(len(xs))), axis=-1)
+
+        layout = load_layout(os.path.join(ROOT, GENERATORS[BENCHMARKS[name]][0], 'layout.csv'), cache=False)
+        baseline = layout_positions(layout)
+        # the ids of Campo and RadialStaggered start from 0, the others from 1
+        index = layout['id'].astype(np.int64)-(0 if name in ('campo', 'radial_staggered') else 1)
+        same = len(index) > 0 and np.all((index >= 0) & (index < len(position)))
+        diff = float(np.max(np.abs(baseline-position[index]))) if same else np.inf
+        results.append(dict(generator=name, heliostats=len(baseline), count=len(position), max_abs_diff=diff,
+                            ok=bool(same and diff <= 1e-6)))
+    return results
+
+
+def compare(results, previous, tolerance=1.5, min_seconds=0.01):
+    '''
+    Compare the wall time of the cases of two runs.
+
+    results, previous: results of run_case of this run and of a previous run
+    tolerance: a case is a regression if it is more than tolerance times slower
+    min_seconds: the cases faster than min_seconds are timer noise, never a regression
+
+    return: list of (benchmark, size, previous seconds, seconds, ratio, regression)
+    '''
+    old = {(case['benchmark'], case['size']): case['seconds'] for case in previous}
+    rows = []
+    for case in results:
+        key = (case['benchmark'], case['size'])
+        if key in old:
+            ratio = case['seconds']/max(old[key], 1e-9)
+            rows.append((key[0], key[1], old[key], case['seconds'], ratio, ratio > tolerance and case['seconds'] > min_seconds))
+    return rows
+
+
+if __name__ == "__main__":
+    """
+    Run the scaling benchmark and save the results, e.g.
+        python Benchmark.py --sizes 1000 10000 100000 --output benchmark.json
+        python Benchmark.py --benchmarks campo mueen --compare benchmark.json
+    the exit code is 1 if a baseline differs or if a case is slower than --tolerance times the compared run.
+    """
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the layout generators and of SunPosition.')
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help='heliostats (or lookup table cells)')
+    parser.add_argument('--repeat', type=int, default=1, help='the best wall time of repeat runs is kept')
+    parser.add_argument('--output', default='benchmark.json', help='results, .json')
+    parser.add_argument('--compare', default=None, help='results of a previous run, .json')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+
+    baselines = check_baselines()
+    for baseline in baselines:
+        print('baseline %-16s %5d heliostats, max |diff| %.3g m, %s'
+              % (baseline['generator'], baseline['heliostats'], baseline['max_abs_diff'], 'ok' if baseline['ok'] else 'FAILED'))
+
+    # every case runs in a new process, so its peak RSS is its own
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for name in args.benchmarks:
+        for size in args.sizes:
+            with context.Pool(1) as pool:
+                case = pool.apply(run_case, (name, size, args.repeat))
+            results.append(case)
+            print('%-16s %8d -> %8d  %9.4f s  peak RSS %8.1f MB (+%.1f MB)'
+                  % (name, size, case['count'], case['seconds'], case['peak_rss_mb'], case['rss_increase_mb']), flush=True)
+
+    import numpy
+    report = dict(timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), python=platform.python_version(), numpy=numpy.__version__,
+                  platform=platform.platform(), cpus=os.cpu_count(), baselines=baselines, results=results)
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=1)
+    print('results saved to', args.output)
+
+    failed = not all(baseline['ok'] for baseline in baselines)
+    if args.compare is not None:
+        with open(args.compare) as input_file:
+            previous = json.load(input_file)['results']
+        for name, size, old, new, ratio, regression in compare(results, previous, args.tolerance):
+            print('%-16s %8d  %9.4f s -> %9.4f s  x%.2f%s' % (name, size, old, new, ratio, '  REGRESSION' if regression else ''))
+            failed = failed or regression
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Shared pieces of the biomimetic heliostat fields (Biomimetic_Surround and Biomimetic_PS10-like): the candidates on the
+phyllotaxis spiral and the collision constrain of adjacent heliostats on a uniform grid index, ref. <Noone2012,
+Heliostat Field Optimization: A New Computationally Efficient Model and Biomimetic Layout>.
+"""
+
+import numpy as np
+
+
+class HeliostatGrid:
+    '''
+    Uniform grid (spatial hash) of the existing heliostats, used by the collision constrain of adjacent heliostats.
+    The size of each cell is min_dis, so a heliostat can only collide with the heliostats in the 3x3 cells around it,
+    both inserting a heliostat and querying its neighbours cost O(1) on average.
+
+    min_dis: minimum safe distance of two adjacent heliostats' centre
+    '''
+
+    def __init__(self, min_dis):
+        self.min_dis = min_dis
+        self.cells = {}  # (cell index x, cell index y) -> [(x,y), (x,y)..]
+
+    def cell(self, x, y):
+        '''
+        Index of the cell that contains the point (x,y).
+        '''
+        return (int(x // self.min_dis), int(y // self.min_dis))
+
+    def insert(self, x, y):
+        '''
+        Add a heliostat whose centre is (x,y) to the grid.
+        '''
+        self.cells.setdefault(self.cell(x, y), []).append((x, y))
+
+    def neighbours(self, x, y):
+        '''
+        Heliostats in the 3x3 cells around the point (x,y), all heliostats closer than min_dis to (x,y) are included.
+        '''
+        cx, cy = self.cell(x, y)
+        for ix in range(cx-1, cx+2):
+            for iy in range(cy-1, cy+2):
+                for helio in self.cells.get((ix, iy), ()):
+                    yield helio
+
+
+def heliostatCollisionConstrain(test_helio, exist_helio_grid, min_dis):
+    '''
+    Collision constrain of adjacent heliostats.
+    Check whether the distance between the newly added heliostat (test_helio) and the existing heliostats (exist_helio_grid) is too small.
+
+    test_helio: coordinate of tested heliostat, (x,y)
+    exist_helio_grid: existing heliostats, HeliostatGrid
+    min_dis: minimum safe distance of two adjacent heliostats' centre
+    '''
+
+    test_helio_x = test_helio[0]
+    test_helio_y = test_helio[1]
+
+    for temp_helio_x, temp_helio_y in exist_helio_grid.neighbours(test_helio_x, test_helio_y):
+        delta_x = test_helio_x - temp_helio_x
+        delta_y = test_helio_y - temp_helio_y
+        delta_dis_2 = delta_x * delta_x + delta_y*delta_y
+        if (np.abs(delta_dis_2) <= min_dis * min_dis):
+            return True
+    return False
+
+
+def spiralCandidates(start, num, phi, a, b):
+    '''
+    Generate a block of candidate heliostats on the phyllotaxis spiral, the candidates' index is start, start+1, .., start+num-1.
+
+    start: index of the first candidate (start from 1)
+    num: number of candidates in the block
+    phi: golden ratio phi of eq.(14) in the reference paper
+    a: the coefficient a of eq.(15) in the reference paper
+    b: the coefficient b of eq.(15) in the reference paper
+
+    return: radius, position.x and position.y of the candidates, numpy arrays
+    '''
+    i = np.arange(start, start+num)
+    theta = 2.0 * np.pi * np.power(phi, -2) * i
+    r = a * np.power(i, b)
+    return r, r * np.cos(theta), r * np.sin(theta)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools.SunPosition import SunPosition
+
+
+def annual_sun_vectors(latitude, days=None, omega=None):
+    '''
+    Sun vectors above the horizon over a year, e.g. hourly sun vectors of every day.
+
+    latitude: latitude of the field location, deg
+    days: day numbers of the year (1-365), None for every day
+    omega: solar hour angles of each day, deg, None for every hour
+
+    return: sun_vecs, s x 3 unit sun vectors above the horizon (x East, y North, z up)
+    '''
+    sun = SunPosition()
+    days = np.arange(1, 366) if days is None else np.asarray(days)
+    omega = np.linspace(-180., 165., 24) if omega is None else np.asarray(omega, dtype=float)
+    sun_vecs = sun.sun_vector(latitude, sun.declination(days)[:, None], omega).reshape(-1, 3)
+    return sun_vecs[sun_vecs[:, 2] > 0.]
+
+
+def cosine_factors(position, sun_vecs, aim):
+    '''
+    Cosine factor of each heliostat for each sun vector, the heliostat normal bisects the sun vector and the direction to the aim point,
+    so the cosine of the incidence angle is sqrt((1+reflected.sun_vec)/2).
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vecs: s x 3 unit sun vectors (x East, y North, z up)
+    aim: aim point on the receiver, 3 or n x 3, m
+
+    return: s x n cosine factors
+    '''
+    reflected = np.asarray(aim, dtype=float)-np.asarray(position, dtype=float)
+    reflected /= np.linalg.norm(reflected, axis=-1, keepdims=True)
+    cos2w = np.asarray(sun_vecs, dtype=float).reshape(-1, 3) @ reflected.T
+    return np.sqrt(np.maximum(0.5*(1.+cos2w), 0.))
+
+
+def cosine_efficiency(position, sun_vecs, aim, weights=None, chunk=256):
+    '''
+    Weighted average cosine efficiency of each heliostat over a set of sun vectors (e.g. a year),
+    the sun vectors are processed by chunks, the peak memory is bounded by chunk x n.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vecs: s x 3 unit sun vectors (e.g. annual_sun_vectors), the sun vectors below the horizon are ignored
+    aim: aim point on the receiver, 3 or n x 3, m
+    weights: s weights of the sun vectors (e.g. DNI x time step), None for uniform weights
+    chunk: number of sun vectors processed together
+
+    return: n cosine efficiencies
+    '''
+    sun_vecs = np.asarray(sun_vecs, dtype=float).reshape(-1, 3)
+    weights = np.ones(len(sun_vecs)) if weights is None else np.asarray(weights, dtype=float)
+    weights = np.where(sun_vecs[:, 2] > 0., weights, 0.)
+    total = np.sum(weights)
+    if total <= 0.:
+        raise ValueError('no sun vector above the horizon')
+
+    efficiency = np.zeros(len(position))
+    for start in range(0, len(sun_vecs), chunk):
+        efficiency += weights[start:start+chunk] @ cosine_factors(position, sun_vecs[start:start+chunk], aim)
+    return efficiency/total
+
+
+if __name__ == "__main__":
+    """
+    Compare the annual cosine efficiency of the layouts of this repository, e.g.
+        python CosineEfficiency.py PS10 Gemasolar Campo
+    the parameters of each layout are in Plants.py.
+    """
+    from LayoutTools import load_layout, layout_positions
+    from LayoutTools.Plants import PLANTS
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    names = sys.argv[1:] if len(sys.argv) > 1 else ['PS10', 'Gemasolar', 'Campo']
+    print("layout heliostats latitude cosine(mean) cosine(min) cosine(max)")
+    for name in names:
+        plant = PLANTS[name]
+        latitude = plant['latitude'] if plant['latitude'] is not None else 34.
+        position = layout_positions(load_layout(os.path.join(root, plant['folder'], 'layout.csv')))
+        efficiency = cosine_efficiency(position, annual_sun_vectors(latitude), plant['aim'])
+        print(name, len(position), latitude, "%.4f %.4f %.4f" % (np.mean(efficiency), np.min(efficiency), np.max(efficiency)))
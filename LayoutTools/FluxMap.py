@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Receiver flux map of a heliostat field, superposition of the analytical images of the heliostats by FFT convolution.
+
+The image of each heliostat is the circular Gaussian of HFLCAL (see HFLCAL.image_sigma), widened on the receiver surface
+to sigma/sqrt(cos) by the incidence angle of the reflected beam on the receiver. The heliostats are grouped into bins of
+similar sigma, the power of the heliostats of a bin is deposited at their image centres on the receiver grid (cloud in
+cell), and the grid is convolved once with the Gaussian kernel of the bin by FFT, instead of evaluating every image on
+every cell. The grid of a cylinder receiver is (azimuth, height), periodic in azimuth, and the grid of a flat receiver is
+(width, height), the same cells as RayTracer.trace_field.
+"""
+
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools.HFLCAL import image_sigma, attenuation
+
+
+def receiver_frame(plant):
+    '''
+    Size of the receiver surface unrolled as a rectangle, and the aperture axes of a flat receiver.
+
+    plant: parameters of the receiver, e.g. Plants.PLANTS['Gemasolar']
+
+    return: width (horizontal, the circumference of a cylinder), height, m, and normal, e_w, e_h (None for a cylinder)
+    '''
+    if plant.get('receiver') == 'cylinder':
+        return 2.*np.pi*plant['receiver_radius'], plant['receiver_height'], None, None, None
+    if plant.get('receiver') != 'flat':
+        raise ValueError('unknown receiver type: '+str(plant.get('receiver')))
+    facing = np.asarray(plant.get('receiver_facing', (0., 1., 0.)), dtype=float)
+    facing = facing/np.hypot(facing[0], facing[1])
+    tilt = np.radians(plant.get('receiver_tilt', 0.))
+    normal = np.array([facing[0]*np.cos(tilt), facing[1]*np.cos(tilt), -np.sin(tilt)])
+    e_w = np.array([-facing[1], facing[0], 0.])
+    return plant['receiver_width'], plant['receiver_height'], normal, e_w, np.cross(normal, e_w)
+
+
+def heliostat_images(position, sun_vec, plant, aim=None, dni=1000., factors=None, sigma_sun=2.51, focal=None):
+    '''
+    Image of each heliostat on the receiver surface: centre, standard deviation and power.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vec: unit sun vector (x East, y North, z up)
+    plant: parameters of the heliostats and of the receiver, e.g. Plants.PLANTS['Gemasolar']
+    aim: n x 3 aim points on the receiver, m, None for the receiver centre plant['aim']
+    dni: direct normal irradiance, W/m2
+    factors: n extra efficiency factors of the heliostats (e.g. (1-shading)*(1-blocking)), None for 1
+    sigma_sun, focal: see HFLCAL.image_sigma
+
+    return: u, v (n image centres on the unrolled receiver surface from its lower left corner), sigma (n, m), power (n, W)
+    '''
+    position = np.asarray(position, dtype=float)
+    centre = np.asarray(plant['aim'], dtype=float)
+    aim = np.broadcast_to(centre if aim is None else np.asarray(aim, dtype=float), position.shape)
+    to_aim = aim-position
+    slant = np.linalg.norm(to_aim, axis=-1)
+    reflected = to_aim/slant[:, None]
+    sun_vec = np.asarray(sun_vec, dtype=float)/np.linalg.norm(sun_vec)
+    cosw = np.sqrt(np.maximum(0.5*(1.+reflected @ sun_vec), 0.))
+
+    width, height, normal, e_w, e_h = receiver_frame(plant)
+    if plant['receiver'] == 'cylinder':
+        # the image is centred on the side of the cylinder facing the heliostat, where the beam aimed at the axis
+        # crosses the surface, radius*tan(elevation) below the aim point
+        psi = np.arctan2(position[:, 1]-centre[1], position[:, 0]-centre[0])
+        cos_receiver = np.sqrt(np.maximum(1.-reflected[:, 2]*reflected[:, 2], 0.))
+        u = (psi+np.pi)/(2.*np.pi)*width
+        v = aim[:, 2]-centre[2]+0.5*height-plant['receiver_radius']*reflected[:, 2]/np.maximum(cos_receiver, 1e-3)
+    else:
+        u = (aim-centre) @ e_w+0.5*width
+        v = (aim-centre) @ e_h+0.5*height
+        cos_receiver = np.maximum(-(reflected @ normal), 0.)
+
+    sigma = image_sigma(slant, cosw, plant['width'], plant['height'], sigma_sun,
+                        plant.get('slope_error') or 0., plant.get('tracking_error') or 0., focal)
+    sigma = sigma/np.sqrt(np.maximum(cos_receiver, 1e-3))
+    power = dni*plant['width']*plant['height']*cosw*(plant.get('reflectivity') or 1.)*attenuation(slant)
+    power = np.where(cos_receiver > 0., power, 0.)
+    if factors is not None:
+        power = power*np.asarray(factors, dtype=float)
+    return u, v, sigma, power
+
+
+def flux_map(position, sun_vec, plant, shape=(200, 200), aim=None, dni=1000., factors=None, nbins=16,
+             sigma_sun=2.51, focal=None):
+    '''
+    Receiver flux map of a heliostat field by binned FFT convolution.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vec: unit sun vector (x East, y North, z up)
+    plant: parameters of the heliostats and of the receiver, e.g. Plants.PLANTS['Gemasolar']
+    shape: number of cells (horizontal, vertical) of the receiver grid
+    aim, dni, factors, sigma_sun, focal: see heliostat_images
+    nbins: number of sigma bins, each bin costs one FFT convolution
+
+    return: flux, shape array of the flux density on the cells, W/m2, and the cell size (du, dv), m
+    '''
+    nx, ny = shape
+    width, height = receiver_frame(plant)[:2]
+    du, dv = width/nx, height/ny
+    u, v, sigma, power = heliostat_images(position, sun_vec, plant, aim, dni, factors, sigma_sun, focal)
+    keep = power > 0.
+    u, v, sigma, power = u[keep], v[keep], sigma[keep], power[keep]
+    if len(power) == 0:
+        return np.zeros(shape), (du, dv)
+
+    # the cylinder is periodic in azimuth, the other directions are padded so the images do not wrap around
+    periodic = plant['receiver'] == 'cylinder'
+    px = nx if periodic else 2*nx
+    py = 2*ny
+
+    # cloud in cell deposit of the image centres, in cell units from the centre of the first cell
+    x = u/du-0.5
+    y = v/dv-0.5
+    x0 = np.floor(x).astype(int)
+    y0 = np.floor(y).astype(int)
+    fx = x-x0
+    fy = y-y0
+
+    # sigma bins of equal width in log(sigma), the sigma of a bin preserves the power weighted variance
+    log_sigma = np.log(sigma)
+    edges = np.linspace(log_sigma.min(), log_sigma.max()+1e-12, nbins+1)
+    group = np.clip(np.searchsorted(edges, log_sigma, side='right')-1, 0, nbins-1)
+
+    kx = np.minimum(np.arange(px), px-np.arange(px))*du
+    ky = np.minimum(np.arange(py), py-np.arange(py))*dv
+    flux = np.zeros((px, py//2+1), dtype=complex)
+    for b in np.unique(group):
+        member = group == b
+        s = np.sqrt(np.sum(power[member]*sigma[member]**2)/np.sum(power[member]))
+        grid = np.zeros(px*py)
+        for dx, dy, w in ((0, 0, (1.-fx)*(1.-fy)), (1, 0, fx*(1.-fy)), (0, 1, (1.-fx)*fy), (1, 1, fx*fy)):
+            ix = x0[member]+dx
+            iy = y0[member]+dy
+            if periodic:
+                ix = ix % px
+                inside = (iy >= 0) & (iy < py)
+            else:
+                inside = (ix >= 0) & (ix < px) & (iy >= 0) & (iy < py)
+            ix, iy = ix % px, iy % py
+            grid += np.bincount((ix*py+iy)[inside], weights=(power[member]*w[member])[inside], minlength=px*py)
+
+        kernel = np.exp(-0.5*(kx[:, None]**2+ky[None, :]**2)/(s*s))
+        kernel /= np.sum(kernel)*du*dv
+        flux += np.fft.rfft2(grid.reshape(px, py))*np.fft.rfft2(kernel)
+    return np.fft.irfft2(flux, s=(px, py))[:nx, :ny], (du, dv)
+
+
+if __name__ == "__main__":
+    """
+    Receiver flux map of a layout of this repository at solar noon of an equinox, e.g.
+        python FluxMap.py Gemasolar 200 200
+    the parameters of each layout are in Plants.py.
+    """
+    import time
+    from LayoutTools import load_layout, layout_positions
+    from LayoutTools.Plants import PLANTS
+
+    name = sys.argv[1] if len(sys.argv) > 1 else 'Gemasolar'
+    shape = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) > 3 else (200, 200)
+    plant = PLANTS[name]
+    latitude = np.radians(plant['latitude'] if plant['latitude'] is not None else 34.)
+    filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', plant['folder'], 'layout.csv')
+    position = layout_positions(load_layout(filename))
+
+    t0 = time.time()
+    flux, (du, dv) = flux_map(position, (0., -np.sin(latitude), np.cos(latitude)), plant, shape)
+    print("%d heliostats, %d x %d cells (%.3f s)" % (len(position), shape[0], shape[1], time.time()-t0))
+    print("power on the receiver %.4g MW, peak flux %.4g kW/m2, mean flux %.4g kW/m2"
+          % (np.sum(flux)*du*dv/1e6, np.max(flux)/1e3, np.mean(flux)/1e3))
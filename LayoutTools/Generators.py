@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+In-memory API of the layout generators of this repository (Campo, MUEEN, RadialStaggered, Biomimetic_Surround and
+Biomimetic_PS10-like), for running them many times in one process, in threads or in a process pool.
+
+Each generator takes its inputs as numbers and arrays (the PS10-like base field is an array, not a file of the working
+directory) and returns the n x 3 heliostat positions, without writing a file or plotting. With the default parameters
+the positions are those written by the scripts, bit for bit. The generator modules are
+imported on the first call only, and matplotlib, shapely and scipy are imported only by the code which needs them
+(the plots of the scripts, the convex hull of the PS10-like base field), so importing this module is cheap.
+
+    >>> from LayoutTools.Generators import generate
+    >>> position = generate('campo', num_hst=2000)
+    >>> position = generate('biomimetic_ps10', base=base_xy, a=4.)
+"""
+
+import importlib
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# golden ratio phi and minimum heliostat distance of the __main__ blocks of the biomimetic generators
+PHI = (1.+np.sqrt(5.))/2.
+BIOMIMETIC_MIN_DIS = np.sqrt(4.*4.+3.2*3.2)*1.5
+
+# the generators: folder and module of the generator script
+GENERATORS = {
+    'campo': ('Campo', 'Campo'),
+    'mueen': ('MUEEN', 'MUEEN'),
+    'radial_staggered': ('RadialStaggered', 'RadialStaggered'),
+    'biomimetic_surround': ('Biomimetic_Surround', 'Biomimetic_Surround'),
+    'biomimetic_ps10': ('Biomimetic_PS10-like', 'Biomimetic_PS10-like'),
+}
+
+_base = {}  # the shipped PS10 base field, read once
+
+
+def generator_module(name):
+    '''
+    Import the module of a generator from its folder, once per process.
+
+    name: name of the generator, see GENERATORS
+    '''
+    folder, module = GENERATORS[name]
+    folder = os.path.join(ROOT, folder)
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+    return importlib.import_module(module)
+
+
+def ps10_base():
+    '''
+    The shipped base field of the PS10-like generator (Biomimetic_PS10-like/layout_PS10_base.csv), read once.
+
+    return: n x 2 array of the base heliostat positions x, y, m
+    '''
+    if 'ps10' not in _base:
+        filename = os.path.join(ROOT, GENERATORS['biomimetic_ps10'][0], 'layout_PS10_base.csv')
+        _base['ps10'] = generator_module('biomimetic_ps10').read_base(filename)
+    return _base['ps10']
+
+
+def generate_campo(latitude=34., num_hst=6230, width=10., height=10., hst_z=0., towerheight=250., R1=80., fb=1.,
+                   dsep=0., sun_vec=None, weights=None, instrument=None):
+    '''
+    Campo radial-stagger field, see Campo.campo_field for the parameters (the defaults are those of Campo.py).
+
+    return: n x 3 heliostat positions, m
+    '''
+    XX, YY = generator_module('campo').campo_field(latitude, num_hst, width, height, hst_z, towerheight, R1, fb, dsep,
+                                                   sun_vec, weights, verbose=False, instrument=instrument)[:2]
+    return np.stack((XX, YY, np.full(len(XX), float(hst_z))), axis=-1)
+
+
+def generate_mueen(lm=np.sqrt(8.), wm=np.sqrt(8.), z0=7.3, fa=1., dS=1., lr=12., Ht=75., BL=0., PSImax=np.pi,
+                   Rmax=3.2*75., Rmin=0.8*75., instrument=None):
+    '''
+    MUEEN field, see MUEEN.mueen_rings for the parameters (the defaults are those of MUEEN.py).
+
+    return: n x 3 heliostat positions, m
+    '''
+    module = generator_module('mueen')
+    DM, R, G, NRG, NG = module.mueen_rings(lm, wm, z0, fa, dS, lr, Ht, BL, PSImax, Rmax, Rmin, instrument)
+    return module.mueen_layout(DM, R, G, NRG, int(NG), z0, BL, PSImax, instrument)[:, :3]
+
+
+def generate_radial_staggered(start_ang=0., end_ang=2.*np.pi, az_space=2.*np.pi/50., rmin=80., rmax=200., r_space=5.,
+                              instrument=None):
+    '''
+    Radial staggered field, see RadialStaggered.radial_staggered_field for the parameters (the defaults are those of
+    RadialStaggered.py).
+
+    return: n x 3 heliostat positions, m
+    '''
+    xs, ys = generator_module('radial_staggered').radial_staggered_field(start_ang, end_ang, az_space, rmin, rmax,
+                                                                          r_space, instrument)
+    return np.stack((xs, ys, np.zeros(len(xs))), axis=-1)
+
+
+def generate_biomimetic_surround(target_num=1800, min_dis=BIOMIMETIC_MIN_DIS, phi=PHI, a=4.5, b=0.65, block_size=1,
+                                 instrument=None):
+    '''
+    Biomimetic-surround field, see Biomimetic_Surround.biomimetic_field for the parameters (the defaults are those of
+    Biomimetic_Surround.py). The candidates of a block larger than 1 (e.g. 4096, much faster for large fields) are
+    computed by vectorized cos and sin, which may differ from the script in the last digit.
+
+    return: n x 3 heliostat positions, m
+    '''
+    x, y = generator_module('biomimetic_surround').biomimetic_field(target_num, min_dis, phi, a, b, block_size, instrument)
+    return np.stack((x, y, np.zeros(len(x))), axis=-1).reshape(-1, 3)
+
+
+def generate_biomimetic_ps10(base=None, min_dis=BIOMIMETIC_MIN_DIS, phi=PHI, a=4.5, b=0.65, block_size=1,
+                             instrument=None):
+    '''
+    Biomimetic-PS-like field inside the convex hull of a base field, see Biomimetic_PS10-like.biomimetic_field for the
+    parameters (the defaults are those of Biomimetic_PS10-like.py), see generate_biomimetic_surround for block_size.
+
+    base: n x 2 (or n x 3) array of the base heliostat positions, m, None for the shipped PS10 base field
+
+    return: n x 3 heliostat positions, m
+    '''
+    base = ps10_base() if base is None else base
+    x, y = generator_module('biomimetic_ps10').biomimetic_field(base, min_dis, phi, a, b, block_size, instrument)[:2]
+    return np.stack((x, y, np.zeros(len(x))), axis=-1).reshape(-1, 3)
+
+
+_FUNCTIONS = {
+    'campo': generate_campo,
+    'mueen': generate_mueen,
+    'radial_staggered': generate_radial_staggered,
+    'biomimetic_surround': generate_biomimetic_surround,
+    'biomimetic_ps10': generate_biomimetic_ps10,
+}
+
+
+def generate(name, **params):
+    '''
+    Generate a layout in memory, no file is written and nothing is plotted.
+
+    name: name of the generator, see GENERATORS
+    params: parameters of the generator, the others keep the defaults of its script
+
+    return: n x 3 heliostat positions, m
+    '''
+    if name not in _FUNCTIONS:
+        raise ValueError('unknown generator: '+str(name))
+    return _FUNCTIONS[name](**params)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Analytical intercept (spillage) and atmospheric attenuation of each heliostat, after HFLCAL.
+
+The image of a heliostat on the plane normal to its reflected beam is a circular Gaussian of standard deviation
+    sigma = D * sqrt(sigma_sun^2 + (2*sigma_slope)^2 + (2*sigma_track)^2 + sigma_ast^2), m
+where D is the slant range, and the astigmatism of a heliostat of area A and focal length f at the incidence angle w is
+    sigma_ast = sqrt(0.5*(Ht^2+Ws^2))/(4*D), Ht = sqrt(A)*|D/f*cos(w)-1|, Ws = sqrt(A)*|D/f-cos(w)|.
+The intercept is the fraction of the Gaussian inside the receiver silhouette seen along the reflected beam, a rectangle
+centered on the aim point. Ref. Collado F J, One-point fitting of the flux density produced by a heliostat, Solar Energy, 2010;
+Schwarzbözl P, Pitz-Paal R, Schmitz M, Visual HFLCAL - a software tool for layout and optimisation of heliostat fields, SolarPACES, 2009.
+"""
+
+import numpy as np
+from scipy.special import erf
+
+
+def slant_range(position, aim):
+    '''
+    Distance from each heliostat to the aim point.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    aim: aim point on the receiver, 3 or n x 3, m
+
+    return: n slant ranges, m
+    '''
+    return np.linalg.norm(np.asarray(aim, dtype=float)-np.asarray(position, dtype=float), axis=-1)
+
+
+def attenuation(slant):
+    '''
+    Atmospheric attenuation efficiency of the reflected beam for a visibility of about 40 km, ref. Leary and Hankins (DELSOL).
+
+    slant: slant ranges, m
+
+    return: attenuation efficiencies, same shape as slant
+    '''
+    slant = np.asarray(slant, dtype=float)
+    return np.where(slant <= 1000., 0.99321-1.176e-4*slant+1.97e-8*slant*slant, np.exp(-1.106e-4*slant))
+
+
+def image_sigma(slant, cosw, width, height, sigma_sun=2.51, slope_error=2.6, tracking_error=0., focal=None):
+    '''
+    Standard deviation of the circular Gaussian image of each heliostat on the plane normal to the reflected beam.
+
+    slant: slant ranges, m
+    cosw: cosine of the incidence angle on the heliostats, same shape as slant or broadcast with it (e.g. s x n)
+    width, height: heliostat width and height, m
+    sigma_sun: standard deviation of the sunshape, mrad
+    slope_error, tracking_error: standard deviation of the heliostat normal, mrad, doubled by the reflection
+    focal: focal length of the heliostats, m, None for heliostats focused at their slant range, np.inf for flat heliostats
+
+    return: image standard deviations, m
+    '''
+    slant = np.asarray(slant, dtype=float)
+    ratio = 1. if focal is None else slant/np.asarray(focal, dtype=float)
+    side = np.sqrt(width*height)
+    Ht = side*np.abs(ratio*cosw-1.)
+    Ws = side*np.abs(ratio-cosw)
+    sigma_ast = np.sqrt(0.5*(Ht*Ht+Ws*Ws))/(4.*slant)
+    sigma2 = (sigma_sun*sigma_sun+4.*slope_error*slope_error+4.*tracking_error*tracking_error)*1e-6+sigma_ast*sigma_ast
+    return slant*np.sqrt(sigma2)
+
+
+def receiver_silhouette(reflected, receiver, receiver_radius=None, receiver_width=None, receiver_height=None,
+                        receiver_tilt=0., receiver_facing=(0., 1., 0.)):
+    '''
+    Width and height of the receiver seen along the reflected beam of each heliostat.
+
+    reflected: n x 3 unit vectors from the heliostats to the aim point
+    receiver: 'cylinder' (external receiver of a surround field) or 'flat' (cavity aperture)
+    receiver_radius: radius of the cylinder receiver, m
+    receiver_width: width of the flat receiver aperture, m
+    receiver_height: height of the cylinder receiver or of the flat receiver aperture, m
+    receiver_tilt: tilt of the flat aperture normal below the horizontal, deg
+    receiver_facing: horizontal direction faced by the flat aperture, North by default
+
+    return: width, height, n projected sizes, m, 0 if the heliostat is behind a flat aperture
+    '''
+    elevation = np.arcsin(np.clip(reflected[:, 2], -1., 1.))
+    if receiver == 'cylinder':
+        return (np.full(len(reflected), 2.*receiver_radius),
+                receiver_height*np.cos(elevation)+2.*receiver_radius*np.abs(np.sin(elevation)))
+    if receiver != 'flat':
+        raise ValueError('unknown receiver type: '+str(receiver))
+
+    facing = np.asarray(receiver_facing, dtype=float)
+    facing = facing/np.hypot(facing[0], facing[1])
+    tilt = np.radians(receiver_tilt)
+    normal = np.array([facing[0]*np.cos(tilt), facing[1]*np.cos(tilt), -np.sin(tilt)])
+    e_w = np.array([-facing[1], facing[0], 0.])
+    e_h = np.cross(normal, e_w)
+
+    def projected(axis):
+        along = reflected @ axis
+        return np.sqrt(np.maximum(1.-along*along, 0.))
+
+    front = (reflected @ normal) < 0.  # the reflected beam enters the aperture from the field side
+    return (np.where(front, receiver_width*projected(e_w), 0.),
+            np.where(front, receiver_height*projected(e_h), 0.))
+
+
+def intercept(position, sun_vecs, aim, width, height, receiver, receiver_radius=None, receiver_width=None,
+              receiver_height=None, receiver_tilt=0., receiver_facing=(0., 1., 0.),
+              sigma_sun=2.51, slope_error=2.6, tracking_error=0., focal=None):
+    '''
+    Intercept factor of each heliostat for each sun vector, all the heliostats and sun vectors in one vectorized call.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vecs: s x 3 unit sun vectors (x East, y North, z up)
+    aim: aim point on the receiver, 3 or n x 3, m
+    width, height, sigma_sun, slope_error, tracking_error, focal: heliostat and sun, see image_sigma
+    receiver, receiver_radius, receiver_width, receiver_height, receiver_tilt, receiver_facing: receiver, see receiver_silhouette
+
+    return: s x n intercept factors
+    '''
+    position = np.asarray(position, dtype=float)
+    to_aim = np.asarray(aim, dtype=float)-position
+    slant = np.linalg.norm(to_aim, axis=-1)
+    reflected = to_aim/slant[:, None]
+
+    cosw = np.sqrt(np.maximum(0.5*(1.+np.asarray(sun_vecs, dtype=float).reshape(-1, 3) @ reflected.T), 0.))
+    sigma = image_sigma(slant, cosw, width, height, sigma_sun, slope_error, tracking_error, focal)
+    silhouette_width, silhouette_height = receiver_silhouette(reflected, receiver, receiver_radius, receiver_width,
+                                                              receiver_height, receiver_tilt, receiver_facing)
+    scale = 1./(2.*np.sqrt(2.)*sigma)
+    return erf(silhouette_width*scale)*erf(silhouette_height*scale)
+
+
+def hflcal_factors(position, sun_vecs, plant, sigma_sun=2.51, focal=None):
+    '''
+    Intercept and attenuation of each heliostat of a layout, with the heliostat and receiver parameters of a plant.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vecs: s x 3 unit sun vectors (x East, y North, z up)
+    plant: parameters of the plant, e.g. Plants.PLANTS['Gemasolar']
+    sigma_sun: standard deviation of the sunshape, mrad
+    focal: focal length of the heliostats, m, None for heliostats focused at their slant range
+
+    return: intercept (s x n), attenuation (n)
+    '''
+    if plant.get('receiver') is None or plant.get('slope_error') is None:
+        raise ValueError('the receiver and the optical errors of the plant are not given')
+    factors = intercept(position, sun_vecs, plant['aim'], plant['width'], plant['height'], plant['receiver'],
+                        plant.get('receiver_radius'), plant.get('receiver_width'), plant.get('receiver_height'),
+                        plant.get('receiver_tilt', 0.), plant.get('receiver_facing', (0., 1., 0.)),
+                        sigma_sun, plant['slope_error'], plant.get('tracking_error') or 0., focal)
+    return factors, attenuation(slant_range(position, plant['aim']))
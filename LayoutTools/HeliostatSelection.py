@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Over-generate and select: keep the N best heliostats of an oversized candidate field.
+
+The generators stop at a geometric count (num_hst of Campo, target_num of the biomimetic spiral, Rmax of MUEEN), so
+the layout keeps the poor heliostats of its last rows while a better position further out is not used. Here any
+generator produces an oversized candidate field, every candidate is scored by its annual efficiency (vectorized over
+blocks of candidates, so the memory is bounded for millions of candidates), and the best N are kept by a partial sort
+(np.argpartition, linear time) instead of a full sort.
+"""
+
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools.AnnualLUT import MODELS, check_model
+from LayoutTools.CosineEfficiency import annual_sun_vectors, cosine_factors
+from LayoutTools.HFLCAL import attenuation, hflcal_factors, slant_range
+
+
+def heliostat_efficiency(position, sun_vecs, plant, model='hflcal', weights=None, radius=None):
+    '''
+    Weighted annual efficiency of each heliostat over a set of sun vectors.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vecs: s x 3 unit sun vectors (e.g. annual_sun_vectors), the sun vectors below the horizon are ignored
+    plant: parameters of the plant, e.g. Plants.PLANTS['Gemasolar']
+    model: efficiency model, see AnnualLUT.field_efficiency, 'cosine' and 'hflcal' scale to millions of candidates,
+           'optical' and 'geometric' also evaluate the shading and blocking of the candidates by the other candidates
+    weights: s weights of the sun vectors (e.g. DNI x time step), None for uniform weights
+    radius: neighbour radius of the blocking, m, see ShadingBlocking.shading_blocking
+
+    return: n annual efficiencies
+    '''
+    check_model(plant, model)
+    position = np.asarray(position, dtype=float)
+    sun_vecs = np.asarray(sun_vecs, dtype=float).reshape(-1, 3)
+    weights = np.ones(len(sun_vecs)) if weights is None else np.asarray(weights, dtype=float)
+    weights = np.where(sun_vecs[:, 2] > 0., weights, 0.)
+    total = np.sum(weights)
+    if total <= 0.:
+        raise ValueError('no sun vector above the horizon')
+
+    # the factors which do not depend on the sun
+    fixed = np.ones(len(position))
+    if model != 'cosine':
+        fixed = attenuation(slant_range(position, plant['aim']))
+    if model == 'hflcal' or model == 'optical':
+        fixed *= plant['reflectivity']
+
+    if model == 'cosine' or model == 'hflcal':
+        # blocks of heliostats with all the sun vectors at once, the peak memory is bounded by s x chunk
+        chunk = max(1, (1 << 22)//len(sun_vecs))
+        efficiency = np.zeros(len(position))
+        for start in range(0, len(position), chunk):
+            block = position[start:start+chunk]
+            factor = cosine_factors(block, sun_vecs, plant['aim'])
+            if model == 'hflcal':
+                factor *= hflcal_factors(block, sun_vecs, plant)[0]
+            efficiency[start:start+chunk] = weights @ factor
+        return fixed*efficiency/total
+
+    # the shading and blocking of a sun vector need the whole field, one sun vector at a time
+    from LayoutTools.ShadingBlocking import blocking_radius, neighbour_pairs, shading_blocking
+    if radius is None:
+        radius = blocking_radius(position, plant['width'], plant['height'], plant['aim'])
+    pairs = neighbour_pairs(position, radius)
+    efficiency = np.zeros(len(position))
+    for weight, sun_vec in zip(weights, sun_vecs):
+        if weight <= 0.:
+            continue
+        factor = cosine_factors(position, sun_vec, plant['aim'])[0]
+        if model == 'optical':
+            factor *= hflcal_factors(position, sun_vec, plant)[0][0]
+        shading, blocking = shading_blocking(position, sun_vec, plant['width'], plant['height'], plant['aim'], pairs)
+        efficiency += weight*factor*(1.-shading)*(1.-blocking)
+    return fixed*efficiency/total
+
+
+def select_top(scores, num):
+    '''
+    Indices of the num highest scores, found by a partial sort (np.argpartition), in increasing order,
+    so the selected heliostats keep the order of the generator.
+
+    scores: n scores
+    num: number of selected indices
+
+    return: min(num, n) indices
+    '''
+    scores = np.asarray(scores)
+    num = int(num)
+    if num >= len(scores):
+        return np.arange(len(scores))
+    if num <= 0:
+        return np.zeros(0, dtype=np.intp)
+    keep = np.zeros(len(scores), dtype=bool)
+    keep[np.argpartition(-scores, num-1)[:num]] = True
+    return np.flatnonzero(keep)
+
+
+def select_heliostats(position, num, sun_vecs, plant, model='hflcal', weights=None):
+    '''
+    Keep the num heliostats of highest annual efficiency of an oversized candidate field.
+
+    position: n x 3 candidate heliostat positions, m
+    num: number of selected heliostats
+    sun_vecs, plant, model, weights: see heliostat_efficiency
+
+    return: indices of the selected candidates (in the order of the candidates), n annual efficiencies of the candidates
+    '''
+    scores = heliostat_efficiency(position, sun_vecs, plant, model, weights)
+    return select_top(scores, num), scores
+
+
+if __name__ == "__main__":
+    """
+    Select the best heliostats of an oversized candidate layout of any generator, e.g.
+        python HeliostatSelection.py candidates.csv 6230 --plant Campo --model cosine --output layout.csv
+    the heliostat and receiver parameters are those of a plant of Plants.py.
+    """
+    import argparse
+    import time
+    from LayoutTools import load_layout, layout_positions, write_layout
+    from LayoutTools.Plants import PLANTS
+
+    parser = argparse.ArgumentParser(description='Keep the N best heliostats of an oversized candidate layout.')
+    parser.add_argument('candidates', help='candidate layout file')
+    parser.add_argument('num', type=int, help='number of selected heliostats')
+    parser.add_argument('--plant', choices=sorted(PLANTS), default='Gemasolar', help='heliostat and receiver parameters')
+    parser.add_argument('--model', choices=MODELS, default='hflcal', help='efficiency model')
+    parser.add_argument('--latitude', type=float, default=None, help='latitude, deg, None for the latitude of the plant')
+    parser.add_argument('--step', type=int, default=7, help='days between the sun vectors, the hours are every hour')
+    parser.add_argument('--output', default='layout.csv', help='selected layout file')
+    args = parser.parse_args()
+
+    plant = PLANTS[args.plant]
+    try:
+        check_model(plant, args.model)
+    except ValueError as error:
+        parser.error(str(error))
+    latitude = args.latitude if args.latitude is not None else plant['latitude'] if plant['latitude'] is not None else 34.
+    layout = load_layout(args.candidates)
+    position = layout_positions(layout)
+
+    t0 = time.time()
+    keep, scores = select_heliostats(position, args.num, annual_sun_vectors(latitude, np.arange(1, 366, args.step)), plant, args.model)
+    print("%d of %d candidates selected (%.2f s), annual efficiency %.4f (candidates %.4f)"
+          % (len(keep), len(position), time.time()-t0, np.mean(scores[keep]), np.mean(scores)))
+    start = int(layout['id'][0]) if len(layout) > 0 else 1
+    write_layout(args.output, position[keep, 0], position[keep, 1], position[keep, 2], start=start)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Lightweight instrumentation of the layout generators: the duration of each stage and counters (zones, groups,
+candidates tried and accepted, collision checks, ..), exported as one structured record per run.
+
+The generators take an instrument argument, None for NULL_INSTRUMENT whose stages and counters do nothing, so the
+cost is near zero when the instrumentation is disabled. The hot loops count with local variables and report the
+counters once at the end of the loop.
+
+    >>> from LayoutTools import Instrument
+    >>> instrument = Instrument('campo')
+    >>> XX, YY = campo_field(34., 6230, 10., 10., 0., 250., 80., 1., 0., verbose=False, instrument=instrument)[:2]
+    >>> instrument.export('profile.jsonl')  # appends one JSON line
+"""
+
+import contextlib
+import json
+import time
+
+
+class Instrument:
+    '''
+    Durations of the stages and counters of a generator run.
+
+    name: name of the run, exported with the record
+    '''
+    enabled = True
+
+    def __init__(self, name=''):
+        self.name = name
+        self.stages = {}  # stage name -> [total seconds, number of calls]
+        self.counters = {}  # counter name -> value
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Time a stage, the durations and the calls of the stages with the same name are accumulated.
+        '''
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            stage = self.stages.setdefault(name, [0., 0])
+            stage[0] += time.perf_counter()-t0
+            stage[1] += 1
+
+    def count(self, name, value=1):
+        '''
+        Add value to a counter.
+        '''
+        self.counters[name] = self.counters.get(name, 0)+value
+
+    def record(self, **extra):
+        '''
+        The structured record of the run: name, stages {name: {seconds, calls}}, counters {name: value} and the extra fields.
+        '''
+        record = dict(name=self.name, timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                      stages={name: dict(seconds=seconds, calls=calls) for name, (seconds, calls) in self.stages.items()},
+                      counters=dict(self.counters))
+        record.update(extra)
+        return record
+
+    def export(self, sink, **extra):
+        '''
+        Export the record of the run to a sink.
+
+        sink: callable receiving the record (dict), file object, or path of a JSON lines file the record is appended to
+        extra: extra fields of the record, e.g. the parameters of the run
+
+        return: the record
+        '''
+        record = self.record(**extra)
+        export_record(record, sink)
+        return record
+
+    def reset(self):
+        '''
+        Clear the stages and the counters.
+        '''
+        self.stages.clear()
+        self.counters.clear()
+
+
+class NullInstrument(Instrument):
+    '''
+    Disabled instrument, its stages and counters do nothing.
+    '''
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def count(self, name, value=1):
+        pass
+
+
+_NULL_STAGE = contextlib.nullcontext()
+NULL_INSTRUMENT = NullInstrument()
+
+
+def export_record(record, sink):
+    '''
+    Export a record to a sink, see Instrument.export.
+    '''
+    if callable(sink):
+        sink(record)
+    elif hasattr(sink, 'write'):
+        sink.write(json.dumps(record, default=str)+'\n')
+    else:
+        with open(sink, 'a') as output_file:
+            output_file.write(json.dumps(record, default=str)+'\n')
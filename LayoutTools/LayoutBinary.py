@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Binary columnar layout format (.hfl), for very large heliostat fields.
+
+    +----------------------------------------------------------------------+
+    | preamble, 24 bytes: magic b'HFLAYOUT', version (uint32),             |
+    |                     header length (uint32), data offset (uint64)     |
+    | header, JSON (utf-8): count, columns (name, dtype, offset), units,    |
+    |                       heliostat dimensions, site metadata             |
+    | data: the columns one after another, each one aligned to 64 bytes    |
+    +----------------------------------------------------------------------+
+
+The columns are opened through one numpy.memmap, so an analysis only reads the columns and ranges it touches.
+"""
+
+import json
+import struct
+import warnings
+import numpy as np
+
+MAGIC = b'HFLAYOUT'
+VERSION = 1
+PREAMBLE = struct.Struct('<8sIIQ')
+ALIGN = 64  # alignment of the header end and of each column, bytes
+
+# the dtype of the standard columns, the other columns are int64, float64 or fixed-width bytes
+COLUMN_DTYPE = {'id': np.int64, 'x': np.float64, 'y': np.float64, 'z': np.float64}
+
+
+def align(n):
+    '''
+    The smallest multiple of ALIGN not less than n.
+    '''
+    return (n+ALIGN-1)//ALIGN*ALIGN
+
+
+def write_layout_binary(filename, columns, units=None, heliostat=None, site=None):
+    '''
+    Write a layout to a binary columnar layout file.
+
+    filename: path of the binary layout file
+    columns: structured array (e.g. the result of load_layout), or dict of 1D arrays with the same length, e.g. {'id': .., 'x': .., 'y': .., 'z': ..}
+    units: units of the columns, e.g. {'x': 'm'}, by default x, y and z are in m
+    heliostat: heliostat dimensions, e.g. {'width': 10., 'height': 10.}
+    site: site metadata, e.g. {'latitude': 34., 'towerheight': 250.}
+    '''
+    if isinstance(columns, np.ndarray):
+        columns = {name: columns[name] for name in columns.dtype.names}
+
+    arrays = {}
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if values.dtype.kind == 'U':
+            values = np.char.encode(values, 'utf-8')
+        arrays[name] = np.ascontiguousarray(values.reshape(-1))
+    count = len(next(iter(arrays.values()))) if len(arrays) > 0 else 0
+    for name in arrays:
+        if len(arrays[name]) != count:
+            raise ValueError('the columns of the layout have different lengths: '+name)
+
+    header_columns = []
+    offset = 0
+    for name, values in arrays.items():
+        header_columns.append({'name': name, 'dtype': values.dtype.str, 'offset': offset})
+        offset = align(offset+values.nbytes)
+
+    if units is None:
+        units = {name: 'm' for name in ('x', 'y', 'z') if name in arrays}
+    header = json.dumps({'count': count, 'columns': header_columns, 'units': units,
+                         'heliostat': heliostat or {}, 'site': site or {}}).encode('utf-8')
+    data_offset = align(PREAMBLE.size+len(header))
+
+    with open(filename, "wb") as output_file:
+        output_file.write(PREAMBLE.pack(MAGIC, VERSION, len(header), data_offset))
+        output_file.write(header)
+        output_file.write(b'\0'*(data_offset-PREAMBLE.size-len(header)))
+        for values in arrays.values():
+            output_file.write(values.tobytes())
+            output_file.write(b'\0'*(align(values.nbytes)-values.nbytes))
+
+
+def read_header(filename):
+    '''
+    Read the header of a binary layout file.
+
+    return: header (dict), data offset (bytes)
+    '''
+    with open(filename, "rb") as input_file:
+        magic, version, header_length, data_offset = PREAMBLE.unpack(input_file.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError('not a binary layout file: '+filename)
+        if version > VERSION:
+            raise ValueError('unsupported binary layout version %d: %s' % (version, filename))
+        header = json.loads(input_file.read(header_length).decode('utf-8'))
+    return header, data_offset
+
+
+def open_layout_binary(filename, mode='r'):
+    '''
+    Open a binary layout file through numpy.memmap, no column is read until it is used.
+
+    filename: path of the binary layout file
+    mode: 'r' read-only, 'r+' the columns can be modified in place, 'c' copy-on-write
+
+    return: columns (dict of memory-mapped 1D arrays), header (dict)
+    '''
+    header, data_offset = read_header(filename)
+    buffer = np.memmap(filename, dtype=np.uint8, mode=mode)
+    count = header['count']
+
+    columns = {}
+    for column in header['columns']:
+        dtype = np.dtype(column['dtype'])
+        start = data_offset+column['offset']
+        columns[column['name']] = buffer[start:start+count*dtype.itemsize].view(dtype)
+    return columns, header
+
+
+def read_csv_columns(filename):
+    '''
+    Read all the columns of a layout.csv file, id is int64, x, y and z are float64,
+    the other columns are int64 or float64 if possible, or else fixed-width bytes (e.g. 'type' of SolarTwo).
+
+    return: columns, dict of 1D arrays in the order of the header
+    '''
+    with open(filename, "r") as input_file:
+        names = [name.strip() for name in input_file.readline().strip().split(',')]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # an empty layout only has the header
+        data = np.loadtxt(filename, delimiter=',', skiprows=1, dtype=str, ndmin=2).reshape(-1, len(names))
+
+    columns = {}
+    for k, name in enumerate(names):
+        values = np.char.strip(data[:, k])
+        if name.lower() in COLUMN_DTYPE:
+            columns[name] = values.astype(COLUMN_DTYPE[name.lower()])
+            continue
+        for dtype in (np.int64, np.float64):
+            try:
+                columns[name] = values.astype(dtype)
+                break
+            except ValueError:
+                pass
+        else:
+            columns[name] = np.char.encode(values, 'utf-8')
+    return columns
+
+
+def write_csv_columns(filename, columns):
+    '''
+    Write the columns of a layout to a layout.csv file, the floats are written with the shortest repr that round-trips.
+
+    filename: path of the layout.csv file
+    columns: dict of 1D arrays, e.g. the result of open_layout_binary
+    '''
+    texts = []
+    for values in columns.values():
+        if values.dtype.kind == 'S':
+            values = np.char.decode(values, 'utf-8')
+        texts.append([str(v) for v in values.tolist()])
+
+    with open(filename, "w") as output_file:
+        output_file.write(",".join(columns)+"\n")
+        output_file.write("".join([",".join(row)+"\n" for row in zip(*texts)]))
+
+
+def csv_to_binary(csv_file, binary_file, units=None, heliostat=None, site=None):
+    '''
+    Convert a layout.csv file to a binary layout file, all the columns of the csv file are kept.
+
+    csv_file: path of the layout.csv file
+    binary_file: path of the binary layout file
+    units, heliostat, site: metadata of the layout, see write_layout_binary
+    '''
+    write_layout_binary(binary_file, read_csv_columns(csv_file), units, heliostat, site)
+
+
+def binary_to_csv(binary_file, csv_file):
+    '''
+    Convert a binary layout file to a layout.csv file with the same columns.
+
+    binary_file: path of the binary layout file
+    csv_file: path of the layout.csv file
+    '''
+    columns, header = open_layout_binary(binary_file)
+    write_csv_columns(csv_file, columns)
+
+
+if __name__ == "__main__":
+    """
+    Convert between layout.csv and the binary layout format, the direction is given by the extension of the input file, e.g.
+        python LayoutBinary.py ../CrescentDunes/layout.csv layout.hfl
+        python LayoutBinary.py layout.hfl layout.csv
+    """
+    import sys
+    if len(sys.argv) != 3:
+        sys.stderr.write('usage: LayoutBinary.py input output\n')
+        sys.exit(1)
+    if sys.argv[1].lower().endswith('.csv'):
+        csv_to_binary(sys.argv[1], sys.argv[2])
+    else:
+        binary_to_csv(sys.argv[1], sys.argv[2])
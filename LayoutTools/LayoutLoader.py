@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import numpy as np
+from LayoutTools.LayoutWriter import open_layout_file
+
+# the layout of a heliostat field: id, position x, y and z (m) of each heliostat
+LAYOUT_DTYPE = np.dtype([('id', np.int64), ('x', np.float64), ('y', np.float64), ('z', np.float64)])
+
+
+def read_layout(filename):
+    '''
+    Parse a layout.csv file into a structured array, the schema is detected from the header.
+    The header names the columns, e.g. 'id,x,y' (Gemasolar), 'id,x,y,z' (NSTTF) or 'id,x,y,z,type' (SolarTwo),
+    the missing z is 0 and the other columns are ignored. A file without header has the columns id,x,y[,z].
+
+    filename: path of the layout file, gzip-compressed if it ends with '.gz'
+
+    return: layout, structured array of LAYOUT_DTYPE
+    '''
+    with open_layout_file(filename, "r") as input_file:
+        head = input_file.readline().strip()
+    names = [name.strip().lower() for name in head.split(',')]
+
+    try:
+        [float(name) for name in names]
+        # no header
+        skiprows = 0
+        names = ['id', 'x', 'y', 'z'][:len(names)]
+    except ValueError:
+        skiprows = 1
+    if 'x' not in names or 'y' not in names:
+        raise ValueError('no x and y columns in the layout file: '+filename)
+
+    columns = [name for name in LAYOUT_DTYPE.names if name in names]
+    data = np.loadtxt(filename, delimiter=',', skiprows=skiprows, ndmin=2,
+                      usecols=[names.index(name) for name in columns])
+
+    layout = np.zeros(len(data), dtype=LAYOUT_DTYPE)
+    layout['id'] = np.arange(1, len(data)+1)
+    for k, name in enumerate(columns):
+        layout[name] = data[:, k]
+    return layout
+
+
+def layout_positions(layout):
+    '''
+    Positions of the heliostats of a layout.
+
+    layout: structured array of LAYOUT_DTYPE (e.g. the result of load_layout), or n x 2 / n x 3 array of x, y[, z]
+
+    return: n x 3 array of x, y, z, m
+    '''
+    layout = np.asarray(layout)
+    if layout.dtype.names is not None:
+        return np.stack((layout['x'], layout['y'], layout['z']), axis=-1).astype(np.float64)
+    layout = layout.astype(np.float64).reshape(len(layout), -1)
+    position = np.zeros((len(layout), 3))
+    position[:, :layout.shape[1]] = layout[:, :3]
+    return position
+
+
+def layout_cache_file(filename):
+    '''
+    Path of the cache of the parsed layout file, next to the layout file.
+    '''
+    folder, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(folder, '.'+name+'.cache.npz')
+
+
+def file_digest(filename):
+    '''
+    SHA-1 hash of the content of a file.
+    '''
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as input_file:
+        for block in iter(lambda: input_file.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def save_cache(cache_file, **arrays):
+    '''
+    Save arrays to a .npz cache file, written to a temporary file of the same folder and moved in place,
+    so an interrupted write never leaves a truncated cache. The cache is optional, a failure to write it is ignored.
+
+    cache_file: path of the cache file
+    arrays: the arrays saved, see np.savez
+    '''
+    # a unique temporary file with the mode of any new file (0666 less the umask), not the 0600 of tempfile.mkstemp,
+    # so the cache of a shared checkout is readable by the other users
+    temporary = os.path.join(os.path.dirname(os.path.abspath(cache_file)),
+                             '.%d.%s.tmp.cache.npz' % (os.getpid(), os.urandom(6).hex()))
+    try:
+        handle = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    except OSError:
+        # e.g. the folder is read-only
+        return
+    try:
+        with os.fdopen(handle, "wb") as output_file:
+            np.savez(output_file, **arrays)
+        os.replace(temporary, cache_file)
+    except OSError:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+
+def load_layout(filename, cache=True):
+    '''
+    Load a layout file, the parsed layout is cached next to the layout file.
+    The cache is used if the modification time and the size of the layout file are unchanged,
+    or else if the content hash of the layout file is unchanged (e.g. the file was touched by git).
+
+    filename: path of the layout file
+    cache: use and update the cache or not
+
+    return: layout, structured array of LAYOUT_DTYPE
+    '''
+    if not cache:
+        return read_layout(filename)
+
+    cache_file = layout_cache_file(filename)
+    stat = os.stat(filename)
+    digest = None
+    try:
+        with np.load(cache_file) as data:
+            if int(data['mtime']) == stat.st_mtime_ns and int(data['size']) == stat.st_size:
+                return data['layout']
+            digest = file_digest(filename)
+            layout = data['layout'] if str(data['digest']) == digest else None
+    except Exception:
+        # a missing, truncated or corrupted cache is a cache miss
+        layout = None
+
+    if layout is None:
+        layout = read_layout(filename)
+    if digest is None:
+        digest = file_digest(filename)
+    save_cache(cache_file, layout=layout, mtime=stat.st_mtime_ns, size=stat.st_size, digest=digest)
+    return layout
+
+
+def show_layout(filename="./layout.csv", savefig=None, show=True):
+    '''
+    Show the top view of a heliostat field layout.
+
+    filename: path of the layout file
+    savefig: path of the saved figure, None to not save the figure
+    show: show the figure, False to only save it (the figure is closed)
+    '''
+    import matplotlib.pyplot as plt
+
+    layout = load_layout(filename)
+    plt.scatter(layout['x'], layout['y'], s=5.0)
+    ax = plt.gca()
+    ax.set_aspect(1)
+    if savefig is not None:
+        plt.savefig(savefig)
+    if show:
+        plt.show()
+    else:
+        plt.close()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Optimizer of the parameters of the layout generators of this repository (Campo, MUEEN, Biomimetic_Surround).
+
+Each generator is a family of layouts parameterised by a few numbers (e.g. fb and dsep of Campo, dS of MUEEN, a and b of
+the biomimetic spiral). A CMA-ES (Hansen, The CMA Evolution Strategy: A Tutorial, 2016) maximizes the annual field
+efficiency of the family (see AnnualLUT.field_efficiency) under a heliostat count and/or a land radius constraint.
+The candidates of a generation are evaluated in parallel by a process pool. The parameters are snapped to a resolution
+and every evaluated parameter vector is memoized, so repeated points and restarts cost nothing, and the state of the
+optimizer and the memo are saved to a checkpoint file after each generation, a run resumes from its checkpoint.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools.AnnualLUT import MODELS, check_model, field_efficiency
+from LayoutTools.CosineEfficiency import annual_sun_vectors
+from LayoutTools.Generators import generate_campo, generate_mueen, generate_biomimetic_surround
+from LayoutTools.HeliostatSelection import select_heliostats
+from LayoutTools.Plants import PLANTS
+
+# the days and the solar hour angles of the sun vectors of the annual efficiency
+DAYS = np.arange(15, 365, 61)
+OMEGA = np.arange(-150., 151., 30.)
+
+# the layout families: generator (see Generators.py), optimized parameters (lower bound, upper bound, resolution),
+# fixed parameters (the __main__ parameters of the generator), name of the heliostat count parameter, and plant (see
+# Plants.py, None if the generator has no plant: its tower and receiver are given by the plant argument of optimize)
+FAMILIES = {
+    'campo': dict(generator='campo', plant='Campo', count='num_hst',
+                  parameters=dict(fb=(0.2, 1., 0.01), dsep=(0., 5., 0.05), R1=(40., 160., 1.)),
+                  fixed=dict(num_hst=6230, width=10., height=10., hst_z=0., towerheight=250., R1=80., fb=1., dsep=0.)),
+    'mueen': dict(generator='mueen', plant='MUEEN', count='num_hst',
+                  parameters=dict(dS=(0., 2., 0.01), Rmin=(30., 120., 1.)),
+                  fixed=dict(num_hst=None, lm=np.sqrt(8.), wm=np.sqrt(8.), z0=7.3, fa=1., dS=1., lr=12., Ht=75.,
+                             BL=0., PSImax=np.pi, Rmax=3.2*75., Rmin=0.8*75.)),
+    'biomimetic': dict(generator='biomimetic_surround', plant=None, count='target_num',
+                       parameters=dict(a=(2., 8., 0.01), b=(0.4, 1., 0.005)),
+                       fixed=dict(target_num=1800, lm=4., wm=3.2, min_dis=np.sqrt(4.*4.+3.2*3.2)*1.5,
+                                  phi=(1.+np.sqrt(5.))/2., a=4.5, b=0.65)),
+}
+
+
+def family_plant(family, params, plant=None):
+    '''
+    Heliostat and receiver parameters of a layout of a family, the heliostat size and the aim point follow the generator
+    parameters (Campo and MUEEN generate the field of their own tower), the other parameters are those of the plant.
+
+    family: name of the layout family, see FAMILIES
+    params: all the parameters of the generator, dict
+    plant: name of a plant of Plants.PLANTS or dict of its parameters, None for the plant of the family
+
+    return: plant, dict (see Plants.py)
+    '''
+    plant = FAMILIES[family]['plant'] if plant is None else plant
+    if plant is None:
+        raise ValueError('the layout family '+family+' has no plant, give the plant of its tower and receiver, '
+                         'e.g. --plant PS10 (see Plants.py)')
+    if not isinstance(plant, dict):
+        if plant not in PLANTS:
+            raise ValueError('unknown plant: '+str(plant))
+        plant = PLANTS[plant]
+    plant = dict(plant)
+    if family == 'campo':
+        plant.update(width=params['width'], height=params['height'], aim=(0., 0., params['towerheight']))
+    elif family == 'mueen':
+        plant.update(width=params['wm'], height=params['lm'], aim=(0., 0., params['Ht']))
+    else:
+        plant.update(width=params['wm'], height=params['lm'])
+    return plant
+
+
+def family_layout(family, params, latitude):
+    '''
+    Generate a layout of a family in memory, no file or plot is produced.
+
+    family: name of the layout family, see FAMILIES
+    params: all the parameters of the generator, dict
+    latitude: latitude of the field location, deg (used by Campo to grow the field)
+
+    return: n x 3 heliostat positions, m
+    '''
+    if family == 'campo':
+        return generate_campo(latitude, *[params[name] for name in
+                                          ('num_hst', 'width', 'height', 'hst_z', 'towerheight', 'R1', 'fb', 'dsep')])
+    if family == 'mueen':
+        layout = generate_mueen(*[params[name] for name in
+                                  ('lm', 'wm', 'z0', 'fa', 'dS', 'lr', 'Ht', 'BL', 'PSImax', 'Rmax', 'Rmin')])
+        # the rings are placed from the tower outwards, the count constraint keeps the inner heliostats
+        return layout if params['num_hst'] is None else layout[:int(params['num_hst'])]
+    return generate_biomimetic_surround(int(params['target_num']), params['min_dis'], params['phi'], params['a'], params['b'],
+                                        block_size=4096)
+
+
+def family_field(family, params, latitude, sun_vecs, model='geometric', oversize=None, plant=None):
+    '''
+    Generate a layout of a family, optionally over-generated with oversize times the heliostat count and reduced to the
+    heliostats of highest annual efficiency (see HeliostatSelection.py).
+
+    family, params, latitude: see family_layout
+    sun_vecs, model: sun vectors and efficiency model of the selection, see HeliostatSelection.heliostat_efficiency
+    oversize: oversize factor of the heliostat count, None to keep the layout of the generator
+    plant: plant of the selection, see family_plant
+
+    return: n x 3 heliostat positions, m
+    '''
+    count = FAMILIES[family]['count']
+    target = params[count]
+    if oversize is None or target is None:
+        return family_layout(family, params, latitude)
+    params = dict(params)
+    params[count] = int(np.ceil(target*oversize))
+    position = family_layout(family, params, latitude)
+    return position[select_heliostats(position, target, sun_vecs, family_plant(family, params, plant), model)[0]]
+
+
+# the state shared by all the evaluations of a worker process, set once by init_worker
+_shared = {}
+
+
+def init_worker(family, fixed, latitude, sun_vecs, model, land_radius, oversize, plant=None):
+    '''
+    Initialize a worker process of the optimizer, the fixed parameters and the sun vectors are sent once per worker.
+    '''
+    _shared.update(family=family, fixed=fixed, latitude=latitude, sun_vecs=sun_vecs, model=model, land_radius=land_radius,
+                   oversize=oversize, plant=plant)
+
+
+def evaluate(params):
+    '''
+    Generate and evaluate one layout of the optimizer.
+
+    params: the optimized parameters of this evaluation, dict
+
+    return: objective (annual field efficiency minus the constraint penalties), annual field efficiency, heliostat count, field radius (m)
+    '''
+    family = _shared['family']
+    kwargs = dict(_shared['fixed'])
+    kwargs.update(params)
+    target = kwargs[FAMILIES[family]['count']]
+    plant = family_plant(family, kwargs, _shared['plant'])
+    position = family_field(family, kwargs, _shared['latitude'], _shared['sun_vecs'], _shared['model'], _shared['oversize'],
+                            _shared['plant'])
+    num = len(position)
+    if num == 0:
+        return -1., 0., 0, 0.
+    radius = float(np.max(np.hypot(position[:, 0], position[:, 1])))
+    efficiency = float(np.mean(field_efficiency(position, _shared['sun_vecs'], plant, _shared['model'])))
+
+    # the penalties are relative violations of the constraints
+    objective = efficiency
+    if target is not None:
+        objective -= max(0., 1.-num/float(target))
+    if _shared['land_radius'] is not None:
+        objective -= max(0., radius/_shared['land_radius']-1.)
+    return objective, efficiency, num, radius
+
+
+def save_checkpoint(filename, state):
+    '''
+    Save the state of the optimizer, written to a temporary file first so an interrupted run keeps its last checkpoint.
+    '''
+    temporary = filename+'.tmp'
+    with open(temporary, 'wb') as output_file:
+        np.savez(output_file, **state)
+    os.replace(temporary, filename)
+
+
+def optimize(family, latitude=34., num=None, land_radius=None, model='geometric', fixed=None, bounds=None,
+             generations=20, popsize=None, sigma=0.3, processes=None, checkpoint=None, seed=0,
+             days=None, omega=None, oversize=None, verbose=True, plant=None):
+    '''
+    Maximize the annual field efficiency of a layout family over its parameters by CMA-ES.
+
+    family: name of the layout family, 'campo', 'mueen' or 'biomimetic', see FAMILIES
+    latitude: latitude of the field location, deg
+    num: heliostat count constraint, the count parameter of the generator (None for the default of the family),
+         a layout with fewer heliostats is penalized
+    land_radius: land constraint, maximum field radius, m, None for no land constraint
+    model: efficiency model, see AnnualLUT.field_efficiency, 'geometric' needs no receiver
+    fixed: values of the fixed parameters of the generator, dict, overriding the defaults of the family
+    bounds: (lower, upper, resolution) of the optimized parameters, dict, overriding the defaults of the family,
+            the parameters not in FAMILIES[family]['parameters'] are added to the optimized parameters
+    generations: number of generations (including the generations of the checkpoint)
+    popsize: number of candidates of a generation, None for 4+3ln(k) with k optimized parameters
+    sigma: initial step size, relative to the parameter ranges
+    processes: number of worker processes, None for the number of CPUs
+    checkpoint: checkpoint file (.npz), the run resumes from it if it exists, None for no checkpoint
+    seed: seed of the random generator
+    days, omega: sun vectors of the annual efficiency, see CosineEfficiency.annual_sun_vectors,
+                 None for 6 days and the hours every 2 hours
+    oversize: generate oversize times the heliostat count and keep the best heliostats (see HeliostatSelection.py),
+              None to keep the layout of the generator
+    verbose: print the progress or not
+    plant: name of a plant of Plants.PLANTS (or dict of its parameters) giving the receiver (and the tower of the
+           biomimetic family), None for the plant of the family, see family_plant
+
+    return: dict of the results
+      * names (k): names of the optimized parameters
+      * best: best parameters, dict, and objective, efficiency, num, radius of the best layout
+      * history: best objective of each generation
+      * evaluations, cached: number of evaluated layouts and of memoized candidates
+    '''
+    if family not in FAMILIES:
+        raise ValueError('unknown layout family: '+str(family))
+    parameters = dict(FAMILIES[family]['parameters'])
+    parameters.update(bounds or {})
+    names = list(parameters)
+    lower, upper, resolution = [np.array([parameters[name][i] for name in names], dtype=float) for i in range(3)]
+    params_fixed = dict(FAMILIES[family]['fixed'])
+    params_fixed.update(fixed or {})
+    if num is not None:
+        params_fixed[FAMILIES[family]['count']] = int(num)
+    # an incompatible family, plant and model fails here, not in the worker processes
+    check_model(family_plant(family, params_fixed, plant), model)
+
+    days = DAYS if days is None else days
+    omega = OMEGA if omega is None else omega
+    sun_vecs = annual_sun_vectors(latitude, days, omega)
+
+    # the constants of CMA-ES
+    k = len(names)
+    lam = int(popsize) if popsize is not None else 4+int(3*np.log(k))
+    mu = lam//2
+    w = np.log(mu+0.5)-np.log(np.arange(1, mu+1))
+    w /= np.sum(w)
+    mueff = 1./np.sum(w*w)
+    cc = (4.+mueff/k)/(k+4.+2.*mueff/k)
+    cs = (mueff+2.)/(k+mueff+5.)
+    c1 = 2./((k+1.3)**2+mueff)
+    cmu = min(1.-c1, 2.*(mueff-2.+1./mueff)/((k+2.)**2+mueff))
+    damps = 1.+2.*max(0., np.sqrt((mueff-1.)/(k+1.))-1.)+cs
+    chiN = np.sqrt(k)*(1.-1./(4.*k)+1./(21.*k*k))
+
+    # the state of CMA-ES, in the parameter space normalized to [0, 1]
+    settings = json.dumps([family, latitude, model, params_fixed, parameters, lam, sigma, seed, oversize, plant,
+                           np.asarray(days).tolist(), np.asarray(omega).tolist()], sort_keys=True, default=str)
+    rng = np.random.default_rng(seed)
+    mean = np.clip((np.array([params_fixed.get(name, 0.) for name in names])-lower)/(upper-lower), 0., 1.)
+    step = float(sigma)
+    C = np.eye(k)
+    pc = np.zeros(k)
+    ps = np.zeros(k)
+    generation = 0
+    memo = {}  # snapped parameters (resolution steps) -> objective, efficiency, num, radius
+    history = []
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with np.load(checkpoint) as data:
+            if str(data['settings']) != settings:
+                raise ValueError('the checkpoint '+checkpoint+' was written with other settings')
+            mean, C, pc, ps = data['mean'], data['C'], data['pc'], data['ps']
+            step = float(data['sigma'])
+            generation = int(data['generation'])
+            rng.bit_generator.state = json.loads(str(data['rng']))
+            memo = {tuple(key): tuple(value) for key, value in zip(data['memo_keys'].tolist(), data['memo_values'].tolist())}
+            history = data['history'].tolist()
+        if verbose:
+            print('resume from %s, generation %d, %d memoized layouts' % (checkpoint, generation, len(memo)))
+
+    evaluations = 0
+    cached = 0
+    with Pool(processes, initializer=init_worker, initargs=(family, params_fixed, latitude, sun_vecs, model, land_radius, oversize, plant)) as pool:
+        while generation < generations:
+            t0 = time.time()
+            eigenvalues, B = np.linalg.eigh(C)
+            D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+            z = rng.standard_normal((lam, k))
+            y = (z*D) @ B.T
+            x = mean+step*y
+
+            # the candidates are snapped to the resolution of the parameters, and only the new ones are evaluated
+            inside = np.clip(x, 0., 1.)
+            keys = [tuple(key) for key in np.rint(inside*(upper-lower)/resolution).astype(int).tolist()]
+            todo = list(dict.fromkeys(key for key in keys if key not in memo))
+            tasks = [dict(zip(names, np.minimum(lower+np.array(key)*resolution, upper).tolist())) for key in todo]
+            for key, result in zip(todo, pool.map(evaluate, tasks)):
+                memo[key] = result
+            evaluations += len(todo)
+            cached += lam-len(todo)
+
+            # minimize the negative objective, the candidates outside the bounds are penalized by their distance to the bounds
+            fitness = np.array([-memo[key][0] for key in keys])+np.sum((x-inside)**2, axis=1)
+            order = np.argsort(fitness)
+            old = mean
+            mean = w @ x[order[:mu]]
+            ymean = (mean-old)/step
+            invsqrtC = (B/D) @ B.T
+            ps = (1.-cs)*ps+np.sqrt(cs*(2.-cs)*mueff)*(invsqrtC @ ymean)
+            hsig = np.linalg.norm(ps)/np.sqrt(1.-(1.-cs)**(2*(generation+1)))/chiN < 1.4+2./(k+1.)
+            pc = (1.-cc)*pc+hsig*np.sqrt(cc*(2.-cc)*mueff)*ymean
+            yk = y[order[:mu]]
+            C = ((1.-c1-cmu)*C+c1*(np.outer(pc, pc)+(1.-hsig)*cc*(2.-cc)*C)
+                 + cmu*(yk.T*w) @ yk)
+            C = 0.5*(C+C.T)
+            step *= np.exp((cs/damps)*(np.linalg.norm(ps)/chiN-1.))
+            generation += 1
+
+            best_key = max(memo, key=lambda key: memo[key][0])
+            history.append(memo[best_key][0])
+            if verbose:
+                best = lower+np.array(best_key)*resolution
+                print('generation %d: best objective %.5f (%s), %d evaluated, %d memoized, %.2f s'
+                      % (generation, memo[best_key][0], ' '.join(['%s=%g' % item for item in zip(names, best)]),
+                         len(todo), lam-len(todo), time.time()-t0))
+            if checkpoint is not None:
+                save_checkpoint(checkpoint, dict(
+                    settings=settings, names=np.array(names), mean=mean, C=C, pc=pc, ps=ps, sigma=step,
+                    generation=generation, rng=json.dumps(rng.bit_generator.state), history=np.array(history),
+                    memo_keys=np.array(list(memo), dtype=int).reshape(len(memo), k),
+                    memo_values=np.array(list(memo.values()), dtype=float).reshape(len(memo), 4)))
+
+    if len(memo) == 0:
+        raise ValueError('no layout evaluated, increase the number of generations')
+    best_key = max(memo, key=lambda key: memo[key][0])
+    objective, efficiency, count, radius = memo[best_key]
+    best = dict(zip(names, np.minimum(lower+np.array(best_key)*resolution, upper).tolist()))
+    return dict(names=names, best=best, objective=objective, efficiency=efficiency, num=int(count), radius=radius,
+                history=history, evaluations=evaluations, cached=cached, fixed=params_fixed)
+
+
+if __name__ == "__main__":
+    """
+    Optimize the parameters of a layout family, e.g.
+        python LayoutOptimizer.py campo --num 3000 --land 900 --generations 20 --checkpoint campo.opt.npz --output layout.csv
+        python LayoutOptimizer.py mueen --num 2000 --set Rmax=400
+        python LayoutOptimizer.py biomimetic --plant PS10 --model optical
+    a run interrupted (or extended with more generations) resumes from its checkpoint.
+    """
+    from LayoutTools import write_layout
+
+    parser = argparse.ArgumentParser(description='CMA-ES optimizer of the parameters of a layout family.')
+    parser.add_argument('family', choices=sorted(FAMILIES), help='layout family')
+    parser.add_argument('--latitude', type=float, default=34., help='latitude of the field location, deg')
+    parser.add_argument('--num', type=int, default=None, help='heliostat count constraint')
+    parser.add_argument('--land', type=float, default=None, help='land constraint, maximum field radius, m')
+    parser.add_argument('--model', choices=MODELS, default='geometric', help='efficiency model')
+    parser.add_argument('--plant', choices=sorted(PLANTS), default=None,
+                        help='plant of the receiver (and of the tower of the biomimetic family), see Plants.py')
+    parser.add_argument('--set', nargs='+', default=[], metavar='NAME=VALUE', help='fixed parameters of the generator')
+    parser.add_argument('--generations', type=int, default=20, help='number of generations')
+    parser.add_argument('--popsize', type=int, default=None, help='number of candidates of a generation')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file, .npz')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    parser.add_argument('--oversize', type=float, default=None, help='generate oversize times the heliostats and keep the best')
+    parser.add_argument('--output', default=None, help='write the best layout to this layout file')
+    args = parser.parse_args()
+
+    fixed = {name: float(value) for name, value in [item.split('=', 1) for item in args.set]}
+    params = dict(FAMILIES[args.family]['fixed'])
+    params.update(fixed)
+    try:
+        check_model(family_plant(args.family, params, args.plant), args.model)
+    except ValueError as error:
+        parser.error(str(error))
+    t0 = time.time()
+    result = optimize(args.family, args.latitude, args.num, args.land, args.model, fixed, None, args.generations,
+                      args.popsize, processes=args.processes, checkpoint=args.checkpoint, seed=args.seed,
+                      oversize=args.oversize, plant=args.plant)
+    print('best parameters:', ' '.join(['%s=%g' % item for item in result['best'].items()]))
+    print('annual efficiency %.5f, objective %.5f, %d heliostats, field radius %.1f m'
+          % (result['efficiency'], result['objective'], result['num'], result['radius']))
+    print('%d layouts evaluated, %d memoized candidates, %.2f s' % (result['evaluations'], result['cached'], time.time()-t0))
+
+    if args.output is not None:
+        params = dict(result['fixed'])
+        params.update(result['best'])
+        position = family_field(args.family, params, args.latitude, annual_sun_vectors(args.latitude, DAYS, OMEGA),
+                                args.model, args.oversize, args.plant)
+        write_layout(args.output, position[:, 0], position[:, 1], position[:, 2])
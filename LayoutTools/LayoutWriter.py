@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import gzip
+import numpy as np
+
+
+def open_layout_file(filename, mode="r", compress=None):
+    '''
+    Open a layout file as text, a file ending with '.gz' is gzip-compressed.
+
+    filename: path of the layout file
+    mode: 'r' or 'w'
+    compress: gzip-compressed or not, None to decide by the extension of the file
+    '''
+    if compress is None:
+        compress = str(filename).endswith('.gz')
+    if compress:
+        return gzip.open(filename, mode+"t", compresslevel=6)
+    return open(filename, mode)
+
+
+def write_layout(filename, x, y, z=0.0, start=1, precision=None, chunk=1 << 16, compress=None, ids=None):
+    '''
+    Write a heliostat field layout to a layout.csv file 'id,x,y,z'.
+    The rows are formatted a chunk at a time with one string formatting of the whole chunk,
+    so the memory is bounded by the chunk size whatever the number of heliostats.
+
+    filename: path of the layout file, e.g. 'layout.csv' or 'layout.csv.gz'
+    x, y, z: positions of the heliostats, arrays (or scalars for a constant column, e.g. z=0.0), m
+    start: id of the first heliostat
+    precision: number of digits after the decimal point, None for the shortest repr that round-trips (as str(x))
+    chunk: number of rows formatted and written at a time
+    compress: gzip-compressed or not, None to decide by the extension of the file
+    ids: ids of the heliostats, None for consecutive ids from start
+    '''
+    x = np.asarray(x).reshape(-1)
+    n = len(x)
+    if ids is None:
+        ids = range(start, start+n)
+    else:
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1).tolist()
+        if len(ids) != n:
+            raise ValueError('the ids and the coordinates of the layout have different lengths')
+    value_fmt = "%r" if precision is None else "%."+str(int(precision))+"f"
+
+    # a constant column (a scalar, e.g. z=0.0) is formatted once into the row format
+    fmt = "%d"
+    columns = []
+    for values in (x, y, z):
+        values = np.asarray(values)
+        if values.ndim == 0:
+            fmt += ","+(value_fmt % values.item()).replace("%", "%%")
+        else:
+            fmt += ","+value_fmt
+            columns.append(values.reshape(-1))
+    fmt += "\n"
+    for values in columns:
+        if len(values) != n:
+            raise ValueError('the coordinates of the layout have different lengths')
+
+    with open_layout_file(filename, "w", compress) as output_file:
+        output_file.write("id,x,y,z\n")
+        for begin in range(0, n, chunk):
+            end = min(begin+chunk, n)
+            rows = zip(ids[begin:end], *[values[begin:end].tolist() for values in columns])
+            output_file.write("".join(map(fmt.__mod__, rows)))
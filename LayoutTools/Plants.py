@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Parameters of the heliostat fields of this repository, from the parameters.xlsx of each folder
+and from the __main__ parameters of the layout generators, used to evaluate the layouts.
+
+    folder: folder of the layout.csv
+    latitude: latitude of the field location, deg, None if unknown
+    width, height: heliostat width and height, m
+    reflectivity: facet reflectance
+    slope_error, tracking_error: slope and tracking standard deviation, mrad
+    aim: aim point (receiver center), m
+    receiver: 'cylinder' (external) or 'flat' (cavity aperture)
+    receiver_radius: radius of the cylinder receiver, m
+    receiver_width, receiver_height: width and height of the flat receiver aperture, or height of the cylinder receiver, m
+    receiver_tilt: tilt angle of the flat receiver aperture below the horizontal, deg
+    dni: annual DNI, kWh/m2
+The parameters which are not given in this repository are None.
+"""
+
+PLANTS = {
+    '6282': dict(folder='6282', latitude=None, width=12.2, height=12.2, reflectivity=0.875425,
+                 slope_error=2.16375, tracking_error=0., aim=(0., 0., 180.),
+                 receiver='cylinder', receiver_radius=7.75, receiver_height=22., dni=None),
+    'Gemasolar': dict(folder='Gemasolar', latitude=37.56, width=9.752, height=12.305, reflectivity=0.93,
+                      slope_error=1.45, tracking_error=0., aim=(0., 0., 116.),
+                      receiver='cylinder', receiver_radius=4., receiver_height=16., dni=2324.),
+    'PS10': dict(folder='PS10', latitude=37.43, width=12.84, height=9.45, reflectivity=0.88,
+                 slope_error=2.6, tracking_error=1.3, aim=(0., 0., 100.5),
+                 receiver='flat', receiver_width=4*5.4, receiver_height=12., receiver_tilt=12.5, dni=2348.),
+    'Campo': dict(folder='Campo', latitude=34., width=10., height=10., reflectivity=None,
+                  slope_error=None, tracking_error=None, aim=(0., 0., 250.),
+                  receiver=None, dni=None),
+    'MUEEN': dict(folder='MUEEN', latitude=None, width=2.828427, height=2.828427, reflectivity=None,
+                  slope_error=None, tracking_error=None, aim=(0., 0., 75.),
+                  receiver='cylinder', receiver_radius=4., receiver_height=12., dni=None),
+}
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Monte-Carlo ray tracer of a heliostat field and its receiver, in NumPy ray batches.
+
+Each ray starts at a uniform random point of a heliostat, its direction is sampled around the sun vector from the
+sunshape, it is reflected by the heliostat surface (paraboloid focused at the slant range, perturbed by the slope error)
+and intersected with the receiver (cylinder or flat aperture). Each ray carries DNI x area x cos(incidence) / rays.
+The shading and blocking between heliostats are not traced (see ShadingBlocking.py).
+The heliostats are split into subsets traced by a process pool, each worker has its own random stream spawned from the seed,
+so the result only depends on the seed and the number of subsets.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from multiprocessing import Pool
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools.ShadingBlocking import heliostat_frames
+
+# the default sunshape, a pillbox of 4.65 mrad half width, same keys as the SUN record of SolTrace.read_stinput
+PILLBOX = {'shape': 'p', 'halfwidth': 4.65, 'sigma': 0., 'user_shape': np.zeros((0, 2))}
+
+
+class SunShapeSampler:
+    '''
+    Sampler of the angle between a sun ray and the sun vector, for a sunshape of SolTrace:
+    'p' pillbox of halfwidth, 'g' gaussian of sigma, 'd' user table of (angle, intensity), mrad.
+    The user table is a radial intensity profile, the angle is sampled from the inverse cumulative distribution of intensity x angle.
+
+    sunshape: dict with the keys shape, halfwidth, sigma and user_shape, e.g. the SUN record of SolTrace.read_stinput
+    '''
+
+    def __init__(self, sunshape):
+        self.shape = sunshape['shape']
+        self.halfwidth = sunshape.get('halfwidth', 0.)*1e-3
+        self.sigma = sunshape.get('sigma', 0.)*1e-3
+        if self.shape == 'd':
+            table = np.asarray(sunshape['user_shape'], dtype=float)
+            angle = np.linspace(0., table[-1, 0], 4096)
+            pdf = np.interp(angle, table[:, 0], table[:, 1])*angle
+            cdf = np.concatenate(([0.], np.cumsum(0.5*(pdf[1:]+pdf[:-1])*np.diff(angle))))
+            self.angle = angle*1e-3
+            self.cdf = cdf/cdf[-1]
+        elif self.shape not in ('p', 'g'):
+            raise ValueError('unknown sunshape: '+str(self.shape))
+
+    def sample(self, rng, n):
+        '''
+        n random angles between the sun rays and the sun vector, rad
+        '''
+        if self.shape == 'p':
+            return self.halfwidth*np.sqrt(rng.random(n))
+        if self.shape == 'g':
+            return self.sigma*np.sqrt(-2.*np.log(1.-rng.random(n)))
+        return np.interp(rng.random(n), self.cdf, self.angle)
+
+
+def perturb(direction, theta, phi):
+    '''
+    Rotate a unit direction by the angles theta (from the direction) and phi (around the direction).
+
+    direction: 3 (the same for all the rays) unit vector
+    theta, phi: n angles, rad
+
+    return: n x 3 unit vectors
+    '''
+    e1 = np.array([-direction[1], direction[0], 0.])
+    if np.hypot(e1[0], e1[1]) < 1e-12:
+        e1 = np.array([1., 0., 0.])
+    e1 /= np.linalg.norm(e1)
+    e2 = np.cross(direction, e1)
+    sin_theta = np.sin(theta)
+    return (np.cos(theta)[:, None]*direction+(sin_theta*np.cos(phi))[:, None]*e1+(sin_theta*np.sin(phi))[:, None]*e2)
+
+
+def receiver_hits(origin, ray, receiver, aim, bins):
+    '''
+    Intersection of the reflected rays with the receiver.
+
+    origin, ray: m x 3 ray origins and unit directions
+    receiver: parameters of the receiver, dict with the keys receiver, receiver_radius, receiver_width, receiver_height,
+              receiver_tilt, receiver_facing (see HFLCAL.receiver_silhouette)
+    aim: center of the receiver, m
+    bins: number of bins of the flux map (horizontal, vertical)
+
+    return: hit (m booleans), bin index of the flux map of the hits (m, -1 for the misses)
+    '''
+    aim = np.asarray(aim, dtype=float)
+    o = origin-aim
+    height = receiver['receiver_height']
+    if receiver['receiver'] == 'cylinder':
+        radius = receiver['receiver_radius']
+        a = ray[:, 0]*ray[:, 0]+ray[:, 1]*ray[:, 1]
+        b = o[:, 0]*ray[:, 0]+o[:, 1]*ray[:, 1]
+        c = o[:, 0]*o[:, 0]+o[:, 1]*o[:, 1]-radius*radius
+        disc = b*b-a*c
+        t = (-b-np.sqrt(np.maximum(disc, 0.)))/np.maximum(a, 1e-300)
+        point = o+t[:, None]*ray
+        hit = (disc > 0.) & (t > 0.) & (np.abs(point[:, 2]) <= 0.5*height)
+        ix = ((np.arctan2(point[:, 1], point[:, 0])+np.pi)/(2.*np.pi)*bins[0]).astype(int)
+        iy = ((point[:, 2]/height+0.5)*bins[1]).astype(int)
+    else:
+        facing = np.asarray(receiver.get('receiver_facing', (0., 1., 0.)), dtype=float)
+        facing = facing/np.hypot(facing[0], facing[1])
+        tilt = np.radians(receiver.get('receiver_tilt', 0.))
+        normal = np.array([facing[0]*np.cos(tilt), facing[1]*np.cos(tilt), -np.sin(tilt)])
+        e_w = np.array([-facing[1], facing[0], 0.])
+        e_h = np.cross(normal, e_w)
+        dn = ray @ normal
+        t = -(o @ normal)/np.where(dn < 0., dn, -1.)
+        point = o+t[:, None]*ray
+        pu, pv = point @ e_w, point @ e_h
+        width = receiver['receiver_width']
+        hit = (dn < 0.) & (t > 0.) & (np.abs(pu) <= 0.5*width) & (np.abs(pv) <= 0.5*height)
+        ix = ((pu/width+0.5)*bins[0]).astype(int)
+        iy = ((pv/height+0.5)*bins[1]).astype(int)
+    index = np.clip(ix, 0, bins[0]-1)*bins[1]+np.clip(iy, 0, bins[1]-1)
+    return hit, np.where(hit, index, -1)
+
+
+def trace_subset(position, sun_vec, plant, sunshape, rays_per_heliostat, dni, bins, batch, seed):
+    '''
+    Trace the rays of a subset of the heliostats.
+
+    position: k x 3 positions of the heliostats of the subset, m
+    sun_vec, plant, sunshape, rays_per_heliostat, dni, bins, batch: see trace_field
+    seed: numpy SeedSequence (or int) of the random stream of the subset
+
+    return: k intercepted powers (W), flux map power (bins, W), number of rays
+    '''
+    rng = np.random.default_rng(seed)
+    sampler = SunShapeSampler(sunshape)
+    sun_vec = np.asarray(sun_vec, dtype=float)/np.linalg.norm(sun_vec)
+    aim = np.asarray(plant['aim'], dtype=float)
+    width, height = plant['width'], plant['height']
+    slope = (plant.get('slope_error') or 0.)*1e-3
+    normal, u, v, reflected = heliostat_frames(position, sun_vec, aim)
+    focal = np.linalg.norm(aim-position, axis=-1)  # focused at the slant range
+
+    k = len(position)
+    power = np.zeros(k)
+    flux = np.zeros(bins[0]*bins[1])
+    ray_power = dni*width*height/rays_per_heliostat
+    heliostats_per_batch = max(1, batch//rays_per_heliostat)
+    for start in range(0, k, heliostats_per_batch):
+        index = np.repeat(np.arange(start, min(start+heliostats_per_batch, k)), rays_per_heliostat)
+        m = len(index)
+        s = (rng.random(m)-0.5)*width
+        t = (rng.random(m)-0.5)*height
+        origin = position[index]+s[:, None]*u[index]+t[:, None]*v[index]
+
+        # paraboloid of focal length f: the local normal tilts by (s, t)/(2f), then the slope error
+        tilt_u = -s/(2.*focal[index])+rng.normal(0., slope, m)
+        tilt_v = -t/(2.*focal[index])+rng.normal(0., slope, m)
+        n = normal[index]+tilt_u[:, None]*u[index]+tilt_v[:, None]*v[index]
+        n /= np.linalg.norm(n, axis=-1, keepdims=True)
+
+        incident = -perturb(sun_vec, sampler.sample(rng, m), 2.*np.pi*rng.random(m))
+        cos_incidence = -np.einsum('ij,ij->i', incident, n)
+        ray = incident+2.*cos_incidence[:, None]*n
+
+        hit, cell = receiver_hits(origin, ray, plant, aim, bins)
+        weight = np.where(hit & (cos_incidence > 0.), ray_power*cos_incidence*(plant.get('reflectivity') or 1.), 0.)
+        power += np.bincount(index, weights=weight, minlength=k)
+        flux += np.bincount(np.where(hit, cell, 0), weights=weight, minlength=len(flux))
+    return power, flux, k*rays_per_heliostat
+
+
+def _trace_subset(args):
+    return trace_subset(*args)
+
+
+def trace_field(position, sun_vec, plant, sunshape=None, rays_per_heliostat=1000, dni=1000., bins=(64, 32),
+                batch=1 << 18, processes=None, subsets=None, seed=0):
+    '''
+    Monte-Carlo ray tracing of a heliostat field for one sun vector.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vec: unit sun vector (x East, y North, z up)
+    plant: parameters of the heliostats and of the receiver, e.g. Plants.PLANTS['6282']
+    sunshape: sunshape, e.g. the SUN record of SolTrace.read_stinput, None for a pillbox of 4.65 mrad
+    rays_per_heliostat: number of rays traced from each heliostat
+    dni: direct normal irradiance, W/m2
+    bins: number of bins of the receiver flux map, (azimuth, height) of a cylinder or (width, height) of a flat aperture
+    batch: number of rays traced together
+    processes: number of worker processes, None for the number of CPUs, 1 to trace in this process
+    subsets: number of heliostat subsets, None for the number of processes
+    seed: seed of the random streams, one stream is spawned per subset
+
+    return: result dict
+      * power (n): power intercepted by the receiver from each heliostat, W
+      * intercept (n): intercepted power / power reflected by an ideal heliostat (DNI x area x cos x reflectivity)
+      * flux (bins): flux map of the receiver, W/m2
+      * rays, seconds, rays_per_second: number of rays traced, wall time and throughput
+    '''
+    position = np.asarray(position, dtype=float)
+    sunshape = PILLBOX if sunshape is None else sunshape
+    processes = os.cpu_count() if processes is None else processes
+    subsets = processes if subsets is None else subsets
+    seeds = np.random.SeedSequence(seed).spawn(subsets)
+    parts = np.array_split(np.arange(len(position)), subsets)
+    tasks = [(position[part], sun_vec, plant, sunshape, rays_per_heliostat, dni, bins, batch, seeds[k])
+             for k, part in enumerate(parts)]
+
+    t0 = time.time()
+    if processes == 1:
+        results = [_trace_subset(task) for task in tasks]
+    else:
+        with Pool(processes) as pool:
+            results = pool.map(_trace_subset, tasks)
+    seconds = time.time()-t0
+
+    power = np.concatenate([r[0] for r in results])
+    flux = np.sum([r[1] for r in results], axis=0).reshape(bins)
+    rays = sum([r[2] for r in results])
+
+    # the area of the cells of the flux map
+    if plant['receiver'] == 'cylinder':
+        cell = 2.*np.pi*plant['receiver_radius']/bins[0]*plant['receiver_height']/bins[1]
+    else:
+        cell = plant['receiver_width']/bins[0]*plant['receiver_height']/bins[1]
+    normal, u, v, reflected = heliostat_frames(position, np.asarray(sun_vec)/np.linalg.norm(sun_vec), plant['aim'])
+    ideal = dni*plant['width']*plant['height']*(plant.get('reflectivity') or 1.)*np.einsum('ij,j->i', normal, np.asarray(sun_vec)/np.linalg.norm(sun_vec))
+    return {'power': power, 'intercept': power/ideal, 'flux': flux/cell,
+            'rays': rays, 'seconds': seconds, 'rays_per_second': rays/seconds}
+
+
+if __name__ == "__main__":
+    """
+    Ray trace a layout of this repository, e.g.
+        python RayTracer.py 6282 --rays 200 --processes 4
+    the sun vector and the sunshape of the 6282 field are read from 6282.stinput.
+    """
+    import argparse
+    from LayoutTools import load_layout, layout_positions
+    from LayoutTools.Plants import PLANTS
+    from LayoutTools.SolTrace import read_stinput
+
+    parser = argparse.ArgumentParser(description='Monte-Carlo ray tracing of a heliostat field.')
+    parser.add_argument('plant', help='name of the layout in Plants.PLANTS, e.g. 6282 or Gemasolar')
+    parser.add_argument('--rays', type=int, default=1000, help='rays per heliostat')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--sun', type=float, nargs=3, default=None, help='sun vector, the equinox noon sun by default')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random streams')
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    plant = PLANTS[args.plant]
+    position = layout_positions(load_layout(os.path.join(root, plant['folder'], 'layout.csv')))
+    sunshape = None
+    sun_vec = args.sun
+    stinput = os.path.join(root, plant['folder'], plant['folder']+'.stinput')
+    if os.path.exists(stinput):
+        sun = read_stinput(stinput)[0]
+        sunshape = sun
+        if sun_vec is None:
+            sun_vec = sun['position']
+    if sun_vec is None:
+        latitude = np.radians(plant['latitude'] if plant['latitude'] is not None else 34.)
+        sun_vec = (0., -np.sin(latitude), np.cos(latitude))
+    sun_vec = np.asarray(sun_vec, dtype=float)/np.linalg.norm(sun_vec)
+
+    result = trace_field(position, sun_vec, plant, sunshape, args.rays, processes=args.processes, seed=args.seed)
+    print("heliostats:", len(position))
+    print("rays: %d in %.2f s, %.3g rays/s" % (result['rays'], result['seconds'], result['rays_per_second']))
+    print("intercepted power: %.4g MW, mean intercept: %.4f" % (np.sum(result['power'])/1e6, np.mean(result['intercept'])))
+    print("peak flux: %.4g kW/m2" % (np.max(result['flux'])/1e3))
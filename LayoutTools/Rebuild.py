@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Rebuild all the shipped layouts in one command: regenerate the algorithmic layouts (Campo, MUEEN, RadialStaggered,
+Biomimetic_Surround, Biomimetic_PS10-like) and check them against their shipped layout.csv, and render the layout.png
+of every layout folder (the folders with a main_show.py), in a process pool.
+
+The shipped layout.csv are reference data and are not rewritten by default: a regenerated layout is compared with its
+layout.csv heliostat by heliostat (matched by id, so the heliostats removed after the generation, e.g. the first
+heliostat of Biomimetic_Surround, next to the tower, are not compared) and the folder fails if a position differs by
+more than TOLERANCE. The shipped biomimetic layouts differ from the scripts run on another platform in the last digit
+(cos and sin of the libm), hence the tolerance. With write_layouts (--write-layouts) the layout.csv is rewritten with
+the regenerated positions of the heliostats it has, with their ids and the mode of the file, e.g. after a deliberate
+change of a generator.
+
+A folder is rebuilt only if its inputs changed since the last run: the SHA-1 of its layout.csv, of the generator script
+and its input files, of the LayoutTools modules used by the generation and the rendering, and the numpy and matplotlib
+versions. The hashes of the inputs and of the outputs of every folder are saved in .rebuild.cache.json at the root of
+the repository, and a folder whose layout.png was modified or removed since is rebuilt as well.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from functools import partial
+from multiprocessing import Pool
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools.Generators import GENERATORS
+from LayoutTools.LayoutLoader import file_digest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+STATE_FILE = '.rebuild.cache.json'
+
+# the LayoutTools modules used by the generation (this runner checks and writes the layout.csv) and by the rendering
+GENERATION_MODULES = ('Biomimetic.py', 'Generators.py', 'Instrument.py', 'LayoutWriter.py', 'Rebuild.py', 'SunPosition.py')
+RENDERING_MODULES = ('LayoutLoader.py', 'LayoutWriter.py')
+# the input files of a generator besides its script
+GENERATOR_INPUTS = {'biomimetic_ps10': ('layout_PS10_base.csv',)}
+# the layout.csv written by each generator script: id of the first heliostat (1 by default), and constant z column
+# (the z of the heliostat positions by default)
+LAYOUT_FORMAT = {'campo': dict(start=0), 'radial_staggered': dict(start=0, z=0)}
+# largest difference of a regenerated heliostat position with the shipped layout.csv, m
+TOLERANCE = 1e-6
+
+
+def layout_folders(root=ROOT):
+    '''
+    The layout folders of the repository, the folders with a main_show.py.
+    '''
+    return sorted(name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name, 'main_show.py')))
+
+
+def folder_generator(folder):
+    '''
+    Name of the generator of a layout folder (see Generators.GENERATORS), None if its layout.csv is not generated.
+    '''
+    for name, (generator_folder, _) in GENERATORS.items():
+        if generator_folder == folder:
+            return name
+    return None
+
+
+def folder_inputs(folder, root=ROOT):
+    '''
+    Hash of the inputs of the rebuild of a layout folder.
+
+    return: SHA-1 hex digest
+    '''
+    import matplotlib
+    import numpy as np
+    name = folder_generator(folder)
+    tools = os.path.join(root, 'LayoutTools')
+    files = [os.path.join(root, folder, 'layout.csv')]
+    if name is not None:
+        files += [os.path.join(root, folder, GENERATORS[name][1]+'.py')]
+        files += [os.path.join(root, folder, filename) for filename in GENERATOR_INPUTS.get(name, ())]
+        files += [os.path.join(tools, filename) for filename in GENERATION_MODULES]
+    files += [os.path.join(tools, filename) for filename in RENDERING_MODULES]
+
+    sha1 = hashlib.sha1(json.dumps([folder, np.__version__, matplotlib.__version__]).encode('utf-8'))
+    for filename in sorted(set(files)):
+        sha1.update(os.path.relpath(filename, root).encode('utf-8'))
+        sha1.update(file_digest(filename).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def folder_outputs(folder, root=ROOT):
+    '''
+    The output files of the rebuild of a layout folder, its layout.png (the layout.csv is an input).
+    '''
+    return [os.path.join(root, folder, 'layout.png')]
+
+
+def output_digests(folder, root=ROOT):
+    '''
+    SHA-1 of the output files of a layout folder, None for a missing file.
+    '''
+    return {os.path.basename(filename): file_digest(filename) if os.path.isfile(filename) else None
+            for filename in folder_outputs(folder, root)}
+
+
+def replace_file(temporary, filename):
+    '''
+    Move a temporary file in place of a file, with the mode of the file it replaces (if any).
+    '''
+    if os.path.isfile(filename):
+        shutil.copymode(filename, temporary)
+    os.replace(temporary, filename)
+
+
+def build_folder(folder, root=ROOT, write_layouts=False, tolerance=TOLERANCE):
+    '''
+    Rebuild one layout folder: regenerate it (if it is an algorithmic layout) and check it against its layout.csv,
+    and render its layout.png. The files are written next to their final path and moved in place, so an interrupted
+    build leaves no partial file, and a replaced file keeps its mode.
+
+    write_layouts: rewrite the layout.csv with the regenerated positions of its heliostats (same ids), instead of
+                   failing if a position differs by more than tolerance
+    tolerance: largest difference of a regenerated position with the layout.csv, m
+
+    return: dict of the folder, heliostats (count), max_abs_diff (largest difference of the regenerated positions with
+            the layout.csv, m, None if not generated), written (the layout.csv was rewritten), generate_seconds,
+            render_seconds, outputs (SHA-1 of the output files) and error (None, or the message of the exception)
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import numpy as np
+    from LayoutTools.Generators import generate
+    from LayoutTools.LayoutLoader import load_layout, layout_positions, show_layout
+    from LayoutTools.LayoutWriter import write_layout
+
+    result = dict(folder=folder, heliostats=0, max_abs_diff=None, written=False, generate_seconds=0., render_seconds=0.,
+                  outputs={}, error=None)
+    path = os.path.join(root, folder)
+    filename = os.path.join(path, 'layout.csv')
+    try:
+        name = folder_generator(folder)
+        t0 = time.perf_counter()
+        if name is not None:
+            position = generate(name)
+            layout = load_layout(filename, cache=False)
+            layout_format = LAYOUT_FORMAT.get(name, {})
+            # the heliostats of the layout.csv, matched by id
+            index = layout['id'].astype(np.int64)-layout_format.get('start', 1)
+            if len(index) == 0 or np.any((index < 0) | (index >= len(position))):
+                raise ValueError('the ids of layout.csv do not match the %d regenerated heliostats' % len(position))
+            position = position[index]
+            result['max_abs_diff'] = float(np.max(np.abs(layout_positions(layout)-position)))
+            if write_layouts:
+                temporary = os.path.join(path, '.layout.rebuild.csv')
+                write_layout(temporary, position[:, 0], position[:, 1], layout_format.get('z', position[:, 2]),
+                             ids=layout['id'])
+                replace_file(temporary, filename)
+                result['written'] = True
+            elif result['max_abs_diff'] > tolerance:
+                raise ValueError('the regenerated layout differs from layout.csv by %g m (tolerance %g m), '
+                                 'rebuild with --write-layouts to rewrite it' % (result['max_abs_diff'], tolerance))
+        t1 = time.perf_counter()
+
+        temporary = os.path.join(path, '.layout.rebuild.png')
+        show_layout(filename, savefig=temporary, show=False)
+        replace_file(temporary, os.path.join(path, 'layout.png'))
+        t2 = time.perf_counter()
+
+        result.update(heliostats=len(load_layout(filename)), generate_seconds=t1-t0, render_seconds=t2-t1,
+                      outputs=output_digests(folder, root))
+    except Exception as error:
+        result['error'] = '%s: %s' % (type(error).__name__, error)
+    return result
+
+
+def load_state(root=ROOT):
+    '''
+    The state of the last runs, {folder: {inputs, outputs, heliostats}}, empty if there is none.
+    '''
+    filename = os.path.join(root, STATE_FILE)
+    if not os.path.isfile(filename):
+        return {}
+    try:
+        with open(filename) as input_file:
+            return json.load(input_file)
+    except ValueError:
+        return {}
+
+
+def save_state(state, root=ROOT):
+    '''
+    Save the state of the runs, written to a temporary file and moved in place.
+    '''
+    filename = os.path.join(root, STATE_FILE)
+    temporary = filename+'.tmp'
+    with open(temporary, 'w') as output_file:
+        json.dump(state, output_file, indent=1, sort_keys=True)
+    os.replace(temporary, filename)
+
+
+def rebuild(folders=None, processes=None, force=False, write_layouts=False, root=ROOT, verbose=True):
+    '''
+    Rebuild the layout folders whose inputs or outputs changed since the last run, in a process pool.
+
+    folders: names of the layout folders, None for all of them (see layout_folders)
+    processes: number of worker processes, None for the number of CPUs
+    force: rebuild the folders even if they are unchanged
+    write_layouts: rewrite the layout.csv of the algorithmic layouts with the regenerated positions, see build_folder
+    root: root of the repository
+    verbose: print the folders as they are rebuilt
+
+    return: list of dict of the folder, status ('built', 'skipped' or 'failed'), heliostats, max_abs_diff, written,
+            generate_seconds, render_seconds and error, in the order of the folders
+    '''
+    folders = layout_folders(root) if folders is None else list(folders)
+    for folder in folders:
+        if not os.path.isfile(os.path.join(root, folder, 'main_show.py')):
+            raise ValueError('unknown layout folder: '+str(folder))
+    state = load_state(root)
+    inputs = {folder: folder_inputs(folder, root) for folder in folders}
+
+    results = {}
+    stale = []
+    for folder in folders:
+        last = state.get(folder)
+        if (not force and last is not None and last.get('inputs') == inputs[folder]
+                and last.get('outputs') == output_digests(folder, root)):
+            results[folder] = dict(folder=folder, status='skipped', heliostats=last.get('heliostats', 0),
+                                   max_abs_diff=last.get('max_abs_diff'), written=False, generate_seconds=0.,
+                                   render_seconds=0., error=None)
+        else:
+            stale.append(folder)
+
+    if len(stale) > 0:
+        with Pool(min(processes or os.cpu_count() or 1, len(stale))) as pool:
+            for result in pool.imap_unordered(partial(build_folder, root=root, write_layouts=write_layouts), stale):
+                folder = result['folder']
+                result['status'] = 'failed' if result['error'] is not None else 'built'
+                if result['error'] is None:
+                    # a rewritten layout.csv changed the inputs
+                    state[folder] = dict(inputs=folder_inputs(folder, root) if result['written'] else inputs[folder],
+                                         outputs=result['outputs'], heliostats=result['heliostats'],
+                                         max_abs_diff=result['max_abs_diff'])
+                    # saved after every folder, so an interrupted run keeps the folders already built
+                    save_state(state, root)
+                results[folder] = result
+                if verbose:
+                    print('%-22s %s' % (folder, result['status'] if result['error'] is None else 'FAILED '+result['error']),
+                          flush=True)
+    return [results[folder] for folder in folders]
+
+
+if __name__ == "__main__":
+    """
+    Rebuild all the shipped layouts, e.g.
+        python Rebuild.py
+        python Rebuild.py Campo MUEEN --force --processes 2
+        python Rebuild.py Campo --write-layouts
+    the unchanged folders are skipped, the exit code is 1 if a folder failed (e.g. a regenerated layout which differs
+    from its layout.csv).
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description='Regenerate and check the algorithmic layouts and render every layout.png.')
+    parser.add_argument('folders', nargs='*', help='layout folders, all of them by default')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, the number of CPUs by default')
+    parser.add_argument('--force', action='store_true', help='rebuild the unchanged folders too')
+    parser.add_argument('--write-layouts', action='store_true',
+                        help='rewrite the layout.csv of the algorithmic layouts with the regenerated positions')
+    args = parser.parse_args()
+
+    t0 = time.time()
+    results = rebuild(args.folders or None, args.processes, args.force, args.write_layouts)
+    print('\n%-22s %-8s %10s %12s %10s %10s' % ('folder', 'status', 'heliostats', 'max diff m', 'generate s', 'render s'))
+    for result in results:
+        diff = '-' if result['max_abs_diff'] is None else '%.1e' % result['max_abs_diff']
+        print('%-22s %-8s %10d %12s %10.3f %10.3f' % (result['folder'], result['status'], result['heliostats'], diff,
+                                                      result['generate_seconds'], result['render_seconds']))
+    counts = {status: sum(result['status'] == status for result in results) for status in ('built', 'skipped', 'failed')}
+    print('%d built, %d skipped, %d failed, %d heliostats in total (%.2f s)'
+          % (counts['built'], counts['skipped'], counts['failed'], sum(result['heliostats'] for result in results),
+             time.time()-t0))
+    sys.exit(1 if counts['failed'] > 0 else 0)
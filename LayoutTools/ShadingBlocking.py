@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Shading and blocking efficiency of a heliostat field layout.
+
+A heliostat A is shaded by a neighbour B if B is in front of A toward the sun, and blocked by B if B is in front of A
+toward the receiver. The rectangle of B is projected along that direction onto the plane of A, and the overlap of the
+projection (its bounding box in the frame of A) with the rectangle of A is the shaded or blocked area.
+B can only cover A if B is in front of A along the direction and the centre of B is closer than one heliostat diagonal
+to the line through the centre of A along the direction. For shading, these pairs are found for each sun vector with a
+k-d tree of the heliostat centres projected onto the plane normal to the sun vector, whatever the length of the shadows.
+For blocking, the direction to the receiver does not depend on the sun, the neighbours within a radius are found once
+per layout. The radius follows from the lowest elevation of the directions to the receiver (see blocking_radius), so no
+blocking neighbour is missed however low the tower is seen from the field. The candidate pairs are then projected all
+at once.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def heliostat_frames(position, sun_vec, aim):
+    '''
+    Orientation of the heliostats tracking the sun, the normal of each heliostat bisects the sun vector and the direction to the aim point.
+
+    position: n x 3 heliostat positions, m
+    sun_vec: unit sun vector (x East, y North, z up)
+    aim: aim point on the receiver, 3 or n x 3, m
+
+    return: normal, u (horizontal width axis), v (height axis), reflected (unit vector to the aim point), n x 3 each
+    '''
+    reflected = np.asarray(aim, dtype=float)-position
+    reflected /= np.linalg.norm(reflected, axis=-1, keepdims=True)
+    normal = reflected+np.asarray(sun_vec, dtype=float)
+    normal /= np.linalg.norm(normal, axis=-1, keepdims=True)
+
+    u = np.zeros_like(normal)
+    u[:, 0] = -normal[:, 1]
+    u[:, 1] = normal[:, 0]
+    norm = np.hypot(u[:, 0], u[:, 1])
+    flat = norm < 1e-12  # a horizontal heliostat, its width axis is East
+    u[flat, 0] = 1.
+    norm[flat] = 1.
+    u /= norm[:, None]
+    v = np.cross(normal, u)
+    return normal, u, v, reflected
+
+
+def neighbour_pairs(position, radius):
+    '''
+    All the ordered pairs (i, j) of heliostats closer than radius, in the horizontal plane.
+
+    position: n x 3 heliostat positions, m
+    radius: neighbour radius, m
+
+    return: i, j, index arrays of the pairs, both (i, j) and (j, i) are listed, and dp, m x 3 offsets position[j]-position[i]
+    '''
+    pairs = cKDTree(position[:, :2]).query_pairs(radius, output_type='ndarray')
+    i = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    j = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    return i, j, position[j]-position[i]
+
+
+def blocking_radius(position, width, height, aim):
+    '''
+    Horizontal radius within which all the heliostats that may block a heliostat lie.
+    A neighbour j blocks i only if the centre of j is closer than one heliostat diagonal D to the line from i to the aim
+    point. Seen from a heliostat with the elevation e of the direction to the aim point, and for a height difference dz
+    of the heliostat centres, this line rises by tan(e) per metre, so j is within a horizontal distance
+    hypot((D+dz)/sin(e), D) of i. The lowest elevation of the field gives the radius.
+
+    position: n x 3 heliostat positions, m
+    width, height: heliostat width and height, m
+    aim: aim point on the receiver, 3 or n x 3, m
+
+    return: radius, m
+    '''
+    position = np.asarray(position, dtype=float)
+    diagonal = np.hypot(width, height)
+    if len(position) == 0:
+        return diagonal
+    to_aim = np.broadcast_to(np.asarray(aim, dtype=float), position.shape)-position
+    sin_elevation = np.min(to_aim[:, 2]/np.linalg.norm(to_aim, axis=-1))
+    dz = np.ptp(position[:, 2])
+    return float(np.hypot((diagonal+dz)/max(sin_elevation, 1e-3), diagonal))
+
+
+def shading_pairs(position, sun_vec, diagonal):
+    '''
+    All the pairs (i, j) where heliostat j may shade heliostat i, i.e. j is in front of i toward the sun
+    and the centre of j is closer than one heliostat diagonal to the sun ray through the centre of i.
+
+    position: n x 3 heliostat positions, m
+    sun_vec: unit sun vector (x East, y North, z up)
+    diagonal: heliostat diagonal, m
+
+    return: i, j, index arrays of the pairs
+    '''
+    # an orthonormal basis of the plane normal to the sun vector
+    e1 = np.array([-sun_vec[1], sun_vec[0], 0.])
+    if np.hypot(e1[0], e1[1]) < 1e-12:
+        e1 = np.array([1., 0., 0.])
+    e1 /= np.linalg.norm(e1)
+    e2 = np.cross(sun_vec, e1)
+
+    pairs = cKDTree(position @ np.stack((e1, e2), axis=-1)).query_pairs(diagonal, output_type='ndarray')
+    along = (position[pairs[:, 1]]-position[pairs[:, 0]]) @ sun_vec
+    return np.where(along > 0., pairs[:, 0], pairs[:, 1]), np.where(along > 0., pairs[:, 1], pairs[:, 0])
+
+
+def projected_overlap(i, j, direction, position, normal, u, v, width, height):
+    '''
+    Area of heliostat i covered by heliostat j, projected along direction onto the plane of heliostat i.
+
+    i, j: index arrays of the pairs
+    direction: m x 3 projection direction of each pair (toward the sun or toward the receiver)
+    position, normal, u, v: n x 3 heliostat positions and frames
+    width, height: heliostat width and height, m
+
+    return: m overlap areas, m^2
+    '''
+    ni = normal[i]
+    dn = np.einsum('ij,ij->i', direction, ni)
+    # the rectangle axes of j projected along direction onto the plane of i
+    uj = u[j]-direction*(np.einsum('ij,ij->i', u[j], ni)/dn)[:, None]
+    vj = v[j]-direction*(np.einsum('ij,ij->i', v[j], ni)/dn)[:, None]
+    dp = position[j]-position[i]
+    centre = dp-direction*(np.einsum('ij,ij->i', dp, ni)/dn)[:, None]
+
+    ui, vi = u[i], v[i]
+    cu = np.einsum('ij,ij->i', centre, ui)
+    cv = np.einsum('ij,ij->i', centre, vi)
+    eu = 0.5*width*np.abs(np.einsum('ij,ij->i', uj, ui))+0.5*height*np.abs(np.einsum('ij,ij->i', vj, ui))
+    ev = 0.5*width*np.abs(np.einsum('ij,ij->i', uj, vi))+0.5*height*np.abs(np.einsum('ij,ij->i', vj, vi))
+
+    du = np.minimum(0.5*width, cu+eu)-np.maximum(-0.5*width, cu-eu)
+    dv = np.minimum(0.5*height, cv+ev)-np.maximum(-0.5*height, cv-ev)
+    return np.maximum(du, 0.)*np.maximum(dv, 0.)
+
+
+def shading_blocking(position, sun_vec, width, height, aim, pairs=None, radius=None):
+    '''
+    Shading and blocking fractions of the heliostats for one sun vector.
+    The areas covered by different neighbours are summed (capped at the heliostat area), their overlaps are ignored.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vec: unit sun vector (x East, y North, z up)
+    width, height: heliostat width and height, m
+    aim: aim point on the receiver, 3 or n x 3, m
+    pairs: neighbour pairs (i, j, dp) of the blocking from neighbour_pairs, None to find them within radius
+    radius: neighbour radius of the blocking, m, None for blocking_radius (no blocking neighbour is missed), a smaller
+            radius is faster but ignores the blocking by the farther neighbours
+
+    return: shading, blocking, n fractions of the heliostat area in [0, 1]
+    '''
+    position = np.asarray(position, dtype=float)
+    n = len(position)
+    if pairs is None:
+        pairs = neighbour_pairs(position, blocking_radius(position, width, height, aim) if radius is None else radius)
+    i, j, dp = pairs
+    sun_vec = np.asarray(sun_vec, dtype=float)
+    if sun_vec[2] <= 0.:
+        return np.zeros(n), np.zeros(n)
+
+    normal, u, v, reflected = heliostat_frames(position, sun_vec, aim)
+    area = width*height
+
+    si, sj = shading_pairs(position, sun_vec, np.hypot(width, height))
+    overlap = projected_overlap(si, sj, np.broadcast_to(sun_vec, (len(si), 3)), position, normal, u, v, width, height)
+    shading = np.minimum(np.bincount(si, weights=overlap, minlength=n)/area, 1.)
+
+    # the circumscribed spheres of the two heliostats must meet along the direction to the receiver
+    along = np.einsum('ij,ij->i', dp, reflected[i])
+    cover = (along > 0.) & (np.einsum('ij,ij->i', dp, dp)-along*along < width*width+height*height)
+    bi, bj = i[cover], j[cover]
+    overlap = projected_overlap(bi, bj, reflected[bi], position, normal, u, v, width, height)
+    blocking = np.minimum(np.bincount(bi, weights=overlap, minlength=n)/area, 1.)
+    return shading, blocking
+
+
+def annual_shading_blocking(position, sun_vecs, width, height, aim, radius=None):
+    '''
+    Shading and blocking fractions of the heliostats for a set of sun vectors, the neighbours of the blocking are found only once.
+
+    position: n x 3 heliostat positions, m (see layout_positions)
+    sun_vecs: s x 3 unit sun vectors (e.g. SunPosition.sun_vector), the sun vectors below the horizon give 0
+    width, height: heliostat width and height, m
+    aim: aim point on the receiver, 3 or n x 3, m
+    radius: neighbour radius of the blocking, m, see shading_blocking
+
+    return: shading, blocking, s x n fractions of the heliostat area in [0, 1]
+    '''
+    position = np.asarray(position, dtype=float)
+    sun_vecs = np.asarray(sun_vecs, dtype=float).reshape(-1, 3)
+    pairs = neighbour_pairs(position, blocking_radius(position, width, height, aim) if radius is None else radius)
+    shading = np.zeros((len(sun_vecs), len(position)))
+    blocking = np.zeros((len(sun_vecs), len(position)))
+    for k, sun_vec in enumerate(sun_vecs):
+        shading[k], blocking[k] = shading_blocking(position, sun_vec, width, height, aim, pairs)
+    return shading, blocking
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Read and write the input file of SolTrace (.stinput).
+
+    SUN     PTSRC  0  SHAPE  p  SIGMA  2.73  HALFWIDTH  4.65
+    XYZ     x  y  z  USELDH  0  LDH  0  0  0
+    USER SHAPE DATA  n              n lines of (angle, intensity)
+    OPTICS LIST COUNT  m            m x (OPTICAL PAIR name, front OPTICAL, back OPTICAL)
+    STAGE LIST COUNT  k             k x (STAGE header, stage name, ELEMENTS lines of elements)
+
+Each element line is tab separated:
+    enabled, x, y, z, aim x, aim y, aim z, zrot, aperture type, 8 aperture parameters,
+    surface type, 8 surface parameters, surface file, optics name, interaction (1 refraction, 2 reflection), comment
+"""
+
+import numpy as np
+
+# the number of the aperture and surface parameters of an element
+NPARAMS = 8
+
+
+def iter_stinput(filename):
+    '''
+    Iterate over the records of a SolTrace input file line by line, the file is never loaded as a whole.
+
+    filename: path of the .stinput file
+
+    yield: (record, value)
+      * ('SUN', dict): shape, sigma, halfwidth (mrad), point_source, position (3), user_shape (n x 2)
+      * ('OPTICS', dict): name, front and back (the fields of the OPTICAL lines)
+      * ('STAGE', dict): index, name, origin (3), aim (3), zrot, virtual, multihit, tracethrough, count (number of elements)
+      * ('ELEMENT', (stage index, fields)): the tab separated fields of one element line
+    '''
+    with open(filename, "r") as input_file:
+        lines = (line.rstrip('\r\n') for line in input_file)
+        stage = -1
+        pending = None  # a line read ahead, which is not part of the previous record
+        while True:
+            line = pending if pending is not None else next(lines, None)
+            pending = None
+            if line is None:
+                break
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            fields = line.split('\t')
+            if fields[0] == 'SUN':
+                keys = dict(zip(fields[1::2], fields[2::2]))
+                xyz = next(lines).split('\t')
+                sun = {'point_source': int(keys.get('PTSRC', 0)), 'shape': keys.get('SHAPE', 'p'),
+                       'sigma': float(keys.get('SIGMA', 0.)), 'halfwidth': float(keys.get('HALFWIDTH', 0.)),
+                       'position': np.array(xyz[1:4], dtype=float), 'user_shape': np.zeros((0, 2))}
+                pending = next(lines, None)
+                if pending is not None and pending.startswith('USER SHAPE DATA'):
+                    count = int(pending.split('\t')[1])
+                    sun['user_shape'] = np.array([next(lines).split('\t')[:2] for i in range(count)], dtype=float).reshape(count, 2)
+                    pending = None
+                yield 'SUN', sun
+            elif fields[0] == 'OPTICAL PAIR':
+                front = next(lines).split('\t')[1:]
+                back = next(lines).split('\t')[1:]
+                yield 'OPTICS', {'name': fields[1], 'front': front, 'back': back}
+            elif fields[0] == 'STAGE':
+                stage += 1
+                # STAGE XYZ x y z AIM x y z ZROT zrot, then the keyword pairs VIRTUAL, MULTIHIT, ELEMENTS, TRACETHROUGH
+                keys = dict(zip(fields[11::2], fields[12::2]))
+                yield 'STAGE', {'index': stage, 'name': next(lines).strip(),
+                                'origin': np.array(fields[2:5], dtype=float), 'aim': np.array(fields[6:9], dtype=float),
+                                'zrot': float(fields[10]), 'virtual': int(keys.get('VIRTUAL', 0)),
+                                'multihit': int(keys.get('MULTIHIT', 1)), 'tracethrough': int(keys.get('TRACETHROUGH', 0)),
+                                'count': int(keys.get('ELEMENTS', 0))}
+            elif stage >= 0 and len(fields) >= 2*NPARAMS+12:
+                yield 'ELEMENT', (stage, fields)
+
+
+def read_stinput(filename):
+    '''
+    Read a SolTrace input file, the elements of each stage are collected into arrays.
+
+    filename: path of the .stinput file
+
+    return: sun (dict), optics (list of dict) and stages (list of dict), see iter_stinput, each stage also has the arrays
+      * enabled (n), position (n x 3), aim (n x 3), zrot (n), deg
+      * aperture (n, str), aperture_params (n x 8), surface (n, str), surface_params (n x 8)
+      * optics (n, str), interaction (n)
+    '''
+    sun, optics, stages = None, [], []
+    stage, k = None, 0
+    for record, value in iter_stinput(filename):
+        if record == 'ELEMENT':
+            fields = value[1]
+            if k == len(stage['enabled']):
+                _grow(stage)
+            stage['enabled'][k] = int(fields[0])
+            stage['numbers'][k, :7] = fields[1:8]
+            stage['aperture'][k] = fields[8]
+            stage['numbers'][k, 7:7+NPARAMS] = fields[9:9+NPARAMS]
+            stage['surface'][k] = fields[9+NPARAMS]
+            stage['numbers'][k, 7+NPARAMS:] = fields[10+NPARAMS:10+2*NPARAMS]
+            stage['optics'][k] = fields[11+2*NPARAMS]
+            stage['interaction'][k] = int(fields[12+2*NPARAMS])
+            k += 1
+        elif record == 'STAGE':
+            if stage is not None:
+                _finish(stage, k)
+            stage, k = value, 0
+            n = stage['count']
+            stage['enabled'] = np.zeros(n, dtype=np.int8)
+            stage['numbers'] = np.zeros((n, 7+2*NPARAMS))
+            stage['aperture'] = np.empty(n, dtype=object)
+            stage['surface'] = np.empty(n, dtype=object)
+            stage['optics'] = np.empty(n, dtype=object)
+            stage['interaction'] = np.zeros(n, dtype=np.int8)
+            stages.append(stage)
+        elif record == 'OPTICS':
+            optics.append(value)
+        elif record == 'SUN':
+            sun = value
+    if stage is not None:
+        _finish(stage, k)
+    return sun, optics, stages
+
+
+def _grow(stage):
+    '''
+    Double the element arrays of a stage, when the element count of the stage header is too small.
+    '''
+    for name in ('enabled', 'numbers', 'aperture', 'surface', 'optics', 'interaction'):
+        values = stage[name]
+        stage[name] = np.concatenate((values, np.zeros_like(values, shape=(max(len(values), 1),)+values.shape[1:])))
+
+
+def _finish(stage, k):
+    '''
+    Trim the element arrays of a stage to the k elements read and split the numeric columns.
+    The number of elements read must be the element count of the stage header.
+    '''
+    if k != stage['count']:
+        raise ValueError('stage %d (%s): %d elements read, the header declares %d'
+                         % (stage['index'], stage['name'], k, stage['count']))
+    for name in ('enabled', 'numbers', 'aperture', 'surface', 'optics', 'interaction'):
+        stage[name] = stage[name][:k]
+    numbers = stage.pop('numbers')
+    stage['position'] = numbers[:, 0:3]
+    stage['aim'] = numbers[:, 3:6]
+    stage['zrot'] = numbers[:, 6]
+    stage['aperture_params'] = numbers[:, 7:7+NPARAMS]
+    stage['surface_params'] = numbers[:, 7+NPARAMS:]
+    for name in ('aperture', 'surface', 'optics'):
+        stage[name] = stage[name].astype(str)
+    stage['count'] = k
+
+
+def write_stage(output_file, name, position, aim, zrot=0., aperture='r', aperture_params=None, surface='f',
+                surface_params=None, optics='Heliostat', interaction=2, origin=(0., 0., 0.), stage_aim=(0., 0., 1.),
+                virtual=0, multihit=1, tracethrough=0):
+    '''
+    Write one stage of a SolTrace input file, all the element lines are formatted in one pass and written at once.
+
+    output_file: opened text file
+    name: name of the stage
+    position: n x 3 element positions, m
+    aim: n x 3 element aim points, m
+    zrot: rotation of the elements about their z axis, deg, scalar or n
+    aperture: aperture type, e.g. 'r' rectangle, 'c' circle, 'l' single axis curvature section
+    aperture_params: 8 or n x 8 aperture parameters, e.g. (width, height, 0, ...) of 'r'
+    surface: surface type, e.g. 'f' flat, 'p' parabolic, 't' cylinder
+    surface_params: 8 or n x 8 surface parameters, e.g. (cx, cy, 0, ...) of 'p'
+    optics: name of the optical pair of the elements, scalar or n
+    interaction: 1 refraction, 2 reflection
+    origin, stage_aim, virtual, multihit, tracethrough: parameters of the stage
+    '''
+    position = np.asarray(position, dtype=float).reshape(-1, 3)
+    n = len(position)
+    numbers = np.zeros((n, 7+2*NPARAMS))
+    numbers[:, 0:3] = position
+    numbers[:, 3:6] = np.asarray(aim, dtype=float).reshape(-1, 3)
+    numbers[:, 6] = zrot
+    if aperture_params is not None:
+        numbers[:, 7:7+NPARAMS] = np.asarray(aperture_params, dtype=float).reshape(-1, NPARAMS)
+    if surface_params is not None:
+        numbers[:, 7+NPARAMS:] = np.asarray(surface_params, dtype=float).reshape(-1, NPARAMS)
+
+    output_file.write("STAGE\tXYZ\t%.9g\t%.9g\t%.9g\tAIM\t%.9g\t%.9g\t%.9g\tZROT\t0\tVIRTUAL\t%d\tMULTIHIT\t%d\tELEMENTS\t%d\tTRACETHROUGH\t%d\n"
+                      % (tuple(origin)+tuple(stage_aim)+(virtual, multihit, n, tracethrough)))
+    output_file.write(name+"\n")
+
+    number = "\t".join(["%.9g"]*NPARAMS)
+    fmt = "1\t"+"\t".join(["%.9g"]*7)+"\t%s\t"+number+"\t%s\t"+number+"\t\t%s\t%d\t\n"
+    apertures = np.broadcast_to(np.asarray(aperture, dtype=object), (n,))
+    surfaces = np.broadcast_to(np.asarray(surface, dtype=object), (n,))
+    opticses = np.broadcast_to(np.asarray(optics, dtype=object), (n,))
+    interactions = np.broadcast_to(np.asarray(interaction), (n,))
+    rows = numbers.tolist()
+    output_file.write("".join([fmt % (tuple(row[:7])+(apertures[i],)+tuple(row[7:7+NPARAMS])+(surfaces[i],)
+                                      + tuple(row[7+NPARAMS:])+(opticses[i], interactions[i]))
+                               for i, row in enumerate(rows)]))
+
+
+def heliostat_aim(position, sun_vec, target):
+    '''
+    Aim points of the heliostats, each heliostat normal bisects the sun vector and the direction to the target.
+
+    position: n x 3 heliostat positions, m
+    sun_vec: unit sun vector (x East, y North, z up)
+    target: aim point on the receiver, m
+
+    return: n x 3 aim points, 1000 m away from the heliostats along their normals
+    '''
+    position = np.asarray(position, dtype=float).reshape(-1, 3)
+    to_target = np.asarray(target, dtype=float)-position
+    to_target /= np.linalg.norm(to_target, axis=1, keepdims=True)
+    normal = to_target+np.asarray(sun_vec, dtype=float)/np.linalg.norm(sun_vec)
+    normal /= np.linalg.norm(normal, axis=1, keepdims=True)
+    return position+1000.*normal
+
+
+def write_stinput(filename, position, width, height, sun_vec, towerheight, focal=None, zrot=0.,
+                  reflectivity=0.9, slope_error=2.0, specularity_error=0.3, sun_shape='p', sun_sigma=2.73, sun_halfwidth=4.65,
+                  receiver_radius=7.75, receiver_height=22., receiver_absorptivity=0.94):
+    '''
+    Write a generated layout as a SolTrace input file, the heliostat field stage is followed by a cylindrical receiver stage.
+
+    filename: path of the .stinput file
+    position: n x 3 heliostat positions (e.g. x, y, z of a layout.csv), m
+    width, height: heliostat width and height, m
+    sun_vec: unit sun vector (x East, y North, z up)
+    towerheight: height of the receiver center, m
+    focal: None for flat heliostats, or else focal length of the parabolic heliostats, scalar or n, m
+    zrot: rotation of the heliostats about their normals, deg
+    reflectivity, slope_error, specularity_error: optics of the heliostats, -, mrad, mrad
+    sun_shape, sun_sigma, sun_halfwidth: sun shape, 'p' pillbox or 'g' gaussian, mrad
+    receiver_radius, receiver_height, receiver_absorptivity: cylindrical receiver, m, m, -
+    '''
+    position = np.asarray(position, dtype=float).reshape(-1, 3)
+    n = len(position)
+    target = (0., 0., towerheight)
+    aim = heliostat_aim(position, sun_vec, target)
+
+    surface_params = np.zeros((n, NPARAMS))
+    if focal is None:
+        surface = 'f'
+    else:
+        surface = 'p'
+        curvature = 1./(2.*np.broadcast_to(np.asarray(focal, dtype=float), (n,)))
+        surface_params[:, 0] = curvature
+        surface_params[:, 1] = curvature
+
+    sun_position = 1e4*np.asarray(sun_vec, dtype=float)/np.linalg.norm(sun_vec)
+    with open(filename, "w") as output_file:
+        output_file.write("# SOLTRACE VERSION 2012.7.6 INPUT FILE\n")
+        output_file.write("SUN\tPTSRC\t0\tSHAPE\t%s\tSIGMA\t%g\tHALFWIDTH\t%g\n" % (sun_shape, sun_sigma, sun_halfwidth))
+        output_file.write("XYZ\t%.9g\t%.9g\t%.9g\tUSELDH\t0\tLDH\t0\t0\t0\n" % tuple(sun_position))
+        output_file.write("USER SHAPE DATA\t0\n")
+
+        output_file.write("OPTICS LIST COUNT\t2\n")
+        output_file.write("OPTICAL PAIR\tHeliostat\n")
+        output_file.write("OPTICAL\tg\t0\t0\t0\t%g\t0\t%g\t%g\t0\t0\t0\t0\t0\t0\n" % (reflectivity, slope_error, specularity_error))
+        output_file.write("OPTICAL\tg\t0\t0\t0\t0\t0\t100\t0\t0\t0\t0\t0\t0\t0\n")
+        output_file.write("OPTICAL PAIR\tReceiver\n")
+        for side in range(2):
+            output_file.write("OPTICAL\tg\t0\t0\t0\t%g\t0\t100\t100\t0\t0\t0\t0\t0\t0\n" % (1.-receiver_absorptivity))
+
+        output_file.write("STAGE LIST COUNT\t2\n")
+        write_stage(output_file, "Heliostat field", position, aim, zrot, 'r', (width, height, 0, 0, 0, 0, 0, 0),
+                    surface, surface_params, 'Heliostat')
+        write_stage(output_file, "Receiver", (0., -receiver_radius, towerheight), (0., 1000.-receiver_radius, towerheight), 0.,
+                    'l', (0, 0, receiver_height, 0, 0, 0, 0, 0), 't', (1./receiver_radius, 0, 0, 0, 0, 0, 0, 0), 'Receiver')
+
+
+if __name__ == "__main__":
+    """
+    Convert a layout.csv to a SolTrace input file, e.g.
+        python SolTrace.py ../Campo/layout.csv campo.stinput --width 10 --height 10 --towerheight 250
+    """
+    import argparse
+    import os
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from LayoutTools import load_layout
+
+    parser = argparse.ArgumentParser(description='Write a layout.csv as a SolTrace input file.')
+    parser.add_argument('layout', help='layout.csv')
+    parser.add_argument('output', help='.stinput file')
+    parser.add_argument('--width', type=float, default=10., help='heliostat width, m')
+    parser.add_argument('--height', type=float, default=10., help='heliostat height, m')
+    parser.add_argument('--towerheight', type=float, default=250., help='height of the receiver center, m')
+    parser.add_argument('--sun', type=float, nargs=3, default=[0., 0., 1.], help='sun vector (x East, y North, z up)')
+    parser.add_argument('--focal', type=float, default=None, help='focal length of the heliostats, m, flat by default')
+    args = parser.parse_args()
+
+    layout = load_layout(args.layout, cache=False)
+    write_stinput(args.output, np.stack((layout['x'], layout['y'], layout['z']), axis=-1), args.width, args.height,
+                  args.sun, args.towerheight, args.focal)
@@ -3,6 +3,10 @@ import numpy as np
 
 class SunPosition:
 
+    # number of days in the year before the first day of each month, ref. J Duffie page 14, Table 1.6.1
+    days_before_month = {'Jan': 0, 'Feb': 31, 'Mar': 59, 'Apr': 90, 'May': 120, 'Jun': 151,
+                         'Jul': 181, 'Aug': 212, 'Sep': 243, 'Oct': 273, 'Nov': 304, 'Dec': 334}
+
     def __init__(self):
         """ Calculate sun position according to a certain location, date and time. Reference: John A. Duffie and William A. Beckman. Solar Engineering of Thermal Processes, 4th edition.
 
@@ -47,50 +51,19 @@ class SunPosition:
 
         ``Arguments``
 
-                * dd (int): the day in the month
-                * mm (str): the month, e.g. 'Jan', 'Feb', Mar' etc
+                * dd (int or array): the day in the month
+                * mm (str or array of str): the month, e.g. 'Jan', 'Feb', Mar' etc
 
         ``Return`` 
 
-                * days (int): the-day-of-the year for the specified dd-mm, e.g. 1 Jan is day 1
+                * days (int or array): the-day-of-the year for the specified dd-mm, e.g. 1 Jan is day 1
 
         """
 
-        if mm == 'Jan':
-            days = dd
-
-        elif mm == 'Feb':
-            days = 31+dd
-
-        elif mm == 'Mar':
-            days = 59+dd
-
-        if mm == 'Apr':
-            days = 90+dd
-
-        elif mm == 'May':
-            days = 120+dd
-
-        elif mm == 'Jun':
-            days = 151+dd
-
-        if mm == 'Jul':
-            days = 181+dd
-
-        elif mm == 'Aug':
-            days = 212+dd
-
-        elif mm == 'Sep':
-            days = 243+dd
-
-        if mm == 'Oct':
-            days = 273+dd
-
-        elif mm == 'Nov':
-            days = 304+dd
-
-        elif mm == 'Dec':
-            days = 334+dd
+        if isinstance(mm, str):
+            days = self.days_before_month[mm]+dd
+        else:
+            days = np.vectorize(self.days_before_month.__getitem__, otypes=[int])(mm)+dd
 
         return days
 
@@ -99,23 +72,24 @@ class SunPosition:
 
         ``Arguments``
 
-          * day (int): day of the year, i.e from 1 to 365
+          * day (int or array): day of the year, i.e from 1 to 365
           * form (str): 'detail' or simple' model
 
         ``Return``
 
-          * delta (float): declination angle (deg)
+          * delta (float or array): declination angle (deg)
         """
+        days = np.asarray(days, dtype=float)
 
         if form == 'detail':
             # TODO this equation doesn't give symmetrical annual declination angles
-            B = float(days-1)*360./365.*np.pi/180.
+            B = (days-1.)*360./365.*np.pi/180.
 
             delta = (180./np.pi)*(0.006918 - 0.399912*np.cos(B) + 0.070257*np.sin(B) - 0.006758 *
-                                  np.cos(2.*B) + 0.000907*np.sin(2.*B) - 0.002697*np.cos(3.*B) + 0.00148*np.sin(3.*B))
+                                  np.cos(2.*B) + 0.000907*np.sin(2.*B) - 0.002697*np.cos(3.*B) + 0.00148*np.sin(3.*B))[()]
 
         else:
-            delta = 23.45*np.sin(360.*float(284+days)/365.*np.pi/180.)  # deg
+            delta = 23.45*np.sin(360.*(284.+days)/365.*np.pi/180.)[()]  # deg
 
         return delta
 
@@ -124,18 +98,19 @@ class SunPosition:
 
         ``Arguments``
 
-          * delta (float): declination angle (deg)
-          * latitude (float): latitude angle (deg)
+          * delta (float or array): declination angle (deg)
+          * latitude (float or array): latitude angle (deg)
 
         ``Returns``
 
-          * hour (float): length of the daylight hour (h)
-          * sunrise (float): the solar hour angle at sunrise (deg)
+          * hour (float or array): length of the daylight hour (h), 24 during the polar day and 0 during the polar night
+          * sunrise (float or array): the solar hour angle at sunrise (deg), -180 during the polar day and 0 during the polar night
 
         """
 
-        sunset = np.arccos(-np.tan(latitude*np.pi/180.) *
-                           np.tan(delta*np.pi/180.))*180./np.pi  # deg
+        # the sun does not set (polar day) or rise (polar night) if the cosine of the sunset hour angle is beyond [-1, 1]
+        sunset = np.arccos(np.clip(-np.tan(latitude*np.pi/180.) *
+                                   np.tan(delta*np.pi/180.), -1., 1.))*180./np.pi  # deg
 
         sunrise = -sunset
 
@@ -148,18 +123,18 @@ class SunPosition:
 
         ``Arguments``
 
-          * latitude (float): latitude angle at the location (deg)
-          * delta (float):  declination angle (deg)
-          * omega (float): solar hour angle (deg)
+          * latitude (float or array): latitude angle at the location (deg)
+          * delta (float or array):  declination angle (deg)
+          * omega (float or array): solar hour angle (deg)
 
         ``Return``
 
-          * theta (float): the zenith angle (deg)
+          * theta (float or array): the zenith angle (deg), the arguments are broadcast together
 
         """
-        latitude *= np.pi/180.
-        delta *= np.pi/180.
-        omega *= np.pi/180.
+        latitude = np.multiply(latitude, np.pi/180.)
+        delta = np.multiply(delta, np.pi/180.)
+        omega = np.multiply(omega, np.pi/180.)
 
         theta = np.arccos(np.cos(latitude)*np.cos(delta) *
                           np.cos(omega)+np.sin(latitude)*np.sin(delta))*180./np.pi
@@ -171,68 +146,99 @@ class SunPosition:
 
         ``Arguments``
 
-          * latitude (float): latitude angle (deg)
-          * delta (float): declination angle (deg)
-          * theta (float): zenith angle (deg)
-          * omega (float): solar hour angle (deg)
+          * latitude (float or array): latitude angle (deg)
+          * delta (float or array): declination angle (deg)
+          * theta (float or array): zenith angle (deg)
+          * omega (float or array): solar hour angle (deg)
 
         ``Return``
 
-          * phi (float): azimuth angle (deg), counted from South towards to West 
+          * phi (float or array): azimuth angle (deg), counted from South towards to West, the arguments are broadcast together
         """
-        latitude *= np.pi/180.
-        delta *= np.pi/180.
-        theta *= np.pi/180.
+        latitude = np.multiply(latitude, np.pi/180.)
+        delta = np.multiply(delta, np.pi/180.)
+        theta = np.multiply(theta, np.pi/180.)
 
         a1 = np.cos(theta)*np.sin(latitude)-np.sin(delta)
         a2 = np.sin(theta)*np.cos(latitude)
         b = a1/a2
 
-        if abs(b+1.) < 1e-10:
-            phi = np.pi
-
-        elif abs(b-1.) < 1e-10:
-            phi = 0.
-        else:
-            phi = abs(np.arccos((np.cos(theta)*np.sin(latitude)-np.sin(delta)
-                                 )/(np.sin(theta)*np.cos(latitude))))  # unit radian
+        phi = np.abs(np.arccos(np.clip(b, -1., 1.)))  # unit radian
+        phi = np.where(np.abs(b+1.) < 1e-10, np.pi, phi)
+        phi = np.where(np.abs(b-1.) < 1e-10, 0., phi)
 
-        if omega < 0:
-            phi = -phi
+        phi = np.where(np.less(omega, 0), -phi, phi)
 
-        phi *= 180./np.pi
+        phi = (phi*(180./np.pi))[()]
 
         return phi
 
+    def sun_vector(self, latitude, delta, omega):
+        """Calculate the unit vector pointing to the sun, x towards East, y towards North and z towards zenith
+
+        ``Arguments``
+
+          * latitude (float or array): latitude angle (deg)
+          * delta (float or array): declination angle (deg)
+          * omega (float or array): solar hour angle (deg)
+
+        ``Return``
+
+          * sun_vec (array): unit sun vectors, the arguments are broadcast together and the last axis is (x, y, z)
+
+        ``Example``
+
+          Hourly sun vectors of a year for several sites in one call
+
+                >>> sun=SunPosition()
+                >>> latitude=np.array([34., 37.44])
+                >>> delta=sun.declination(np.arange(1, 366))
+                >>> omega=np.linspace(-180., 165., 24)
+                >>> sun_vec=sun.sun_vector(latitude[:, None, None], delta[None, :, None], omega)
+                >>> print(sun_vec.shape)
+                (2, 365, 24, 3)
+
+        """
+        theta = self.zenith(latitude, delta, omega)
+        phi = self.azimuth(latitude, theta, delta, omega)
+
+        theta = np.multiply(theta, np.pi/180.)
+        phi = np.multiply(phi, np.pi/180.)
+
+        sun_x = -np.sin(theta)*np.sin(phi)
+        sun_y = -np.sin(theta)*np.cos(phi)
+        sun_z = np.cos(theta)
+
+        return np.stack((sun_x, sun_y, sun_z), axis=-1)
+
     def convert_AZEL_to_declination_hour(self, theta, phi, latitude):
         """ Convert azimuth-elevation angle to declination-hour angle
 
         ``Arguments``
 
-          * theta (float): zenith angle (deg)
-          * phi (float): azimuth angle (deg), counted from South towards to West
-          * latitude (float): latitude latitude (deg)
+          * theta (float or array): zenith angle (deg)
+          * phi (float or array): azimuth angle (deg), counted from South towards to West
+          * latitude (float or array): latitude latitude (deg)
 
         ``Returns``
 
-          * delta: declination angle (deg)
-          * omega: solar hour angle (deg)
+          * delta (float or array): declination angle (deg)
+          * omega (float or array): solar hour angle (deg)
         """
 
-        phi *= np.pi/180.
-        theta *= np.pi/180.
-        latitude *= np.pi/180.
+        phi = np.multiply(phi, np.pi/180.)
+        theta = np.multiply(theta, np.pi/180.)
+        latitude = np.multiply(latitude, np.pi/180.)
 
         delta = np.arcsin(np.cos(theta)*np.sin(latitude) -
-                          np.cos(abs(phi))*np.sin(theta)*np.cos(latitude))
+                          np.cos(np.abs(phi))*np.sin(theta)*np.cos(latitude))
 
         omega = np.arccos((np.cos(theta)-np.sin(latitude) *
                           np.sin(delta))/(np.cos(latitude)*np.cos(delta)))
-        if phi < 0:
-            omega = -omega
+        omega = np.where(phi < 0, -omega, omega)
 
-        delta *= 180./np.pi
-        omega *= 180./np.pi
+        delta = (delta*(180./np.pi))[()]
+        omega = (omega*(180./np.pi))[()]
 
         return delta, omega
 
@@ -242,14 +248,14 @@ class SunPosition:
         ``Arguments``
 
           * tool (str): 'solstice' or 'solartherm'
-          * azimuth (float): azimuth angle (deg), counted from South towards to West
-          * zenith (float): zenith angle (deg)
+          * azimuth (float or array): azimuth angle (deg), counted from South towards to West
+          * zenith (float or array): zenith angle (deg)
 
 
         ``Returns``
 
-          * sol_azi (float): azimuth angle 
-          * sol_ele (float): elevation angle
+          * sol_azi (float or array): azimuth angle 
+          * sol_ele (float or array): elevation angle
         """
         if tool == 'solstice':
             # azimuth: from East to North
@@ -262,23 +268,12 @@ class SunPosition:
             sol_azi = 180.+azimuth
             sol_ele = 90.-zenith
 
-        if isinstance(sol_azi, np.ndarray):
-            for i in range(len(sol_azi)):
-                azi = sol_azi[i]
-                ele = sol_ele[i]
-                if (azi >= 360. or azi < 0.):
-                    sol_azi[i] = (azi+360.) % 360.
-                if ele <= 1e-20:
-                    sol_ele[i] = 0.
-        else:
-            if (sol_azi >= 360. or sol_azi < 0.):
-                sol_azi = (sol_azi+360.) % 360.
-            if sol_ele <= 1e-20:
-                sol_ele = 0.
+        sol_azi = np.where((sol_azi >= 360.) | (sol_azi < 0.), (sol_azi+360.) % 360., sol_azi)[()]
+        sol_ele = np.where(sol_ele <= 1e-20, 0., sol_ele)[()]
 
         return sol_azi, sol_ele
 
-    def annual_angles(self, latitude, casefolder=None, nd=5, nh=5, verbose=False):
+    def annual_angles(self, latitude, casefolder=None, nd=5, nh=5, verbose=False, view=True):
         """Generate a range of sun positions (azimuth-zenith angles and declination-solarhour angles) for annual optical lookup table simulation. Automatically detect the time when the sun is below the horizon (elevation<0), where a ray-tracing simulation is not required.
 
         ``Arguments``
@@ -288,12 +283,13 @@ class SunPosition:
           * nd (int): number of rows of the lookup table (points in the declination movement, suggest nd>=5)
           * nh (int): number of columns of the lookup table (hours in a day, i.e. 24h)
           * verbose (bool): write results to disk or not
+          * view (bool): render the human-readable lookup table or not, the numeric lookup table is given by annual_grid
 
         ``Returns``
 
           * AZI (1 D numpy array): a list of azimuth angles (deg), counted from South towards to West
           * ZENITH (1D numpy array): a list of zenith angles (deg)
-          * table (numpy array): declination (row) - solarhour (column) lookup table to be simulated 
+          * table (numpy array): declination (row) - solarhour (column) lookup table to be simulated, None if view is False and the table is not saved
           * case_list (numpy array): a flatten list of cases to be simulated, with the correspondence between declination-solarhour angles and azimuth-zenith angles for each case
 
 
@@ -332,6 +328,63 @@ class SunPosition:
                   * `-`     : the sun is below the horizon, no simulation is required
         """
 
+        DELTA, solartime, AZI_grid, ZENITH_grid, case = self.annual_grid(latitude, nd, nh)
+
+        # the simulated cases, in the order of the case number
+        simulated = case > 0
+        AZI = AZI_grid[simulated]
+        ZENITH = ZENITH_grid[simulated]
+
+        # each morning case is followed by its symmetric afternoon case in the case list
+        ii, jj = np.nonzero(simulated)
+        n_rows = np.where((solartime[jj] < 0) & (solartime[::-1][jj] > 0), 2, 1)
+        afternoon = np.zeros(np.sum(n_rows), dtype=bool)
+        afternoon[np.cumsum(n_rows)[n_rows == 2]-1] = True
+        ii = np.repeat(ii, n_rows)
+        jj = np.repeat(jj, n_rows)
+
+        delta = DELTA[ii]
+        omega = np.where(afternoon, -solartime[jj], solartime[jj])
+        theta = self.zenith(latitude, delta, omega)
+        phi = self.azimuth(latitude, theta, delta, omega)
+
+        case_list = np.array(['Case', 'declination (deg)',
+                             'solar hour angle (deg)', 'azimuth (deg) S-to-W ', 'zenith (deg)'])
+        case_list = np.append(case_list, np.stack((case[ii, jj], delta, omega, phi, theta), axis=-1))
+        case_list = case_list.reshape(int(len(case_list)/5), 5)
+        # azimuth=case_list[1:,-2].astype(float)
+        # zenith=case_list[1:,-1].astype(float)
+
+        table = None
+        if view or (casefolder != None and verbose):
+            table = self.table_view(DELTA, solartime, case)
+
+        if casefolder != None and verbose:
+            np.savetxt(casefolder+'/table_view.csv',
+                       table, fmt='%s', delimiter=',')
+            np.savetxt(casefolder+'/annual_simulation_list.csv',
+                       case_list, fmt='%s', delimiter=',')
+
+        return AZI, ZENITH, table, case_list
+
+    def annual_grid(self, latitude, nd=5, nh=5):
+        """Generate the declination-solarhour grid of the annual optical lookup table as numeric arrays, see annual_angles
+
+        ``Arguments``
+
+          * latitude (float): latitude of the location (deg)
+          * nd (int): number of rows of the lookup table (points in the declination movement, suggest nd>=5)
+          * nh (int): number of columns of the lookup table (hours in a day, i.e. 24h)
+
+        ``Returns``
+
+          * DELTA (1D numpy array): declination angles of the rows (deg)
+          * solartime (1D numpy array): solar hour angles of the columns (deg)
+          * AZI (nd x nh numpy array): azimuth angles (deg), counted from South towards to West
+          * ZENITH (nd x nh numpy array): zenith angles (deg)
+          * case (nd x nh numpy array): ``n`` (n>0) if the cell is the ``n``-th case to be simulated, ``-n`` if the cell is the symmetric case with the case ``n``, ``0`` if the sun is below the horizon
+        """
+
         # declination angle (deg)
         # -23.45 ~ 23.45
         DELTA = np.linspace(-23.45, 23.45, nd)
@@ -339,10 +392,44 @@ class SunPosition:
         # solar time
         solartime = np.linspace(-180., 180., nh)  # deg
 
+        hour, sunrise = self.solarhour(DELTA, latitude)
+        sunset = -sunrise
+        below = (solartime > sunset[:, None]) | (solartime < sunrise[:, None]) | (hour[:, None] <= 0.)
+
+        # the morning and noon cells are simulated, row by row
+        simulated = ~below & (solartime <= 0)
+        case = np.zeros((nd, nh), dtype=int)
+        case[simulated] = np.arange(1, np.sum(simulated)+1)
+
+        # the afternoon cells reuse the symmetric morning cells, if the symmetric column is another column (not nh=1)
+        morning = simulated & (solartime < 0) & (solartime[::-1] > 0)
+        case[:, ::-1][morning] = -case[morning]
+        case[below] = 0
+
+        ZENITH = self.zenith(latitude, DELTA[:, None], solartime)
+        AZI = self.azimuth(latitude, ZENITH, DELTA[:, None], solartime)
+
+        return DELTA, solartime, AZI, ZENITH, case
+
+    def table_view(self, DELTA, solartime, case):
+        """Render the human-readable lookup table of annual_angles from the numeric grid of annual_grid
+
+        ``Arguments``
+
+          * DELTA (1D numpy array): declination angles of the rows (deg)
+          * solartime (1D numpy array): solar hour angles of the columns (deg)
+          * case (2D numpy array): case map of the lookup table, see annual_grid
+
+        ``Return``
+
+          * table (numpy array): declination (row) - solarhour (column) lookup table of strings
+        """
+        nd = len(DELTA)
+        nh = len(solartime)
+
         table = np.zeros(((nh+3)*(nd+3)))
         table = table.astype(str)
-        for i in range(len(table)):
-            table[i] = ''
+        table[:] = ''
 
         table = table.reshape(nd+3, nh+3)
         table[0, 0] = 'Lookup table'
@@ -355,69 +442,8 @@ class SunPosition:
         table[3:, 2] = DELTA
         table[2, 3:] = solartime
 
-        c = 1
-        AZI = np.array([])
-        ZENITH = np.array([])
-
-        case_list = np.array(['Case', 'declination (deg)',
-                             'solar hour angle (deg)', 'azimuth (deg) S-to-W ', 'zenith (deg)'])
-
-        for i in range(nd):
-            delta = DELTA[i]
-            hour, sunrise = self.solarhour(delta, latitude)
-            sunset = -sunrise
-            for j in range(nh):
-                omega = solartime[j]
-                if (omega > sunset or omega < sunrise):
-                    table[3+i, 3+j] = '-'
-
-                else:
-                    if omega < 0:
-
-                        table[3+i, 3+j] = ' case %s' % (c)
-                        table[3+i, -(1+j)] = '***%s' % (c)
-
-                        # zenith angle
-                        theta = self.zenith(latitude, delta, omega)
-                        # azimuth
-                        phi = self.azimuth(latitude, theta, delta, omega)
-                        AZI = np.append(AZI, phi)
-                        ZENITH = np.append(ZENITH, theta)
-
-                        case_list = np.append(
-                            case_list, (c, delta, omega, phi, theta))
-
-                        # zenith angle (afternoon)
-                        theta = self.zenith(latitude, delta, -omega)
-                        # azimuth
-                        phi = self.azimuth(latitude, theta, delta, -omega)
-                        case_list = np.append(
-                            case_list, (c, delta, -omega, phi, theta))
-
-                        c += 1
-
-                    elif omega == 0:
-                        table[3+i, 3+j] = ' case %s' % (c)
-
-                        # zenith angle
-                        theta = self.zenith(latitude, delta, omega)
-                        # azimuth
-                        phi = self.azimuth(latitude, theta, delta, omega)
-                        AZI = np.append(AZI, phi)
-                        ZENITH = np.append(ZENITH, theta)
-
-                        case_list = np.append(
-                            case_list, (c, delta, omega, phi, theta))
-                        c += 1
+        number = np.abs(case).astype(str)
+        table[3:, 3:] = np.where(case > 0, np.char.add(' case ', number),
+                                 np.where(case < 0, np.char.add('***', number), '-'))
 
-        case_list = case_list.reshape(int(len(case_list)/5), 5)
-        # azimuth=case_list[1:,-2].astype(float)
-        # zenith=case_list[1:,-1].astype(float)
-
-        if casefolder != None and verbose:
-            np.savetxt(casefolder+'/table_view.csv',
-                       table, fmt='%s', delimiter=',')
-            np.savetxt(casefolder+'/annual_simulation_list.csv',
-                       case_list, fmt='%s', delimiter=',')
-
-        return AZI, ZENITH, table, case_list
+        return table
@@ -0,0 +1,18 @@
+"""
+Tools shared by all the heliostat field layouts of this repository.
+
+The scripts in the layout folders import this package after adding the repository root to sys.path, e.g.
+
+    >>> import os, sys
+    >>> sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    >>> from LayoutTools import load_layout
+    >>> layout = load_layout('./layout.csv')
+    >>> x, y = layout['x'], layout['y']
+"""
+from LayoutTools.LayoutWriter import open_layout_file, write_layout
+from LayoutTools.LayoutLoader import LAYOUT_DTYPE, read_layout, load_layout, layout_positions, show_layout
+from LayoutTools.LayoutBinary import write_layout_binary, open_layout_binary, csv_to_binary, binary_to_csv
+from LayoutTools.SolTrace import iter_stinput, read_stinput, write_stage, write_stinput
+from LayoutTools.Instrument import Instrument, NULL_INSTRUMENT, export_record
+from LayoutTools.Generators import GENERATORS, generate
+from LayoutTools.Biomimetic import HeliostatGrid, heliostatCollisionConstrain, spiralCandidates
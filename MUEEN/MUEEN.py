@@ -1,8 +1,67 @@
 #!/usr/bin/env python3
+import os
+import sys
 import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools import write_layout, NULL_INSTRUMENT
 
-def mueen_fun(lm, wm, z0, fa, dS, lr, Ht, BL, PSImax, Rmax, Rmin) -> list:
+class RingGeometry:
     '''
+    Solver of the no-blocking ring geometry of MUEEN (the quadratics of STEP 7 and STEP 10) for a set of MUEEN cases.
+    The STEP 7 of a new ring solves the same radius as the STEP 10 of the previous ring,
+    so the last solved radius of each case is cached, and the constants are calculated only once.
+
+    z0, z1, rm, BL: height of the heliostat center, receiver bottom height, radius of the heliostat-representing circle, terrain slope of each case
+    '''
+
+    def __init__(self, z0, z1, rm, BL):
+        self.z0 = z0
+        self.z1 = z1
+        self.tanBL = np.tan(BL)
+        self.rm2 = rm*rm
+        self.z12 = z1*z1
+        self.dz2 = 2*(z1-z0)
+        self.cache_R = np.full(np.shape(z0), np.nan)  # the last solved radius of each case
+        self.cache_ym2 = np.full(np.shape(z0), np.nan)
+
+    def solve(self, R, k):
+        '''
+        The radius ym2 of the next no-blocking ring behind the ring of radius R (before the minimum radial distance constrain).
+
+        R: ring radius of the cases k, m
+        k: case index
+        '''
+        ym2 = self.cache_ym2[k]
+        miss = self.cache_R[k] != R
+        if np.any(miss):
+            R = R[miss]
+            km = k[miss]
+            z0 = self.z0[km]
+            z1 = self.z1[km]
+            tanBL = self.tanBL[km]
+            rm2 = self.rm2[km]
+            z12 = self.z12[km]
+
+            zm = z0+R*tanBL
+            a = z12*(rm2-R*R)
+            b = 2*R*z1*(z1-zm)
+            c = rm2-(zm-z1)*(zm-z1)
+            yr = (-b + np.sqrt(b*b-4.*a*c))/(2.*a)
+            A = -((2*z1*yr+tanBL)*tanBL + z12*yr*yr)
+            B = self.dz2[km]*(z1*yr+tanBL)
+            C = rm2*(1+z12*yr*yr)-(z1-z0)*(z1-z0)
+            ym2[miss] = (-B-np.sqrt(B*B-4*A*C))/(2*A)
+
+            self.cache_R[km] = R
+            self.cache_ym2[km] = ym2[miss]
+        return ym2
+
+
+def mueen_rings(lm, wm, z0, fa, dS, lr, Ht, BL, PSImax, Rmax, Rmin, instrument=None):
+    '''
+    Calculate the rings and groups of MUEEN (STEP 1 to STEP 13).
+    All the arguments can be arrays, they are broadcast together and each element is a MUEEN case, all the cases advance in lock-step.
+
     lm: heliostat length, m
     wm: heliostat width, m
     z0: height of the heliostat center from the base, m
@@ -15,7 +74,22 @@ def mueen_fun(lm, wm, z0, fa, dS, lr, Ht, BL, PSImax, Rmax, Rmin) -> list:
     PSImax: maximum angular direction, radians (in 1 and 2 quadrant, total angle is 2.0*PSImax), radian
     Rmax: maximum ring radius in the field, m
     Rmin: minimum ring radius in the field, m
+    instrument: Instrument recording the stage mueen.rings and the counters mueen.iterations (lock-step iterations),
+                mueen.groups and mueen.rings (summed over the cases), None for no instrumentation
+
+    return: (the leading dimensions are the broadcast shape of the arguments)
+      DM: characteristic diameter, m
+      R: R[..., i, j] radius of ring i in group j, m
+      G: G[..., j] angular direction unit for group j, radians
+      NRG: NRG[..., j] number of ring in group j
+      NG: number of heliostat groups
     '''
+    args = np.broadcast_arrays(*[np.asarray(arg, dtype=float) for arg in (lm, wm, z0, fa, dS, lr, Ht, BL, PSImax, Rmax, Rmin)])
+    shape = args[0].shape
+    lm, wm, z0, fa, dS, lr, Ht, BL, PSImax, Rmax, Rmin = [arg.flatten() for arg in args]
+    num = len(lm)  # number of cases
+    k = np.arange(num)
+    instrument = NULL_INSTRUMENT if instrument is None else instrument
 
     # STEP 1
     f = wm/lm
@@ -24,169 +98,194 @@ def mueen_fun(lm, wm, z0, fa, dS, lr, Ht, BL, PSImax, Rmax, Rmin) -> list:
     rm = lm*0.5  # radius of a heliostat-representing circle in front view, m
 
     # STEP 2
-    DM_A = []
-    DM_A.append(lm*(np.sqrt(1+f*f)+dS))
-    DM_A.append(2*wm)
-    DM = np.max(DM_A)  # characteristic diameter, m
+    DM = np.maximum(lm*(np.sqrt(1+f*f)+dS), 2*wm)  # characteristic diameter, m
     Drmin = DM*np.cos(np.pi/6.)*np.cos(BL)  # minimum radial distance between two adjacent rings, m
+    DM2 = np.power((DM*np.cos(BL)), 2.0)
+    geometry = RingGeometry(z0, z1, rm, BL)
 
     # STEP 3
-    max_group_num = int((Rmax - Rmin)/DM + 1)  # estimate maximum number of group
+    max_group_num = int(np.max((Rmax - Rmin)/DM + 1)) if num > 0 else 1  # estimate maximum number of group
     max_ring_per_group = max_group_num  # estimate maximum number of ring in one group
 
-    # R[i][j]: radius of ring i in group j, m
-    R = np.zeros((max_ring_per_group, max_group_num))
-    i = 0  # ring index in group j
-    j = 0  # group index
-    R[0][0] = Rmin  # radius of the heliostats in the first ring in the first group is Rmin
-
-    G = np.zeros(max_group_num)  # G->Gamma. G[j], angular direction unit for group j, radians
-    NRG = np.zeros(max_group_num)  # NRG[j], number of ring in group j
-    G[0] = 0.5*DM/R[i][j]  # angular direction unit for group j, radians
-
-    # STEP 4
-    while (R[i][j] <= Rmax):  # DO STEPS 5 to 12
-        # calculate the radius of each ring in all possible group
-        # STEP 5
-        # R[0][0] = Rmin, so the first iteration just need calculate R[1][0]
-        i = i+1
-
-        R[i][j] = R[i-1][j]*np.cos(G[j])+np.sqrt(np.power((DM*np.cos(BL)), 2.0) -
-                                                 np.power((R[i-1][j]*np.sin(G[j])), 2.0))
-        # STEP 6
-        while (i > 0 and R[i][j] <= Rmax):  # DO STEPS 7 to 12
-            # calculate the radius of each ring the group j
-            # STEP 7
-            zm = z0+R[i-1][j]*np.tan(BL)
-            a = z1*z1*(rm*rm-R[i-1][j]*R[i-1][j])
-            b = 2*R[i-1][j]*z1*(z1-zm)
-            c = rm*rm-(zm-z1)*(zm-z1)
-            yr = (-b + np.sqrt(b*b-4.*a*c))/(2.*a)
-            A = -((2*z1*yr+np.tan(BL))*np.tan(BL) + z1*z1*yr*yr)
-            B = 2*(z1-z0)*(z1*yr+np.tan(BL))
-            C = rm*rm*(1+z1*z1*yr*yr)-(z1-z0)*(z1-z0)
-
-            ym2_A = []
-            ym2_A.append((-B-np.sqrt(B*B-4*A*C))/(2*A))
-            ym2_A.append(R[i][j]+Drmin)
-            ym2 = np.max(ym2_A)
-
-            # STEP 8
-
-            Nm = 0  # number of heliostat in the ring
-            if (i % 2 == 0):  # essential ring
-                Nm = 2*(int(PSImax*0.5/G[j]))+1
-            else:  # staggered ring
-                Nm = 2*(int((PSImax-G[j])*0.5/G[j]))+2
-            # STEP 9
-            # land area of the part of the field under consideration, m2
-            Af = PSImax*int(np.power((ym2+DM*0.5), 2.0) - np.power((R[i][j] + 0.5*DM), 2.0))
-
-            # measure of mirror density, ratio of net reflecting surface area to covered land area
-            delta = ((1.0*Nm)*Am)/Af
-
-            # STEP 10
-            zm = z0+R[i][j]*np.tan(BL)
-            a = z1*z1*(rm*rm-R[i][j]*R[i][j])
-            b = 2*R[i][j]*z1*(z1-zm)
-            c = rm*rm-(zm-z1)*(zm-z1)
-            yr = (-b + np.sqrt(b*b-4.*a*c))/(2.*a)
+    # R[k][i][j]: radius of ring i in group j of case k, m
+    R = np.zeros((num, max_ring_per_group, max_group_num))
+    i = np.zeros(num, dtype=int)  # ring index in group j
+    j = np.zeros(num, dtype=int)  # group index
+    R[:, 0, 0] = Rmin  # radius of the heliostats in the first ring in the first group is Rmin
 
-            A = -((2*z1*yr+np.tan(BL))*np.tan(BL) + z1*z1*yr*yr)
-            B = 2*(z1-z0)*(z1*yr+np.tan(BL))
-            C = rm*rm*(1+z1*z1*yr*yr)-(z1-z0)*(z1-z0)
-            ym2_A = []
-            ym2_A.append((-B-np.sqrt(B*B-4*A*C))/(2*A))
-            ym2_A.append(R[i][j]+Drmin)
-            ym2_t = np.max(ym2_A)
-
-            # STEP 11
-            G[j+1] = DM*0.5/ym2_t  # next group j+1
-            Nm_t = 2*(int(PSImax*0.5/G[j+1]))+1
-            Af_t = PSImax*(np.power((ym2_t+0.5*DM), 2.) - np.power((R[i][j]+0.5*DM), 2.))
-            delta_t = ((1.0*Nm_t)*Am)/Af_t
-
-            # STEP 12
-            if (delta >= delta_t):
+    G = np.zeros((num, max_group_num+1))  # G->Gamma. G[j], angular direction unit for group j, radians
+    NRG = np.zeros((num, max_group_num+1))  # NRG[j], number of ring in group j
+    G[:, 0] = 0.5*DM/Rmin  # angular direction unit for group j, radians
+
+    # state of each case, OUTER: STEP 4, INNER: STEP 6, DONE: STEP 13
+    OUTER, INNER, DONE = 0, 1, 2
+    state = np.full(num, OUTER)
+
+    iterations = 0  # lock-step iterations of the cases
+    with instrument.stage('mueen.rings'):
+        while np.any(state != DONE):
+            iterations += 1
+            Rc = R[k, i, j]
+            outer = state == OUTER
+            inner = state == INNER
+
+            # STEP 4
+            state[outer & ~(Rc <= Rmax)] = DONE
+            n = k[outer & (Rc <= Rmax)]  # DO STEPS 5 to 12
+            if len(n) > 0:
+                # calculate the radius of each ring in all possible group
+                # STEP 5
+                # R[0][0] = Rmin, so the first iteration just need calculate R[1][0]
+                i[n] = i[n]+1
+                Rp = R[n, i[n]-1, j[n]]
+                R[n, i[n], j[n]] = Rp*np.cos(G[n, j[n]])+np.sqrt(DM2[n] - np.power((Rp*np.sin(G[n, j[n]])), 2.0))
+                state[n] = INNER
+
+            # STEP 6
+            leave = inner & ~((i > 0) & (Rc <= Rmax))
+            state[leave & (Rc >= Rmax)] = DONE
+            n = k[leave & ~(Rc >= Rmax)]
+            if len(n) > 0:
+                # elimination of calculation error
+                Rl = R[n, NRG[n, j[n]-1].astype(int)-1, j[n]-1]
+                small = Rl-Rc[n] < DM[n]
+                R[n[small], i[n[small]], j[n[small]]] = Rl[small] + DM[n[small]]
+                state[n] = OUTER
+
+            n = k[inner & (i > 0) & (Rc <= Rmax)]  # DO STEPS 7 to 12
+            if len(n) > 0:
+                # calculate the radius of each ring the group j
+                Rp = R[n, i[n]-1, j[n]]
+                Rn = Rc[n]
+                Gj = G[n, j[n]]
+
+                # STEP 7
+                ym2 = np.maximum(geometry.solve(Rp, n), Rn+Drmin[n])
+
+                # STEP 8
+                # number of heliostat in the ring
+                Nm = np.where(i[n] % 2 == 0,
+                              2*np.trunc(PSImax[n]*0.5/Gj)+1,  # essential ring
+                              2*np.trunc((PSImax[n]-Gj)*0.5/Gj)+2)  # staggered ring
+                # STEP 9
+                # land area of the part of the field under consideration, m2
+                Af = PSImax[n]*np.trunc(np.power((ym2+DM[n]*0.5), 2.0) - np.power((Rn + 0.5*DM[n]), 2.0))
+
+                # measure of mirror density, ratio of net reflecting surface area to covered land area
+                delta = ((1.0*Nm)*Am[n])/Af
+
+                # STEP 10
+                ym2_t = np.maximum(geometry.solve(Rn, n), Rn+Drmin[n])
+
+                # STEP 11
+                G[n, j[n]+1] = DM[n]*0.5/ym2_t  # next group j+1
+                Nm_t = 2*np.trunc(PSImax[n]*0.5/G[n, j[n]+1])+1
+                Af_t = PSImax[n]*(np.power((ym2_t+0.5*DM[n]), 2.) - np.power((Rn+0.5*DM[n]), 2.))
+                delta_t = ((1.0*Nm_t)*Am[n])/Af_t
+
+                # STEP 12
+                ring = delta >= delta_t
                 # if this group can add a new ring
-                i = i+1
-                R[i][j] = ym2
-            else:
+                m = n[ring]
+                i[m] = i[m]+1
+                R[m, i[m], j[m]] = ym2[ring]
                 # if this group can not add a new ring, then add a new group
-                NRG[j] = i+1
-                j = j+1
-                i = 0
-                R[i][j] = ym2_t
-
-        if (R[i][j] >= Rmax):
-            break
-        # elimination of calculation error
-        if (R[int(NRG[j-1]-1)][j-1]-R[i][j] < DM):
-            R[i][j] = R[int(NRG[j-1]-1)][j-1] + DM
+                m = n[~ring]
+                NRG[m, j[m]] = i[m]+1
+                j[m] = j[m]+1
+                i[m] = 0
+                R[m, 0, j[m]] = ym2_t[~ring]
 
     # STEP 13
-    if (i > 0):
-        # if i>0, the group j has been created
-        NG = j+1  # Number of heliostat groups
-        NRG[j] = i+1  # Number of ring in a group j
-    else:
-        # if i=0, the group j has not been created
-        NG = j
-    m = 1
-    PSI = []  # angular direction of heliostat[m]
-    x = []  # position.x of heliostat[m]
-    y = []  # position.y of heliostat[m]
-    z = []  # position.z of heliostat[m]
-    eff = []  # group index of heliostat[m]
-
-    output_file = open("layout.csv", "w")
-    output_file.write("id,x,y,z\n")
+    # if i>0, the group j has been created
+    NRG[k[i > 0], j[i > 0]] = i[i > 0]+1  # Number of ring in a group j
+    NG = np.where(i > 0, j+1, j)  # Number of heliostat groups
+    instrument.count('mueen.iterations', iterations)
+    instrument.count('mueen.groups', int(np.sum(NG)))
+    instrument.count('mueen.rings', int(np.sum(NRG)))
+
+    return (DM.reshape(shape), R.reshape(shape+R.shape[1:]), G.reshape(shape+G.shape[1:]),
+            NRG.reshape(shape+NRG.shape[1:]), NG.reshape(shape))
+
+
+def mueen_layout(DM, R, G, NRG, NG, z0, BL, PSImax, instrument=None):
+    '''
+    Calculate the position of all heliostats of a MUEEN case (STEP 14).
+
+    DM, R, G, NRG, NG: rings and groups of the case, see mueen_rings
+    z0: height of the heliostat center from the base, m
+    BL: terrain slope rising away from the tower, radian
+    PSImax: maximum angular direction, radians (in 1 and 2 quadrant, total angle is 2.0*PSImax), radian
+    instrument: Instrument recording the stage mueen.layout and the counter mueen.heliostats, None for no instrumentation
+
+    return: heliostat layout, n x 4 array of x, y, z and group index
+    '''
+    instrument = NULL_INSTRUMENT if instrument is None else instrument
     # STEP 14
     # output the information of all heliostat
-    for j in range(0, NG):
-        # for group j
-        nmax = int(PSImax/G[j])  # rough calculation of the number of heliostat in this group
-
-        # correction the number of heliostat in this group
-        while ((1.0*nmax)*G[j]+np.arctan(DM*0.5/R[int(NRG[j]-1)][j])) > np.pi:
-            nmax = nmax-1
-
-        for i in range(0, int(NRG[j])):
-            # for ring i in group j
-            if (i % 2 == 0):  # essential ring
-                for n in range(0, nmax+1, 2):
-                    PSI.append(1.0*(n)*G[j])
-                    x.append(R[i][j]*np.sin(PSI[-1]))
-                    y.append(R[i][j]*np.cos(PSI[-1]))
-                    z.append(z0+R[i][j]*np.tan(BL))
-                    eff.append(j)
-                    output_file.write(str(m)+","+str(x[-1])+","+str(y[-1])+","+str(z[-1])+"\n")
-                    m = m + 1
-                    if (n > 0):
-                        x.append(-x[-1])
-                        y.append(y[-1])
-                        z.append(z[-1])
-                        eff.append(j)
-                        output_file.write(str(m)+","+str(x[-1])+","+str(y[-1])+","+str(z[-1])+"\n")
-                        m = m + 1
-            else:  # staggered ring
-                for n in range(1, nmax+1, 2):
-                    PSI.append(1.0*(n)*G[j])
-                    x.append(R[i][j]*np.sin(PSI[-1]))
-                    y.append(R[i][j]*np.cos(PSI[-1]))
-                    z.append(z0+R[i][j]*np.tan(BL))
-                    eff.append(j)
-                    output_file.write(str(m)+","+str(x[-1])+","+str(y[-1])+","+str(z[-1])+"\n")
-                    m = m+1
-                    x.append(-x[-1])
-                    y.append(y[-1])
-                    z.append(z[-1])
-                    eff.append(j)
-                    output_file.write(str(m)+","+str(x[-1])+","+str(y[-1])+","+str(z[-1])+"\n")
-                    m = m+1
-    print("heliostat number:", m-1)
+    with instrument.stage('mueen.layout'):
+        layout = []  # x, y, z and group index of the heliostats, ring by ring
+        for j in range(0, NG):
+            # for group j
+            nmax = int(PSImax/G[j])  # rough calculation of the number of heliostat in this group
+
+            # correction the number of heliostat in this group
+            while ((1.0*nmax)*G[j]+np.arctan(DM*0.5/R[int(NRG[j]-1)][j])) > np.pi:
+                nmax = nmax-1
+
+            for i in range(0, int(NRG[j])):
+                # for ring i in group j
+                if (i % 2 == 0):  # essential ring
+                    n = np.arange(0, nmax+1, 2)
+                else:  # staggered ring
+                    n = np.arange(1, nmax+1, 2)
+                PSI = 1.0*n*G[j]  # angular direction of the heliostats in the ring
+
+                # each heliostat is followed by its mirror heliostat (-x)
+                ring = np.zeros((len(n), 2, 4))
+                ring[:, 0, 0] = R[i][j]*np.sin(PSI)
+                ring[:, 1, 0] = -ring[:, 0, 0]
+                ring[:, :, 1] = (R[i][j]*np.cos(PSI))[:, None]
+                ring[:, :, 2] = z0+R[i][j]*np.tan(BL)
+                ring[:, :, 3] = j
+                ring = ring.reshape(-1, 4)
+                if (i % 2 == 0 and len(n) > 0):
+                    # the heliostat at PSI=0 has no mirror heliostat
+                    ring = np.delete(ring, 1, axis=0)
+                layout.append(ring)
+
+        layout = np.concatenate(layout) if len(layout) > 0 else np.zeros((0, 4))
+    instrument.count('mueen.heliostats', len(layout))
+    return layout
+
+
+def mueen_fun(lm, wm, z0, fa, dS, lr, Ht, BL, PSImax, Rmax, Rmin, instrument=None, casefolder='.') -> np.ndarray:
+    '''
+    lm: heliostat length, m
+    wm: heliostat width, m
+    z0: height of the heliostat center from the base, m
+    fa: ratio of the reflecting surface to the total surface of a heliostat
+    dS: ratio of heliostat separation distance to heliostat length
+    lr: receiver height, m
+    Ht: aim point height, m
+    Dt: tower diameter, m
+    BL: terrain slope rising away from the tower, radian
+    PSImax: maximum angular direction, radians (in 1 and 2 quadrant, total angle is 2.0*PSImax), radian
+    Rmax: maximum ring radius in the field, m
+    Rmin: minimum ring radius in the field, m
+    instrument: Instrument recording the stages and counters of the generation, see mueen_rings and mueen_layout
+    casefolder: folder of the layout.csv file
+
+    return: heliostat layout, n x 4 array of x, y, z and group index
+    '''
+    DM, R, G, NRG, NG = mueen_rings(lm, wm, z0, fa, dS, lr, Ht, BL, PSImax, Rmax, Rmin, instrument)
+    layout = mueen_layout(DM, R, G, NRG, int(NG), z0, BL, PSImax, instrument)
+    print("heliostat number:", len(layout))
     print("group number:", NG)
-    output_file.close()
+
+    write_layout(os.path.join(casefolder, "layout.csv"), layout[:, 0], layout[:, 1], layout[:, 2])
+
+    return layout
 
 
 if __name__ == "__main__":
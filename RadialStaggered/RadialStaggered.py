@@ -1,6 +1,40 @@
 #!/usr/bin/env python3
+import os
+import sys
 import numpy as np
-def radial_staggered_fun(start_ang, end_ang, az_space, rmin, rmax, r_space) -> list:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LayoutTools import write_layout, NULL_INSTRUMENT
+def radial_staggered_field(start_ang, end_ang, az_space, rmin, rmax, r_space, instrument=None):
+    """
+    Place the heliostats of a radial staggered field, without any file or output.
+
+    start_ang, end_ang, az_space, rmin, rmax, r_space: see radial_staggered_fun
+    instrument: Instrument recording the stage radial_staggered.place and the counters radial_staggered.rings and
+                radial_staggered.heliostats, None for no instrumentation
+
+    return: xs, ys, the heliostat positions, numpy arrays
+    """
+    instrument = NULL_INSTRUMENT if instrument is None else instrument
+    with instrument.stage('radial_staggered.place'):
+        rs = np.r_[rmin:rmax:r_space]
+        angs = np.r_[start_ang:end_ang:az_space/2.0]
+
+        # 1st stagger:
+        xs1 = np.outer(rs[::2], np.cos(angs[::2])).flatten()
+        ys1 = np.outer(rs[::2], np.sin(angs[::2])).flatten()
+
+        # 2nd staggeer:
+        xs2 = np.outer(rs[1::2], np.cos(angs[1::2])).flatten()
+        ys2 = np.outer(rs[1::2], np.sin(angs[1::2])).flatten()
+
+        xs = np.r_[xs1, xs2]
+        ys = np.r_[ys1, ys2]
+    instrument.count('radial_staggered.rings', len(rs))
+    instrument.count('radial_staggered.heliostats', len(xs))
+    return xs, ys
+
+
+def radial_staggered_fun(start_ang, end_ang, az_space, rmin, rmax, r_space, instrument=None, casefolder='.') -> list:
     """
     start_ang: the start angle clockwise from the X axis that define the field's boundaries, rad
     end_ang: the end angle clockwise from the X axis that define the field's boundaries, rad
@@ -8,32 +42,16 @@ def radial_staggered_fun(start_ang, end_ang, az_space, rmin, rmax, r_space) -> l
     rmin: the minimum boundaries of the field in the radial direction, m
     rmax: the maximum boundaries of the field in the radial direction, m
     r_space: the space between radial lines of heliostats, m
+    instrument: Instrument recording the stages and counters of the generation, see radial_staggered_field
+    casefolder: folder of the layout.csv file
     """
-
-    rs = np.r_[rmin:rmax:r_space]
-    angs = np.r_[start_ang:end_ang:az_space/2.0]
-
-    # 1st stagger:
-    xs1 = np.outer(rs[::2], np.cos(angs[::2])).flatten()
-    ys1 = np.outer(rs[::2], np.sin(angs[::2])).flatten()
-
-    # 2nd staggeer:
-    xs2 = np.outer(rs[1::2], np.cos(angs[1::2])).flatten()
-    ys2 = np.outer(rs[1::2], np.sin(angs[1::2])).flatten()
-
-    xs = np.r_[xs1, xs2]
-    ys = np.r_[ys1, ys2]
+    xs, ys = radial_staggered_field(start_ang, end_ang, az_space, rmin, rmax, r_space, instrument)
     zs = np.ones(np.shape(xs))*0.0
 
     pos = np.vstack((xs, ys, zs)).T
 
-    output_file = open("layout.csv", "w")
-    output_file.write("id,x,y,z\n")
     print("heliostat number:", len(xs))
-    for i in range(len(xs)):
-        output_file.write(str(i)+","+str(xs[i])+","+str(ys[i])+","+"0\n")
-
-    output_file.close()
+    write_layout(os.path.join(casefolder, "layout.csv"), xs, ys, 0, start=0)
 
 
 if __name__ == "__main__":